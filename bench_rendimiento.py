@@ -0,0 +1,621 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks del descargador (sin red real ni navegador).
+
+Uso:
+  python bench_rendimiento.py paginacion [--latencia 0.08]
+  python bench_rendimiento.py popup [--repeticiones 200] [--viewstate-mb 1]
+  python bench_rendimiento.py zip [--carpeta Descargas/1234-56-LE24] [--mb 200] [--workers 1,2,4,8]
+  python bench_rendimiento.py cuadro [--html capturas/cuerpo_debug.html] [--latencia-ms 5] [--filas 40]
+  python bench_rendimiento.py verificar-zip
+
+verificar-zip no mide tiempos: comprueba que actualizar_zip (que escribe entradas usando
+internals de zipfile) sigue generando ZIPs válidos con esta versión de Python; sale con
+código 1 si algún caso falla.
+"""
+import argparse
+import contextlib
+import copy
+import glob
+import html as html_lib
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from selenium.webdriver.common.by import By
+
+import descarga_ca
+import empaquetado_zip
+import motor_descargas
+import scrape_cuadro
+
+
+class _RespuestaFalsa:
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+        self.text = ""
+        self.headers = {}
+
+    def json(self):
+        return self._data
+
+
+class _ClienteSolicitudFalso:
+    """
+    Simula /solicitud/{codigo} paginado con latencia fija por request.
+    Con informa_total=False la respuesta no trae totalElements/totalPages.
+    """
+
+    def __init__(self, total_ofertas, latencia, informa_total=True):
+        self.total_ofertas = total_ofertas
+        self.latencia = latencia
+        self.informa_total = informa_total
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=40, **kwargs):
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latencia)
+        query = dict(p.split("=", 1) for p in url.split("?", 1)[1].split("&"))
+        size = int(query.get("size", 20))
+        page = int(query.get("page", 0))
+        inicio = page * size
+        ofertas = [
+            {"id": str(i), "razonSocial": f"Proveedor {i}", "rut": "76.434.072-8"}
+            for i in range(inicio, min(inicio + size, self.total_ofertas))
+        ]
+        payload = {"nombre": "Compra de prueba", "ofertas": ofertas}
+        if self.informa_total:
+            payload["totalElements"] = self.total_ofertas
+        return _RespuestaFalsa({"payload": payload})
+
+
+def bench_paginacion(args):
+    print(f"Latencia simulada por request: {args.latencia * 1000:.0f} ms")
+    print(f"{'ofertas':>8} {'modo':<20} {'requests':>8} {'candidatos':>10} {'tiempo':>9}")
+    for total in (20, 100, 500):
+        for modo in ("primera_pagina", "total_conocido", "total_desconocido"):
+            cliente = _ClienteSolicitudFalso(total, args.latencia, informa_total=(modo != "total_desconocido"))
+            t0 = time.perf_counter()
+            if modo == "primera_pagina":
+                info = descarga_ca._obtener_pagina_info_compra("BENCH", cliente, 0)
+            else:
+                info = descarga_ca._obtener_info_compra("BENCH", cliente)
+            candidatos = descarga_ca.extract_candidate_ids(info)
+            dt = time.perf_counter() - t0
+            print(f"{total:>8} {modo:<20} {cliente.requests:>8} {len(candidatos):>10} {dt:>8.3f}s")
+
+
+def _parse_popup_multipasada(html):
+    """Parser anterior (una búsqueda por campo + regex DOTALL para metadata), como referencia."""
+    state = {}
+    for field in ("__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION"):
+        m = re.search(rf'name="{re.escape(field)}"[^>]*value="([^"]*)"', html)
+        if m and m.group(1):
+            state[field] = m.group(1)
+    meta = {}
+    for ctl, fname, ftype in re.findall(
+        r'id="DWNL_grdId_(ctl\d+)_File">([^<]+)</span>.*?id="DWNL_grdId_\1_Type">([^<]+)</span>',
+        html,
+        flags=re.DOTALL,
+    ):
+        meta[ctl] = (fname.strip(), ftype.strip())
+    search_names = re.findall(r'name="(DWNL\$grdId\$ctl\d+\$search)"', html)
+    pages = re.findall(r"__doPostBack\('DWNL\$grdId','Page\$(\d+)'", html)
+    return {"state": state, "meta": meta, "search_names": search_names, "pages": pages}
+
+
+def _paginas_guardadas():
+    base = os.path.dirname(os.path.abspath(__file__))
+    rutas = sorted(glob.glob(os.path.join(base, "test_flujo_lici", "adjuntos", "*.bin")))
+    rutas += sorted(glob.glob(os.path.join(base, "capturas", "*.html")))
+    rutas += sorted(glob.glob(os.path.join(base, "test_flujo_lici", "capturas", "*.html")))
+    return rutas
+
+
+def _inflar_viewstate(html, megas):
+    """Rellena el __VIEWSTATE hasta ~megas MB, como en licitaciones con muchas filas."""
+    relleno = "A" * int(megas * 1024 * 1024)
+    return re.sub(r'(name="__VIEWSTATE"[^>]*value=")', lambda m: m.group(1) + relleno, html, count=1)
+
+
+def _medir(fn, html, repeticiones):
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        fn(html)
+    return (time.perf_counter() - t0) / repeticiones * 1000
+
+
+def bench_popup(args):
+    rutas = _paginas_guardadas()
+    if not rutas:
+        print("No hay páginas guardadas en capturas/ ni test_flujo_lici/.")
+        return
+    print(f"{'pagina':<45} {'KB':>7} {'multipasada':>12} {'una pasada':>11} {'pags':>9}")
+    for ruta in rutas:
+        with open(ruta, encoding="utf-8", errors="ignore") as f:
+            html = f.read()
+        variantes = [(os.path.relpath(ruta), html)]
+        if args.viewstate_mb and "__VIEWSTATE" in html:
+            variantes.append((f"{os.path.relpath(ruta)} +{args.viewstate_mb:g}MB", _inflar_viewstate(html, args.viewstate_mb)))
+        for nombre, contenido in variantes:
+            rep = args.repeticiones if len(contenido) < 1024 * 1024 else max(1, args.repeticiones // 20)
+            t_viejo = _medir(_parse_popup_multipasada, contenido, rep)
+            t_nuevo = _medir(motor_descargas.parsear_popup_viewbid, contenido, rep)
+            paginas = f"{len(_parse_popup_multipasada(contenido)['pages'])}/{len(motor_descargas.parsear_popup_viewbid(contenido)['pages'])}"
+            print(f"{nombre[-45:]:<45} {len(contenido) / 1024:>7.0f} {t_viejo:>10.3f}ms {t_nuevo:>9.3f}ms {paginas:>9}")
+    print("pags = links de paginador detectados (multipasada/una pasada)")
+
+
+def _zip_un_hilo(ruta_carpeta, ruta_zip):
+    """ZIP anterior: todo con ZIP_DEFLATED en un hilo, como referencia."""
+    with zipfile.ZipFile(ruta_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+        for ruta, nombre_zip in empaquetado_zip.listar_archivos(ruta_carpeta):
+            zf.write(ruta, nombre_zip)
+
+
+def _sintetizar_licitacion(carpeta, megas):
+    """
+    Arma una carpeta con la mezcla típica de una licitación descargada: PDFs y escaneos
+    (incompresibles), planillas/Word (zip por dentro), algún .rar anidado y texto/XML/CSV.
+    """
+    mezcla = (
+        ("pdf", 0.45, False), ("jpg", 0.15, False), ("docx", 0.10, False), ("rar", 0.10, False),
+        ("xml", 0.10, True), ("csv", 0.05, True), ("txt", 0.05, True),
+    )
+    total = int(megas * 1024 * 1024)
+    linea = "Item;Descripcion;Cantidad;Precio unitario;Total;Observaciones del oferente\n".encode()
+    for p in range(1, 13):
+        os.makedirs(os.path.join(carpeta, f"Proveedor {p}", "CERTIFICADOS"), exist_ok=True)
+    n = 0
+    for ext, fraccion, texto in mezcla:
+        restante = int(total * fraccion)
+        while restante > 0:
+            tamano = min(restante, 256 * 1024 * (1 + n % 12))
+            n += 1
+            ruta = os.path.join(carpeta, f"Proveedor {n % 12 + 1}", f"documento_{n}.{ext}")
+            with open(ruta, "wb") as f:
+                if texto:
+                    f.write((linea * (tamano // len(linea) + 1))[:tamano])
+                else:
+                    f.write(os.urandom(tamano))
+            restante -= tamano
+
+
+def bench_zip(args):
+    temporal = tempfile.mkdtemp(prefix="bench_zip_")
+    try:
+        carpeta = args.carpeta
+        if not carpeta:
+            carpeta = os.path.join(temporal, "licitacion")
+            _sintetizar_licitacion(carpeta, args.mb)
+        archivos = empaquetado_zip.listar_archivos(carpeta)
+        megas = sum(os.path.getsize(r) for r, _ in archivos) / (1024 * 1024)
+        print(f"Carpeta: {carpeta} ({len(archivos)} archivos, {megas:.1f} MB)")
+        print(f"{'modo':<28} {'tiempo':>8} {'MB/s':>8} {'ZIP MB':>8}")
+
+        ruta_zip = os.path.join(temporal, "referencia.zip")
+        t0 = time.perf_counter()
+        _zip_un_hilo(carpeta, ruta_zip)
+        dt = time.perf_counter() - t0
+        print(f"{'deflate todo, 1 hilo':<28} {dt:>7.2f}s {megas / dt:>8.1f} {os.path.getsize(ruta_zip) / (1024 * 1024):>8.1f}")
+
+        for workers in (int(w) for w in args.workers.split(",") if w.strip()):
+            ruta_zip = os.path.join(temporal, f"politica_{workers}.zip")
+            est = empaquetado_zip.crear_zip(carpeta, ruta_zip, max_workers=workers)
+            with zipfile.ZipFile(ruta_zip) as zf:
+                corrupto = zf.testzip()
+            estado = "" if corrupto is None else f"  CRC inválido: {corrupto}"
+            modo = f"política, {workers} hilo(s)"
+            print(
+                f"{modo:<28} {est['segundos']:>7.2f}s {est['mb_s']:>8.1f} "
+                f"{est['bytes_zip'] / (1024 * 1024):>8.1f}{estado}"
+            )
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+
+_ETIQUETAS_VACIAS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "wbr"}
+
+
+class _Nodo:
+    def __init__(self, tag, attrs, padre=None):
+        self.tag = tag
+        self.attrs = attrs
+        self.padre = padre
+        self.hijos = []  # _Nodo o str (texto)
+
+    def descendientes(self):
+        for hijo in self.hijos:
+            if isinstance(hijo, _Nodo):
+                yield hijo
+                yield from hijo.descendientes()
+
+    def texto(self):
+        partes = []
+        for hijo in self.hijos:
+            if isinstance(hijo, str):
+                partes.append(hijo)
+            elif hijo.tag not in ("script", "style"):
+                partes.append(hijo.texto())
+        return " ".join(" ".join(partes).split())
+
+    def html(self):
+        attrs = "".join(f' {k}="{html_lib.escape(v, quote=True)}"' for k, v in self.attrs.items())
+        if self.tag in _ETIQUETAS_VACIAS:
+            return f"<{self.tag}{attrs}>"
+        interior = "".join(
+            h.html() if isinstance(h, _Nodo) else (h if self.tag in ("script", "style") else html_lib.escape(h, quote=False))
+            for h in self.hijos
+        )
+        return f"<{self.tag}{attrs}>{interior}</{self.tag}>"
+
+
+class _ArbolHtml(HTMLParser):
+    """DOM mínimo de una página guardada, para servirla desde _DriverFalso."""
+
+    def __init__(self, html):
+        super().__init__(convert_charrefs=True)
+        self.raiz = _Nodo("#documento", {})
+        self._pila = [self.raiz]
+        self.feed(html)
+        self.close()
+
+    def handle_starttag(self, tag, attrs):
+        nodo = _Nodo(tag, {k: v or "" for k, v in attrs}, self._pila[-1])
+        self._pila[-1].hijos.append(nodo)
+        if tag not in _ETIQUETAS_VACIAS:
+            self._pila.append(nodo)
+
+    def handle_endtag(self, tag):
+        for idx in range(len(self._pila) - 1, 0, -1):
+            if self._pila[idx].tag == tag:
+                del self._pila[idx:]
+                return
+
+    def handle_data(self, data):
+        self._pila[-1].hijos.append(data)
+
+
+def _compilar_selector(selector):
+    """Subconjunto de CSS que usaba la lectura anterior: '#id tag.clase[attr$='v'][attr*='v']', con comas."""
+    alternativas = []
+    for parte in selector.split(","):
+        parte = parte.strip()
+        ancestro = None
+        if parte.startswith("#"):
+            ancestro, parte = parte[1:].split(None, 1)
+        tag, clase, resto = re.match(r"(\w*)(?:\.([\w-]+))?(.*)$", parte).groups()
+        alternativas.append((ancestro, tag, clase, re.findall(r"\[(\w+)([$*]?=)'([^']*)'\]", resto)))
+    return alternativas
+
+
+def _coincide(nodo, alternativa):
+    ancestro, tag, clase, attrs = alternativa
+    if tag and nodo.tag != tag:
+        return False
+    if clase and clase not in nodo.attrs.get("class", "").split():
+        return False
+    for nombre, op, valor in attrs:
+        actual = nodo.attrs.get(nombre)
+        if actual is None or not (
+            (op == "=" and actual == valor) or (op == "$=" and actual.endswith(valor)) or (op == "*=" and valor in actual)
+        ):
+            return False
+    if ancestro:
+        padre = nodo.padre
+        while padre is not None and padre.attrs.get("id") != ancestro:
+            padre = padre.padre
+        return padre is not None
+    return True
+
+
+class _ElementoFalso:
+    def __init__(self, driver, nodo):
+        self._driver = driver
+        self._nodo = nodo
+
+    def find_elements(self, by, selector):
+        return self._driver._buscar(self._nodo, selector)
+
+    def get_attribute(self, nombre):
+        self._driver._round_trip()
+        return self._nodo.attrs.get(nombre)
+
+    @property
+    def text(self):
+        self._driver._round_trip()
+        return self._nodo.texto()
+
+
+class _DriverFalso:
+    """WebDriver que sirve un DOM guardado; cada llamada cuesta `latencia` segundos, como un round-trip a chromedriver."""
+
+    def __init__(self, raiz, url, latencia):
+        self._raiz = raiz
+        self._url = url
+        self.latencia = latencia
+        self.llamadas = 0
+
+    def _round_trip(self):
+        self.llamadas += 1
+        time.sleep(self.latencia)
+
+    def _buscar(self, contexto, selector):
+        self._round_trip()
+        alternativas = _compilar_selector(selector)
+        return [_ElementoFalso(self, n) for n in contexto.descendientes() if any(_coincide(n, a) for a in alternativas)]
+
+    def find_elements(self, by, selector):
+        return self._buscar(self._raiz, selector)
+
+    @property
+    def current_url(self):
+        self._round_trip()
+        return self._url
+
+    @property
+    def page_source(self):
+        self._round_trip()
+        return self._raiz.html()
+
+
+def _inflar_cuadro(raiz, filas):
+    """Copia filas de grdSupplies (con sus botones) hasta tener `filas`."""
+    tabla = next(n for n in raiz.descendientes() if n.attrs.get("id") == "grdSupplies")
+    clases = {"cssFwkItemStyle", "cssFwkAlternatingItemStyle"}
+    originales = [
+        n for n in tabla.descendientes()
+        if n.tag == "tr" and clases & set(n.attrs.get("class", "").split())
+        and next(p for p in _ancestros(n) if p.tag == "table") is tabla
+    ]
+    padre = originales[-1].padre
+    for idx in range(len(originales), filas):
+        copia = copy.deepcopy(originales[idx % len(originales)])
+        copia.padre = padre
+        padre.hijos.append(copia)
+
+
+def _ancestros(nodo):
+    while nodo.padre is not None:
+        nodo = nodo.padre
+        yield nodo
+
+
+def _cuadro_por_elemento(driver):
+    """Lectura anterior de grdSupplies (find_elements/.text/get_attribute por fila y celda), como referencia."""
+    rows = driver.find_elements(
+        By.CSS_SELECTOR,
+        "#grdSupplies tr.cssFwkItemStyle, #grdSupplies tr.cssFwkAlternatingItemStyle",
+    )
+    rut_links = driver.find_elements(By.CSS_SELECTOR, "#grdSupplies a[id$='_GvLblRutProvider']")
+    [el.text.strip() for el in rut_links]
+    admin_attach = driver.find_elements(By.CSS_SELECTOR, "input[id$='_GvImgbAdministrativeAttachment']")
+    for btn in admin_attach[:5]:
+        btn.get_attribute("id"), btn.get_attribute("title"), btn.get_attribute("onclick")
+
+    def _texto(elements):
+        for el in elements:
+            return el.text.strip()
+        return ""
+
+    all_attachment_urls = []
+    proveedores_meta = []
+    for row in rows:
+        rut = _texto(row.find_elements(By.CSS_SELECTOR, "a[id$='_GvLblRutProvider']"))
+        prov = _texto(row.find_elements(By.CSS_SELECTOR, "a[id$='_GvLblProvider']"))
+        _texto(row.find_elements(By.CSS_SELECTOR, "span[id$='_GvLblSuppliesName']"))
+        _texto(row.find_elements(By.CSS_SELECTOR, "span[id$='TotalOferta']"))
+        _texto(row.find_elements(By.CSS_SELECTOR, "span[id$='EstadoOferta']"))
+        voucher_url = ""
+        for btn in row.find_elements(
+            By.CSS_SELECTOR,
+            "input[type='image'][id$='_imgView'], input[type='image'][title*='Comprobante'], input[type='image'][onclick*='voucherview.aspx']",
+        ):
+            rel = scrape_cuadro._extract_url_from_openpopup(btn.get_attribute("onclick") or "")
+            if rel and "voucherview.aspx" in rel.lower():
+                voucher_url = rel
+                break
+        if voucher_url and not voucher_url.startswith("http"):
+            voucher_url = urljoin(driver.current_url or scrape_cuadro.BASE, voucher_url)
+        proveedores_meta.append(
+            {
+                "rut": rut,
+                "nombre": prov,
+                "carpeta_rel": scrape_cuadro._normalize_provider_dir(prov, len(proveedores_meta) + 1),
+                "voucher_url": voucher_url,
+            }
+        )
+        for inp in row.find_elements(By.CSS_SELECTOR, "input[type='image'][onclick*='ViewBidAttachment.aspx']"):
+            url = scrape_cuadro._extract_url_from_onclick(inp.get_attribute("onclick") or "")
+            if url:
+                all_attachment_urls.append((url, rut, prov, inp.get_attribute("title") or "Adjunto"))
+    for btn in driver.find_elements(
+        By.CSS_SELECTOR,
+        "input[id*='ImgbAdministrativeAttachment'], input[title*='Anexos Administrativos'], input[src*='adj-administrativos']",
+    ):
+        url = scrape_cuadro._extract_url_from_onclick(btn.get_attribute("onclick") or "")
+        if url:
+            all_attachment_urls.append((url, "", "", btn.get_attribute("title") or ""))
+    return proveedores_meta, all_attachment_urls
+
+
+def _cuadro_una_pasada(driver):
+    """Lectura actual de _count_elements_with_providers: current_url + page_source + parser."""
+    url_actual = driver.current_url
+    cuadro = scrape_cuadro.parsear_cuadro_ofertas(driver.page_source, base_url=url_actual or scrape_cuadro.BASE)
+    return scrape_cuadro._proveedores_y_adjuntos(cuadro)
+
+
+def bench_cuadro(args):
+    with open(args.html, encoding="utf-8", errors="ignore") as f:
+        html = f.read()
+    url = "https://www.mercadopublico.cl/Procurement/Modules/RFB/StepsProcessAward/OpeningFrame.aspx?enc=bench"
+    print(f"{os.path.relpath(args.html)}: {len(html) / 1024:.0f} KB; latencia simulada por llamada: {args.latencia_ms:g} ms")
+    print(f"{'filas':>6} {'modo':<26} {'llamadas':>9} {'medido':>10} {'mismo resultado':>16}")
+    for filas in sorted({0, args.filas}):
+        raiz = _ArbolHtml(html).raiz
+        if filas:
+            _inflar_cuadro(raiz, filas)
+        resultados = {}
+        for modo, leer in (("por elemento (anterior)", _cuadro_por_elemento), ("page_source + parser", _cuadro_una_pasada)):
+            driver = _DriverFalso(raiz, url, args.latencia_ms / 1000)
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                resultados[modo] = leer(driver)
+            segundos = time.perf_counter() - t0
+            filas_leidas = len(resultados[modo][0])
+            igual = "-" if len(resultados) == 1 else ("sí" if resultados[modo] == next(iter(resultados.values())) else "NO")
+            print(f"{filas_leidas:>6} {modo:<26} {driver.llamadas:>9} {segundos * 1000:>8.1f}ms {igual:>16}")
+    print(
+        "medido = tiempo real de cada lectura contra un driver falso que sirve el HTML guardado "
+        "y espera la latencia simulada en cada llamada"
+    )
+
+
+def _escribir(ruta, contenido):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, "wb") as f:
+        f.write(contenido)
+    # mtime posterior al del ZIP para que actualizar_zip lo vea modificado aunque caiga en el mismo segundo
+    futuro = time.time() + 5
+    os.utime(ruta, (futuro, futuro))
+
+
+def _comparar_zip_con_carpeta(ruta_zip, carpeta):
+    """Lista de problemas: testzip, nombres duplicados y contenido distinto del de la carpeta."""
+    problemas = []
+    esperado = {}
+    for raiz, _, archivos in os.walk(carpeta):
+        for nombre in archivos:
+            ruta = os.path.join(raiz, nombre)
+            with open(ruta, "rb") as f:
+                esperado[os.path.relpath(ruta, carpeta).replace(os.sep, "/")] = f.read()
+    with zipfile.ZipFile(ruta_zip) as zf:
+        malo = zf.testzip()
+        if malo:
+            problemas.append(f"testzip: CRC inválido en {malo}")
+        nombres = [info.filename for info in zf.infolist()]
+        if len(nombres) != len(set(nombres)):
+            problemas.append("entradas duplicadas en el directorio central")
+        if set(nombres) != set(esperado):
+            problemas.append(f"nombres distintos: sobran {sorted(set(nombres) - set(esperado))}, "
+                             f"faltan {sorted(set(esperado) - set(nombres))}")
+        for nombre in set(nombres) & set(esperado):
+            if zf.read(nombre) != esperado[nombre]:
+                problemas.append(f"contenido distinto en {nombre}")
+    return problemas
+
+
+def bench_verificar_zip(args):
+    """Ida y vuelta de actualizar_zip: crear, agregar/modificar/eliminar, compactar y falla a mitad."""
+    temporal = tempfile.mkdtemp(prefix="verificar_zip_")
+    carpeta = os.path.join(temporal, "licitacion")
+    ruta_zip = os.path.join(temporal, "licitacion.zip")
+    fallas = 0
+
+    def _caso(nombre, modo_esperado, **kwargs):
+        nonlocal fallas
+        estadisticas = empaquetado_zip.actualizar_zip(carpeta, ruta_zip, **kwargs)
+        problemas = _comparar_zip_con_carpeta(ruta_zip, carpeta)
+        if estadisticas.get("modo") != modo_esperado:
+            problemas.append(f"modo {estadisticas.get('modo')}, se esperaba {modo_esperado}")
+        fallas += bool(problemas)
+        print(f"{nombre:<34} {'OK' if not problemas else 'FALLA: ' + '; '.join(problemas)}")
+
+    try:
+        for i in range(12):
+            # Mezcla de entradas comprimibles y binarias (una se guarda sin comprimir)
+            contenido = (f"linea {i}\n" * 4000).encode() if i % 2 else os.urandom(50_000 + i)
+            _escribir(os.path.join(carpeta, f"Proveedor {i % 3}", f"anexo_{i}.bin"), contenido)
+        _caso("nuevo", "nuevo")
+        _caso("sin cambios", "sin_cambios")
+
+        _escribir(os.path.join(carpeta, "Proveedor 0", "anexo_0.bin"), b"version nueva" * 100)
+        _escribir(os.path.join(carpeta, "Proveedor 3", "nuevo.pdf"), b"%PDF-1.4 " + os.urandom(20_000))
+        os.remove(os.path.join(carpeta, "Proveedor 1", "anexo_1.bin"))
+        _caso("modificado + nuevo + eliminado", "incremental", umbral_compactar=1.0)
+
+        for i in (2, 3, 4, 5, 6):
+            os.remove(os.path.join(carpeta, f"Proveedor {i % 3}", f"anexo_{i}.bin"))
+        _escribir(os.path.join(carpeta, "Proveedor 2", "anexo_8.bin"), b"otra version" * 50)
+        _caso("compactado", "compactado", umbral_compactar=0.0)
+
+        # Falla a mitad de agregar: el ZIP debe quedar válido y sin duplicados, con las versiones
+        # anteriores de lo que no alcanzó a reemplazarse; la siguiente pasada lo deja al día.
+        _escribir(os.path.join(carpeta, "Proveedor 0", "anexo_9.bin"), b"cambio previo a la falla" * 20)
+        _escribir(os.path.join(carpeta, "Proveedor 1", "anexo_10.bin"), b"cambio que no se escribe" * 20)
+        original = empaquetado_zip.agregar_archivos
+
+        def _agregar_con_falla(zf, archivos, **kwargs):
+            original(zf, archivos[:1], **kwargs)
+            raise OSError("falla simulada")
+
+        empaquetado_zip.agregar_archivos = _agregar_con_falla
+        try:
+            empaquetado_zip.actualizar_zip(carpeta, ruta_zip, umbral_compactar=1.0)
+        except OSError:
+            pass
+        finally:
+            empaquetado_zip.agregar_archivos = original
+        with zipfile.ZipFile(ruta_zip) as zf:
+            nombres = [info.filename for info in zf.infolist()]
+            valido = zf.testzip() is None and len(nombres) == len(set(nombres))
+        fallas += not valido
+        print(f"{'falla a mitad (ZIP intermedio)':<34} {'OK' if valido else 'FALLA: ZIP inválido o con duplicados'}")
+        _caso("recuperación tras la falla", "incremental", umbral_compactar=1.0)
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+    print(f"Python {sys.version.split()[0]}: {'todo OK' if not fallas else f'{fallas} caso(s) con falla'}")
+    if fallas:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p_pag = sub.add_parser("paginacion", help="Costo de enumerar candidatos paginados en /solicitud")
+    p_pag.add_argument("--latencia", type=float, default=0.08, help="Segundos de latencia por request")
+    p_pag.set_defaults(func=bench_paginacion)
+
+    p_pop = sub.add_parser("popup", help="Parseo de popups ViewBidAttachment guardados")
+    p_pop.add_argument("--repeticiones", type=int, default=200, help="Iteraciones por página")
+    p_pop.add_argument("--viewstate-mb", type=float, default=1.0, help="MB de relleno de __VIEWSTATE (0 = no)")
+    p_pop.set_defaults(func=bench_popup)
+
+    p_zip = sub.add_parser("zip", help="Throughput de armado de ZIP (MB/s) por política de compresión")
+    p_zip.add_argument("--carpeta", help="Carpeta de licitación real a comprimir (por defecto una sintética)")
+    p_zip.add_argument("--mb", type=float, default=200, help="Tamaño de la carpeta sintética en MB")
+    p_zip.add_argument("--workers", default="1,2,4,8", help="Hilos de compresión a probar, separados por coma")
+    p_zip.set_defaults(func=bench_zip)
+
+    p_cua = sub.add_parser("cuadro", help="Lectura de grdSupplies: WebDriver por elemento vs page_source + parser")
+    p_cua.add_argument(
+        "--html",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "capturas", "cuerpo_debug.html"),
+        help="SupplySummary guardado",
+    )
+    p_cua.add_argument("--latencia-ms", type=float, default=5.0, help="Milisegundos simulados por llamada a chromedriver")
+    p_cua.add_argument("--filas", type=int, default=40, help="Filas de la segunda medición (se copian filas reales)")
+    p_cua.set_defaults(func=bench_cuadro)
+
+    p_ver = sub.add_parser("verificar-zip", help="Ida y vuelta de actualizar_zip contra zipfile de este Python")
+    p_ver.set_defaults(func=bench_verificar_zip)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
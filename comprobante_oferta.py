@@ -0,0 +1,208 @@
+"""
+Comprobante de oferta de Compra Ágil generado desde el JSON de la cotización
+(/solicitud/cotizacion/{id}), sin abrir "Ver detalle" en el navegador interactivo.
+
+El HTML se arma sin depender de un esquema fijo: los campos simples de la cotización van
+en una tabla de datos, las listas de registros (productos/ítems) en tablas propias y los
+documentos adjuntos en un listado. Si hay un pool de impresión headless, el HTML se
+convierte además a ComprobanteOferta.pdf.
+"""
+import html
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+
+NOMBRE_HTML = "ComprobanteOferta.html"
+NOMBRE_PDF = "ComprobanteOferta.pdf"
+CLAVES_ADJUNTOS = ("documentosAdjuntos", "adjuntos", "documentos")
+CLAVES_PROVEEDOR = ("razonSocial", "nombreProveedor", "nombre", "nombreApellido")
+_PALABRAS_MONTO = ("monto", "precio", "total", "valor", "neto", "iva", "subtotal")
+_FECHA_ISO_RE = re.compile(r"^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2})?)?")
+
+_ESTILO = """
+body { font-family: Arial, Helvetica, sans-serif; font-size: 11px; color: #222; margin: 24px; }
+h1 { font-size: 18px; margin: 0 0 4px 0; color: #1f3864; }
+h2 { font-size: 13px; margin: 18px 0 6px 0; color: #1f3864; border-bottom: 1px solid #1f3864; }
+.sub { color: #555; margin-bottom: 12px; }
+table { border-collapse: collapse; width: 100%; margin-bottom: 8px; }
+th, td { border: 1px solid #bbb; padding: 4px 6px; text-align: left; vertical-align: top; }
+th { background: #d9e2f3; }
+td.num { text-align: right; white-space: nowrap; }
+.destacado td { font-size: 12px; }
+.pie { margin-top: 18px; color: #777; font-size: 9px; }
+@page { size: A4; margin: 12mm; }
+"""
+
+
+def _etiqueta(clave):
+    """fechaEnvioOferta -> Fecha envio oferta"""
+    texto = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", str(clave)).replace("_", " ").strip()
+    return texto[:1].upper() + texto[1:].lower()
+
+
+def _es_escalar(valor):
+    return valor is None or isinstance(valor, (str, int, float, bool))
+
+
+def _es_monto(clave):
+    clave = str(clave).lower()
+    return any(p in clave for p in _PALABRAS_MONTO)
+
+
+def _formatear_monto(valor):
+    entero = f"{float(valor):,.0f}".replace(",", ".")
+    return f"$ {entero}"
+
+
+def formatear_valor(clave, valor):
+    """Texto para mostrar un valor del JSON (montos en pesos, fechas dd-mm-aaaa, Sí/No)."""
+    if valor is None or valor == "":
+        return ""
+    if isinstance(valor, bool):
+        return "Sí" if valor else "No"
+    if isinstance(valor, (int, float)) and _es_monto(clave):
+        return _formatear_monto(valor)
+    if isinstance(valor, str) and _FECHA_ISO_RE.match(valor):
+        try:
+            fecha = datetime.fromisoformat(valor.replace("Z", "+00:00")[:19])
+            return fecha.strftime("%d-%m-%Y %H:%M") if "T" in valor or " " in valor else fecha.strftime("%d-%m-%Y")
+        except ValueError:
+            pass
+    if isinstance(valor, list):
+        return ", ".join(str(v) for v in valor if _es_escalar(v))
+    return str(valor)
+
+
+def _celda(clave, valor):
+    clase = ' class="num"' if isinstance(valor, (int, float)) and not isinstance(valor, bool) else ""
+    return f"<td{clase}>{html.escape(formatear_valor(clave, valor))}</td>"
+
+
+def _tabla_datos(campos):
+    filas = "".join(f"<tr><th>{html.escape(_etiqueta(k))}</th>{_celda(k, v)}</tr>" for k, v in campos)
+    return f"<table>{filas}</table>"
+
+
+def _tabla_registros(registros):
+    columnas = []
+    for registro in registros:
+        for clave, valor in registro.items():
+            if clave not in columnas and _es_escalar(valor):
+                columnas.append(clave)
+    if not columnas:
+        return ""
+    encabezado = "".join(f"<th>{html.escape(_etiqueta(c))}</th>" for c in columnas)
+    filas = "".join("<tr>" + "".join(_celda(c, r.get(c)) for c in columnas) + "</tr>" for r in registros)
+    return f"<table><tr>{encabezado}</tr>{filas}</table>"
+
+
+def _primer_valor(payload, claves):
+    for clave in claves:
+        valor = payload.get(clave)
+        if _es_escalar(valor) and valor not in (None, ""):
+            return valor
+    return None
+
+
+def _buscar_clave(payload, *palabras):
+    """Primer campo simple cuya clave contiene todas las palabras (ej: "fecha", "envio")."""
+    for clave, valor in payload.items():
+        clave_lower = clave.lower()
+        if all(p in clave_lower for p in palabras) and _es_escalar(valor) and valor not in (None, ""):
+            return clave, valor
+    return None
+
+
+def _nombres_adjuntos(payload):
+    for clave in CLAVES_ADJUNTOS:
+        documentos = payload.get(clave)
+        if isinstance(documentos, list):
+            return [
+                str(d.get("filename") or d.get("nombre") or d.get("fileName") or d.get("id") or "")
+                for d in documentos
+                if isinstance(d, dict)
+            ]
+    return []
+
+
+def renderizar_comprobante_html(payload, codigo, nombre_proyecto="", proveedor="", rut=""):
+    """Arma el HTML del comprobante de oferta a partir del payload de la cotización."""
+    payload = payload or {}
+    proveedor = proveedor or _primer_valor(payload, CLAVES_PROVEEDOR) or ""
+
+    # Encabezado: proveedor, RUT y (si existen) una fecha, un monto y el estado de la oferta
+    destacados = [("proveedor", proveedor), ("rut", rut)]
+    for opciones in (
+        (("fecha", "envio"), ("fecha",)),
+        (("monto", "total"), ("total",), ("monto",)),
+        (("estado",),),
+    ):
+        for palabras in opciones:
+            encontrado = _buscar_clave(payload, *palabras)
+            if encontrado:
+                destacados.append(encontrado)
+                break
+
+    campos = []
+    secciones = []
+    for clave, valor in payload.items():
+        if clave in CLAVES_ADJUNTOS:
+            continue
+        if _es_escalar(valor):
+            campos.append((clave, valor))
+        elif isinstance(valor, list) and valor and all(isinstance(v, dict) for v in valor):
+            tabla = _tabla_registros(valor)
+            if tabla:
+                secciones.append(f"<h2>{html.escape(_etiqueta(clave))}</h2>{tabla}")
+        elif isinstance(valor, list):
+            campos.append((clave, valor))
+        elif isinstance(valor, dict):
+            simples = [(k, v) for k, v in valor.items() if _es_escalar(v)]
+            if simples:
+                secciones.append(f"<h2>{html.escape(_etiqueta(clave))}</h2>{_tabla_datos(simples)}")
+
+    adjuntos = _nombres_adjuntos(payload)
+    lista_adjuntos = "".join(f"<li>{html.escape(n)}</li>" for n in adjuntos if n) or "<li>Sin adjuntos</li>"
+    titulo = f"Comprobante de oferta - Compra Ágil {codigo}"
+    return (
+        "<!DOCTYPE html><html lang=\"es\"><head><meta charset=\"utf-8\">"
+        f"<title>{html.escape(titulo)}</title><style>{_ESTILO}</style></head><body>"
+        f"<h1>{html.escape(titulo)}</h1>"
+        f"<div class=\"sub\">{html.escape(nombre_proyecto or '')}</div>"
+        f"<table class=\"destacado\">"
+        + "".join(f"<tr><th>{html.escape(_etiqueta(k))}</th>{_celda(k, v)}</tr>" for k, v in destacados if v)
+        + "</table>"
+        f"<h2>Datos de la cotización</h2>{_tabla_datos(campos)}"
+        + "".join(secciones)
+        + f"<h2>Adjuntos de la cotización ({len(adjuntos)})</h2><ul>{lista_adjuntos}</ul>"
+        f"<div class=\"pie\">Generado desde la API de Compra Ágil el "
+        f"{datetime.now().strftime('%d-%m-%Y %H:%M')}</div>"
+        "</body></html>"
+    )
+
+
+def generar_comprobante_oferta(
+    payload, carpeta_proveedor, codigo, nombre_proyecto="", proveedor="", rut="", pool=None
+):
+    """
+    Escribe CERTIFICADOS/ComprobanteOferta.html y, si hay pool de impresión, lo convierte a PDF.
+
+    Returns:
+        dict: {"html": ruta, "pdf": ruta o None si no se generó}
+    """
+    carpeta = os.path.join(carpeta_proveedor, "CERTIFICADOS")
+    os.makedirs(carpeta, exist_ok=True)
+    ruta_html = os.path.join(carpeta, NOMBRE_HTML)
+    contenido = renderizar_comprobante_html(payload, codigo, nombre_proyecto, proveedor, rut)
+    ruta_tmp = f"{ruta_html}.tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    os.replace(ruta_tmp, ruta_html)
+
+    ruta_pdf = None
+    if pool is not None:
+        destino_pdf = os.path.join(carpeta, NOMBRE_PDF)
+        if pool.imprimir(Path(ruta_html).resolve().as_uri(), destino_pdf, tag="[VOUCHER_API]"):
+            ruta_pdf = destino_pdf
+    return {"html": ruta_html, "pdf": ruta_pdf}
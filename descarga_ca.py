@@ -3,11 +3,12 @@
 
 import os
 import time
-import zipfile
-import requests
+import threading
 import base64
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from urllib.parse import unquote
+from urllib.parse import unquote, urlparse
 import unicodedata
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -21,6 +22,12 @@ from selenium.common.exceptions import (
 from selenium.webdriver.common.keys import Keys
 import re
 import json
+import comprobante_oferta
+import empaquetado_zip
+import esperas
+import motor_descargas
+import pool_impresion
+from motor_descargas import archivo_coincide, escribir_stream_temporal
 
 # Constantes para llamadas API (Compra Ágil)
 API_BASE_CA = "https://servicios-compra-agil.mercadopublico.cl/v1/compra-agil"
@@ -29,6 +36,49 @@ CERT_BASE_URL = "https://proveedor.mercadopublico.cl/ficha/certificado"
 DECLARACION_JURADA_BASE_URL = "https://proveedor.mercadopublico.cl/BeneficiariosFinales/lectura"
 DECLARACION_JURADA_LICITACION_BASE_URL = "https://proveedor.mercadopublico.cl/dj-requisitos"
 MANIFEST_ADJUNTOS_FILENAME = "manifest_adjuntos.json"
+# Respuesta de /solicitud/{codigo} (todas las páginas de ofertas) guardada junto al manifest
+SOLICITUD_API_FILENAME = "solicitud_api.json"
+MANIFEST_LICITACION_FILENAME = "manifest_licitacion.json"
+# Caché local de certificados por RUT (CertificadoHabilidad / DeclaracionJurada); 0 horas = sin caché
+CACHE_CERTIFICADOS_DIR = os.path.join("Descargas", ".cache_certificados")
+CACHE_CERTIFICADOS_TTL_HORAS = 12
+
+# Concurrencia de descargas vía API: workers totales y máximo de requests simultáneos por host.
+# Los límites por host se leen al primer uso de cada host.
+MAX_WORKERS_API_CA = 8
+CONCURRENCIA_POR_HOST = {
+    "servicios-compra-agil.mercadopublico.cl": 6,
+}
+CONCURRENCIA_POR_HOST_DEFAULT = 4
+# Paginación de /solicitud/{codigo}: ofertas por página y tope de páginas a recorrer
+TAMANO_PAGINA_OFERTAS = 20
+MAX_PAGINAS_OFERTAS = 200
+SECCIONES_OFERTAS = ("ofertasSeleccionadas", "ofertas", "detalleOfertasProveedor", "ofertasInadmisibles")
+# Generar ComprobanteOferta desde el JSON de la cotización (la captura por UI queda como respaldo)
+COMPROBANTE_OFERTA_DESDE_API = True
+
+_semaforos_host = {}
+_semaforos_host_lock = threading.Lock()
+_nombres_lock = threading.Lock()
+# Locks por franja (hash de la clave), no uno por RUT: la cantidad queda fija durante todo el
+# proceso; dos claves que caen en la misma franja solo se esperan entre sí
+_cache_certificados_locks = [threading.Lock() for _ in range(32)]
+# Pool de Chrome headless para imprimir PDFs (None = se usa el navegador interactivo)
+_pool_impresion = None
+# El navegador interactivo no es thread-safe: una sola impresión de respaldo a la vez
+_driver_interactivo_lock = threading.Lock()
+
+
+def _semaforo_host(url):
+    """Devuelve el semáforo que limita los requests simultáneos al host de la URL."""
+    host = (urlparse(url).hostname or "").lower()
+    with _semaforos_host_lock:
+        semaforo = _semaforos_host.get(host)
+        if semaforo is None:
+            limite = CONCURRENCIA_POR_HOST.get(host, CONCURRENCIA_POR_HOST_DEFAULT)
+            semaforo = threading.BoundedSemaphore(max(1, int(limite)))
+            _semaforos_host[host] = semaforo
+    return semaforo
 
 
 def _normalizar_content_type(content_type):
@@ -47,6 +97,47 @@ def _asegurar_nombre_unico(carpeta_destino, nombre_archivo):
     return candidato
 
 
+def _reservar_nombre_unico(carpeta_destino, nombre_archivo):
+    """
+    Igual que _asegurar_nombre_unico, pero reserva el nombre creando el archivo vacío
+    bajo un lock, para que descargas concurrentes en la misma carpeta no colisionen.
+    """
+    with _nombres_lock:
+        nombre_final = _asegurar_nombre_unico(carpeta_destino, nombre_archivo)
+        with open(os.path.join(carpeta_destino, nombre_final), "xb"):
+            pass
+    return nombre_final
+
+
+def _buscar_copia_existente(carpeta_destino, nombre_archivo, bytes_esperados, sha256_esperado):
+    """
+    Recorre nombre_archivo, "nombre (2).ext", ... mientras existan y retorna el primero con el
+    mismo contenido; así una re-descarga no genera duplicados numerados.
+    """
+    base, ext = os.path.splitext(nombre_archivo)
+    candidato = nombre_archivo
+    contador = 2
+    while os.path.exists(os.path.join(carpeta_destino, candidato)):
+        if archivo_coincide(os.path.join(carpeta_destino, candidato), bytes_esperados, sha256_esperado):
+            return candidato
+        candidato = f"{base} ({contador}){ext}"
+        contador += 1
+    return None
+
+
+def _cargar_manifest(ruta_manifest):
+    """Lee un manifest JSON previo; retorna {} si no existe o no se puede leer."""
+    try:
+        with open(ruta_manifest, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"[MANIFEST] No se pudo leer {ruta_manifest}: {e}")
+        return {}
+
+
 def _limpiar_nombre_archivo_con_extension(nombre, max_len=160):
     """
     Limpia nombres de archivo intentando preservar la extensión y el sufijo del nombre,
@@ -67,12 +158,17 @@ def _limpiar_nombre_archivo_con_extension(nombre, max_len=160):
     return limpiar_nombre_archivo(nombre)[:max_len].rstrip()
 
 
+def _es_temporal_descarga(nombre_archivo):
+    """True para los .part que deja una descarga en curso (o interrumpida)."""
+    return nombre_archivo.startswith(".descarga_") and nombre_archivo.endswith(".part")
+
+
 def _listar_archivos_descargados(carpeta_proveedor):
     try:
         return sorted(
             f
             for f in os.listdir(carpeta_proveedor)
-            if os.path.isfile(os.path.join(carpeta_proveedor, f))
+            if os.path.isfile(os.path.join(carpeta_proveedor, f)) and not _es_temporal_descarga(f)
         )
     except Exception:
         return []
@@ -86,12 +182,13 @@ def _wait_ready(driver, timeout=20):
     """Espera a que document.readyState sea 'complete'."""
     if not driver:
         return
-    try:
-        WebDriverWait(driver, timeout).until(
-            lambda d: d.execute_script("return document.readyState") == "complete"
-        )
-    except Exception:
-        return
+    with esperas.medir("ready_state") as estado:
+        try:
+            WebDriverWait(driver, timeout).until(
+                lambda d: d.execute_script("return document.readyState") == "complete"
+            )
+        except Exception:
+            estado["expirada"] = True
 
 
 def _safe_click(driver, element):
@@ -275,7 +372,7 @@ def descargar_compra_agil(codigo_ca, driver=None, base_dir="Descargas", nombre_p
                 proveedor['ruta_zip'] = ruta_zip
                 proveedor['adjuntos_descargados'] = adjuntos_descargados
             
-            time.sleep(2)  # Pausa entre proveedores
+            esperas.esperar_sin_dialogo(driver, nombre="ui_entre_proveedores")
         
         print(f"Descarga completada para compra ágil {codigo_ca}")
         return True
@@ -285,28 +382,71 @@ def descargar_compra_agil(codigo_ca, driver=None, base_dir="Descargas", nombre_p
         return False
 
 
-def descargar_compra_agil_api(codigo_ca, token_path="token", driver=None, base_dir="Descargas", nombre_proyecto=None):
+def descargar_compra_agil_api(
+    codigo_ca,
+    token_path="token",
+    driver=None,
+    base_dir="Descargas",
+    nombre_proyecto=None,
+    max_workers=None,
+    cliente=None,
+    almacen_blobs=None,
+    zip_en_curso=None,
+):
     """
     Descarga los adjuntos de una compra ágil usando la API oficial con el token Bearer.
 
+    Los listados de documentos por cotización y las descargas de archivos se ejecutan en un
+    pool de hilos acotado (max_workers, por defecto MAX_WORKERS_API_CA); además cada host
+    respeta su límite en CONCURRENCIA_POR_HOST. Los certificados se descargan después: en
+    paralelo si hay pool de impresión headless (configurar_pool_impresion) y, si no, en forma
+    secuencial porque la impresión usa el navegador compartido.
+
+    El ComprobanteOferta de cada postulante se genera desde el JSON de su cotización
+    (comprobante_oferta); la captura por "Ver detalle" en la UI queda para los que falten.
+
+    Es reanudable: los archivos registrados en el manifest_adjuntos.json de una ejecución
+    anterior que siguen en disco con el mismo tamaño y SHA-256 no se vuelven a descargar.
+
     Args:
         codigo_ca (str): Código de la compra ágil
         token_path (str): Ruta al archivo que contiene el token (por defecto 'token')
         driver: Instancia Selenium opcional, usada como respaldo para imprimir certificados
+        max_workers (int): Cantidad máxima de hilos para llamadas a la API
+        cliente (ClienteApiCompraAgil): Cliente API a reutilizar (si no se entrega, se crea
+            uno desde token_path y se cierra al terminar)
+        almacen_blobs (motor_descargas.AlmacenBlobs): Almacén por contenido opcional; los
+            adjuntos descargados quedan como hardlinks a él en vez de copias independientes
+        zip_en_curso (empaquetado_zip.ZipEnCurso): Si se entrega, se abre sobre la carpeta de la
+            compra y cada adjunto descargado se agrega al ZIP apenas termina (ver crear_zip_en_curso)
 
     Returns:
         bool: True si todo fue bien, False en caso contrario
     """
+    cliente_propio = cliente is None
+    if cliente_propio:
+        try:
+            cliente = ClienteApiCompraAgil.desde_archivo_token(token_path)
+        except Exception as e:
+            print(f"[API] Error leyendo token: {e}")
+            return False
+
     try:
-        token = _leer_token(token_path)
-    except Exception as e:
-        print(f"[API] Error leyendo token: {e}")
-        return False
+        return _descargar_compra_agil_api(
+            codigo_ca, cliente, driver, base_dir, nombre_proyecto, max_workers, almacen_blobs, zip_en_curso
+        )
+    finally:
+        if cliente_propio:
+            cliente.close()
+
 
+def _descargar_compra_agil_api(
+    codigo_ca, cliente, driver, base_dir, nombre_proyecto, max_workers, almacen_blobs=None, zip_en_curso=None
+):
     info_data = None
     if not nombre_proyecto:
         try:
-            info_data = _obtener_info_compra(codigo_ca, token)
+            info_data = _obtener_info_compra(codigo_ca, cliente, max_workers=max_workers)
             nombre_proyecto = _extraer_nombre_proyecto_compra_info(info_data)
         except Exception as e:
             print(f"[API] Error obteniendo nombre de compra agil: {e}")
@@ -321,156 +461,195 @@ def descargar_compra_agil_api(codigo_ca, token_path="token", driver=None, base_d
 
     carpeta_base = resolver_carpeta_base(base_dir, "ComprasAgiles", codigo_ca, nombre_proyecto)
     os.makedirs(carpeta_base, exist_ok=True)
+    al_guardar = None
+    if zip_en_curso is not None:
+        zip_en_curso.abrir(carpeta_base, ruta_zip_proceso(carpeta_base))
+        al_guardar = zip_en_curso.agregar
+
+    # Ledger de la ejecución anterior: archivos ya descargados y verificados no se vuelven a pedir
+    previos = _indice_descargas_previas(_cargar_manifest(os.path.join(carpeta_base, MANIFEST_ADJUNTOS_FILENAME)))
 
     exitosos = 0
     errores = 0
+    reutilizados = 0
     manifest = {
         "codigo": codigo_ca,
         "nombre_proyecto": nombre_proyecto or "",
         "carpeta_base": carpeta_base,
         "generado_en": datetime.now().isoformat(timespec="seconds"),
+        "adjuntos_generales": [],
         "proveedores": [],
     }
 
-    # 1) Descargas generales (comprador/listar) - pueden ser bases administrativas o anexos generales
-    try:
-        archivos_generales, _ = _listar_adjuntos_api(codigo_ca, token)
-    except Exception as e:
-        print(f"[API] Error al listar adjuntos generales: {e}")
-        archivos_generales = []
-
-    if archivos_generales:
-        print(f"[API] Adjuntos generales encontrados: {len(archivos_generales)}")
-        carpeta_adjuntos = os.path.join(carpeta_base, "Adjuntos")
-        os.makedirs(carpeta_adjuntos, exist_ok=True)
-        for adjunto in archivos_generales:
-            file_id = adjunto.get("fileId") or adjunto.get("id") or adjunto.get("uuid")
-            if not file_id:
-                continue
-            nombre_archivo = adjunto.get("filename") or adjunto.get("nombre") or f"{file_id}.bin"
+    max_workers = max(1, int(max_workers or MAX_WORKERS_API_CA))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api_ca") as pool:
+        # 1) Descargas generales (comprador/listar) - pueden ser bases administrativas o anexos generales
+        try:
+            archivos_generales, _ = _listar_adjuntos_api(codigo_ca, cliente)
+        except Exception as e:
+            print(f"[API] Error al listar adjuntos generales: {e}")
+            archivos_generales = []
+
+        futuros_generales = []
+        if archivos_generales:
+            print(f"[API] Adjuntos generales encontrados: {len(archivos_generales)}")
+            carpeta_adjuntos = os.path.join(carpeta_base, "Adjuntos")
+            os.makedirs(carpeta_adjuntos, exist_ok=True)
+            for adjunto in archivos_generales:
+                file_id = adjunto.get("fileId") or adjunto.get("id") or adjunto.get("uuid")
+                if not file_id:
+                    continue
+                nombre_archivo = adjunto.get("filename") or adjunto.get("nombre") or f"{file_id}.bin"
+                futuro = pool.submit(
+                    _descargar_o_reutilizar_archivo_api,
+                    file_id,
+                    cliente,
+                    nombre_archivo,
+                    carpeta_adjuntos,
+                    previos["generales"].get(str(file_id)),
+                    almacen_blobs,
+                    al_guardar,
+                )
+                futuros_generales.append((file_id, futuro))
+
+        # 2) Adjuntos por postulante (cotización) usando IDs de candidatos
+        try:
+            if info_data is None:
+                info_data = _obtener_info_compra(codigo_ca, cliente, max_workers=max_workers)
+            candidatos = extract_candidate_ids(info_data)
+        except Exception as e:
+            print(f"[API] Error al obtener información de compra o candidatos: {e}")
+            candidatos = []
+        if info_data:
             try:
-                contenido, nombre_final, content_type = _descargar_archivo_api(file_id, token, nombre_archivo)
-                nombre_final = _limpiar_nombre_archivo_con_extension(nombre_final)
-                if not os.path.splitext(nombre_final)[1]:
-                    extension = obtener_extension_por_content_type(content_type)
-                    if extension:
-                        nombre_final += extension
-                nombre_final = _asegurar_nombre_unico(carpeta_adjuntos, nombre_final)
-                ruta_archivo = os.path.join(carpeta_adjuntos, nombre_final)
-                with open(ruta_archivo, "wb") as f:
-                    f.write(contenido)
-                exitosos += 1
-                print(f"[API] Descargado (general) {nombre_final} -> {ruta_archivo}")
+                _guardar_solicitud_api(carpeta_base, info_data)
             except Exception as e:
-                errores += 1
-                print(f"[API] Error al descargar (general) {file_id}: {e}")
+                print(f"[API] No se pudo guardar {SOLICITUD_API_FILENAME}: {e}")
 
-    # 2) Adjuntos por postulante (cotización) usando IDs de candidatos
-    try:
-        if info_data is None:
-            info_data = _obtener_info_compra(codigo_ca, token)
-        candidatos = extract_candidate_ids(info_data)
-    except Exception as e:
-        print(f"[API] Error al obtener información de compra o candidatos: {e}")
-        candidatos = []
+        if not candidatos:
+            print(f"[API] No se encontraron candidatos/postulantes para la compra ágil {codigo_ca}")
+        else:
+            print(f"[API] Candidatos encontrados: {len(candidatos)}")
 
-    if not candidatos:
-        print(f"[API] No se encontraron candidatos/postulantes para la compra ágil {codigo_ca}")
-    else:
-        print(f"[API] Candidatos encontrados: {len(candidatos)}")
+        # Listado de documentos de todas las cotizaciones en paralelo (se conserva el orden de candidatos)
+        futuros_documentos = [
+            pool.submit(_obtener_documentos_por_cotizacion, candidato.get("id"), cliente) for candidato in candidatos
+        ]
 
-    for candidato in candidatos:
-        candidato_id = candidato.get("id")
-        etiqueta = candidato.get("label") or f"Postulante_{candidato_id}"
-        carpeta_candidato = os.path.join(carpeta_base, limpiar_nombre_archivo(etiqueta))
-        os.makedirs(carpeta_candidato, exist_ok=True)
+        pendientes = []  # (candidato, entry_manifest, rut_candidato, [(doc_id, nombre, futuro)])
+        payloads_cotizacion = {}  # id_cotizacion -> payload, para el comprobante de oferta
+        for candidato, futuro_docs in zip(candidatos, futuros_documentos):
+            candidato_id = candidato.get("id")
+            etiqueta = candidato.get("label") or f"Postulante_{candidato_id}"
+            carpeta_candidato = os.path.join(carpeta_base, limpiar_nombre_archivo(etiqueta))
+            os.makedirs(carpeta_candidato, exist_ok=True)
 
-        try:
-            documentos, rut_cotizacion = _obtener_documentos_por_cotizacion(candidato_id, token)
-        except Exception as e:
-            print(f"[API] Error al obtener adjuntos para {etiqueta}: {e}")
-            errores += 1
-            continue
-
-        rut_candidato = candidato.get("rut") or rut_cotizacion or _extraer_rut_desde_texto(etiqueta)
-        rut_normalizado = _normalizar_rut(rut_candidato) or rut_candidato
-
-        entry_manifest = {
-            "id_cotizacion": candidato_id,
-            "label": etiqueta,
-            "rut": rut_normalizado,
-            "carpeta": carpeta_candidato,
-            "esperados_api": len(documentos) if documentos else 0,
-            "nombres_esperados_api": [
-                (d.get("filename") or d.get("nombre") or d.get("fileName") or str(d.get("id") or "")).strip()
-                for d in (documentos or [])
-                if isinstance(d, dict)
-            ],
-            "descargados": [],
-            "errores_descarga": [],
-        }
-        manifest["proveedores"].append(entry_manifest)
-
-        if not documentos:
-            print(f"[API] Sin documentos para {etiqueta}")
             try:
-                certificado_ok = descargar_certificado_habilidad(rut_candidato, carpeta_candidato, driver)
-                if certificado_ok:
-                    exitosos += 1
-            except Exception as cert_error:
+                documentos, rut_cotizacion, payload_cotizacion = futuro_docs.result()
+            except Exception as e:
+                print(f"[API] Error al obtener adjuntos para {etiqueta}: {e}")
                 errores += 1
-                print(f"[CERT] Error al descargar certificado de {etiqueta}: {cert_error}")
+                continue
 
-            try:
-                dj_ok = descargar_declaracion_jurada(rut_candidato, carpeta_candidato, driver)
-                if dj_ok:
-                    exitosos += 1
-            except Exception as dj_error:
-                errores += 1
-                print(f"[DJ] Error al descargar declaración jurada de {etiqueta}: {dj_error}")
-            continue
+            payloads_cotizacion[str(candidato_id)] = payload_cotizacion
+            rut_candidato = candidato.get("rut") or rut_cotizacion or _extraer_rut_desde_texto(etiqueta)
+            rut_normalizado = _normalizar_rut(rut_candidato) or rut_candidato
+
+            entry_manifest = {
+                "id_cotizacion": candidato_id,
+                "label": etiqueta,
+                "rut": rut_normalizado,
+                "carpeta": carpeta_candidato,
+                "esperados_api": len(documentos) if documentos else 0,
+                "nombres_esperados_api": [
+                    (d.get("filename") or d.get("nombre") or d.get("fileName") or str(d.get("id") or "")).strip()
+                    for d in (documentos or [])
+                    if isinstance(d, dict)
+                ],
+                "descargados": [],
+                "archivos": [],
+                "errores_descarga": [],
+            }
+            manifest["proveedores"].append(entry_manifest)
 
-        print(f"[API] Descargando {len(documentos)} documentos de {etiqueta}")
+            previos_candidato = previos["proveedores"].get(str(candidato_id)) or {}
+            futuros_candidato = []
+            if not documentos:
+                print(f"[API] Sin documentos para {etiqueta}")
+            else:
+                print(f"[API] Descargando {len(documentos)} documentos de {etiqueta}")
+            for doc in documentos or []:
+                file_id = doc.get("id") or doc.get("documentoId") or doc.get("fileId")
+                if not file_id:
+                    continue
+                nombre_archivo = doc.get("filename") or doc.get("nombre") or doc.get("fileName") or f"{file_id}.bin"
+                futuro = pool.submit(
+                    _descargar_o_reutilizar_archivo_api,
+                    file_id,
+                    cliente,
+                    nombre_archivo,
+                    carpeta_candidato,
+                    previos_candidato.get(str(file_id)),
+                    almacen_blobs,
+                    al_guardar,
+                )
+                futuros_candidato.append((file_id, nombre_archivo, futuro))
+            pendientes.append((etiqueta, entry_manifest, rut_candidato, futuros_candidato))
 
-        for doc in documentos:
-            file_id = doc.get("id") or doc.get("documentoId") or doc.get("fileId")
-            if not file_id:
-                continue
-            nombre_archivo = doc.get("filename") or doc.get("nombre") or doc.get("fileName") or f"{file_id}.bin"
+        # 3) Recolección de resultados en el hilo principal (contadores y manifest sin carreras)
+        for file_id, futuro in futuros_generales:
             try:
-                contenido, nombre_final, content_type = _descargar_archivo_api(file_id, token, nombre_archivo)
-                nombre_final = _limpiar_nombre_archivo_con_extension(nombre_final)
-                if not os.path.splitext(nombre_final)[1]:
-                    extension = obtener_extension_por_content_type(content_type)
-                    if extension:
-                        nombre_final += extension
-                nombre_final = _asegurar_nombre_unico(carpeta_candidato, nombre_final)
-                ruta_archivo = os.path.join(carpeta_candidato, nombre_final)
-                with open(ruta_archivo, "wb") as f:
-                    f.write(contenido)
+                info_archivo = futuro.result()
                 exitosos += 1
-                entry_manifest["descargados"].append(nombre_final)
-                print(f"[API] Descargado ({etiqueta}) {nombre_final} -> {ruta_archivo}")
+                manifest["adjuntos_generales"].append(_metadata_archivo_manifest(info_archivo))
+                if info_archivo.get("reutilizado"):
+                    reutilizados += 1
+                    print(f"[API] Sin cambios (general) {info_archivo['nombre']}")
+                else:
+                    print(f"[API] Descargado (general) {info_archivo['nombre']} -> {info_archivo['ruta']}")
             except Exception as e:
                 errores += 1
-                entry_manifest["errores_descarga"].append({"id": file_id, "nombre": nombre_archivo, "error": str(e)})
-                print(f"[API] Error al descargar ({etiqueta}) {file_id}: {e}")
+                print(f"[API] Error al descargar (general) {file_id}: {e}")
 
-        try:
-            certificado_ok = descargar_certificado_habilidad(rut_candidato, carpeta_candidato, driver)
-            if certificado_ok:
-                exitosos += 1
-        except Exception as cert_error:
-            errores += 1
-            print(f"[CERT] Error al descargar certificado de {etiqueta}: {cert_error}")
+        for etiqueta, entry_manifest, _, futuros_candidato in pendientes:
+            for file_id, nombre_archivo, futuro in futuros_candidato:
+                try:
+                    info_archivo = futuro.result()
+                    exitosos += 1
+                    entry_manifest["descargados"].append(info_archivo["nombre"])
+                    entry_manifest["archivos"].append(_metadata_archivo_manifest(info_archivo))
+                    if info_archivo.get("reutilizado"):
+                        reutilizados += 1
+                        print(f"[API] Sin cambios ({etiqueta}) {info_archivo['nombre']}")
+                    else:
+                        print(f"[API] Descargado ({etiqueta}) {info_archivo['nombre']} -> {info_archivo['ruta']}")
+                except Exception as e:
+                    errores += 1
+                    entry_manifest["errores_descarga"].append({"id": file_id, "nombre": nombre_archivo, "error": str(e)})
+                    print(f"[API] Error al descargar ({etiqueta}) {file_id}: {e}")
+
+    # El ledger queda en disco antes de certificados/UI: si el proceso se corta, la próxima
+    # ejecución ya reutiliza los adjuntos bajados.
+    try:
+        _guardar_manifest_adjuntos(carpeta_base, manifest)
+    except Exception as e:
+        print(f"[API] No se pudo guardar manifest parcial: {e}")
 
-        try:
-            dj_ok = descargar_declaracion_jurada(rut_candidato, carpeta_candidato, driver)
-            if dj_ok:
-                exitosos += 1
-        except Exception as dj_error:
-            errores += 1
-            print(f"[DJ] Error al descargar declaración jurada de {etiqueta}: {dj_error}")
+    # 4) Certificados por postulante: en paralelo si hay pool de impresión headless; si no,
+    # secuencial porque la impresión usa el navegador compartido.
+    def _certificados_candidato(pendiente):
+        etiqueta, entry_manifest, rut_candidato, _ = pendiente
+        return _descargar_certificados_candidato(etiqueta, rut_candidato, entry_manifest["carpeta"], driver)
+
+    with ThreadPoolExecutor(max_workers=hilos_impresion(), thread_name_prefix="cert") as pool_cert:
+        for ok_cert, error_cert in pool_cert.map(_certificados_candidato, pendientes):
+            exitosos += ok_cert
+            errores += error_cert
+
+    # 5) Comprobante de oferta desde el JSON de la cotización; la captura por UI (más abajo)
+    # solo queda para los proveedores sin PDF.
+    if COMPROBANTE_OFERTA_DESDE_API and pendientes:
+        _generar_comprobantes_desde_api(pendientes, payloads_cotizacion, codigo_ca, nombre_proyecto)
 
     # Verificación final (si hay Selenium) comparando contra la UI
     try:
@@ -481,9 +660,7 @@ def descargar_compra_agil_api(codigo_ca, token_path="token", driver=None, base_d
 
     # Guardar manifest para análisis/Excel
     try:
-        ruta_manifest = os.path.join(carpeta_base, MANIFEST_ADJUNTOS_FILENAME)
-        with open(ruta_manifest, "w", encoding="utf-8") as f:
-            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        ruta_manifest = _guardar_manifest_adjuntos(carpeta_base, manifest)
         print(f"[API] Manifest guardado -> {ruta_manifest}")
     except Exception as e:
         print(f"[API] No se pudo guardar manifest: {e}")
@@ -495,7 +672,7 @@ def descargar_compra_agil_api(codigo_ca, token_path="token", driver=None, base_d
     except Exception as e:
         print(f"[VOUCHER_CA] Error inesperado descargando comprobantes de oferta: {e}")
 
-    print(f"[API] Descarga finalizada. Éxitos: {exitosos} | Errores: {errores}")
+    print(f"[API] Descarga finalizada. Éxitos: {exitosos} (sin cambios: {reutilizados}) | Errores: {errores}")
     return exitosos > 0
 
 def navegar_a_compra_agil(codigo_ca, driver):
@@ -599,7 +776,7 @@ def obtener_proveedores_ca(driver):
             )
             # Hacer scroll hasta el encabezado para asegurar que la sección se renderice
             driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", encabezado)
-            time.sleep(1)
+            esperas.esperar_dom_estable(driver, timeout=5, nombre="proveedores_listado")
         except TimeoutException:
             print("Advertencia: no se encontró el encabezado del listado de proveedores.")
 
@@ -849,72 +1026,70 @@ def descargar_adjuntos_proveedor(proveedor, carpeta_destino, driver):
         print(f"Adjuntos encontrados en el modal: {len(enlaces_descarga)}")
         
         # Intentar fallback API cuando los enlaces no traen href (caso típico: imágenes con click JS)
-        token_fallback = None
+        cliente_fallback = None
         mapa_adjuntos_api = {}
-        if adjuntos_api:
-            try:
-                token_fallback = _leer_token("token")
-            except Exception:
-                token_fallback = None
-            for doc in adjuntos_api:
-                if not isinstance(doc, dict):
-                    continue
-                doc_id = doc.get("id") or doc.get("documentoId") or doc.get("fileId")
-                nombre_doc = doc.get("filename") or doc.get("nombre") or doc.get("fileName")
-                if not doc_id or not nombre_doc:
-                    continue
-                mapa_adjuntos_api[_normalizar_nombre_para_comparar(nombre_doc)] = {
-                    "id": doc_id,
-                    "filename": nombre_doc,
-                }
+        try:
+            if adjuntos_api:
+                try:
+                    cliente_fallback = ClienteApiCompraAgil.desde_archivo_token("token")
+                except Exception:
+                    cliente_fallback = None
+                for doc in adjuntos_api:
+                    if not isinstance(doc, dict):
+                        continue
+                    doc_id = doc.get("id") or doc.get("documentoId") or doc.get("fileId")
+                    nombre_doc = doc.get("filename") or doc.get("nombre") or doc.get("fileName")
+                    if not doc_id or not nombre_doc:
+                        continue
+                    mapa_adjuntos_api[_normalizar_nombre_para_comparar(nombre_doc)] = {
+                        "id": doc_id,
+                        "filename": nombre_doc,
+                    }
 
-        for i, enlace in enumerate(enlaces_descarga, 1):
-            try:
-                href = enlace.get_attribute('href')
-                texto_enlace = enlace.text.strip()
+            for i, enlace in enumerate(enlaces_descarga, 1):
+                try:
+                    href = enlace.get_attribute('href')
+                    texto_enlace = enlace.text.strip()
                 
-                # Obtener nombre del archivo
-                nombre_archivo = texto_enlace if texto_enlace else f"adjunto_{len(adjuntos_descargados)+1}"
-                nombre_archivo = _limpiar_nombre_archivo_con_extension(nombre_archivo)
-                print(f"  [{i}] adjunto nombre='{nombre_archivo}', href='{href}'")
+                    # Obtener nombre del archivo
+                    nombre_archivo = texto_enlace if texto_enlace else f"adjunto_{len(adjuntos_descargados)+1}"
+                    nombre_archivo = _limpiar_nombre_archivo_con_extension(nombre_archivo)
+                    print(f"  [{i}] adjunto nombre='{nombre_archivo}', href='{href}'")
                 
-                if not href:
-                    if token_fallback and texto_enlace:
-                        clave = _normalizar_nombre_para_comparar(texto_enlace)
-                        info_api = mapa_adjuntos_api.get(clave)
-                        if info_api:
-                            try:
-                                contenido, nombre_final, content_type = _descargar_archivo_api(
-                                    info_api["id"], token_fallback, info_api["filename"]
-                                )
-                                nombre_final = _limpiar_nombre_archivo_con_extension(nombre_final)
-                                if not os.path.splitext(nombre_final)[1]:
-                                    extension = obtener_extension_por_content_type(content_type)
-                                    if extension:
-                                        nombre_final += extension
-                                nombre_final = _asegurar_nombre_unico(carpeta_destino, nombre_final)
-                                ruta_archivo = os.path.join(carpeta_destino, nombre_final)
-                                with open(ruta_archivo, "wb") as f:
-                                    f.write(contenido)
-                                adjuntos_descargados.append(ruta_archivo)
-                                print(f"  - Descargado (API fallback): {nombre_final}")
-                                continue
-                            except Exception as e:
-                                print(f"  - Error API fallback para '{texto_enlace}': {e}")
-                    # Aún no sabemos la URL de descarga; se omite
-                    continue
+                    if not href:
+                        if cliente_fallback and texto_enlace:
+                            clave = _normalizar_nombre_para_comparar(texto_enlace)
+                            info_api = mapa_adjuntos_api.get(clave)
+                            if info_api:
+                                try:
+                                    info_archivo = _descargar_archivo_api(
+                                        info_api["id"], cliente_fallback, info_api["filename"], carpeta_destino
+                                    )
+                                    nombre_final = info_archivo["nombre"]
+                                    ruta_archivo = info_archivo["ruta"]
+                                    adjuntos_descargados.append(ruta_archivo)
+                                    print(f"  - Descargado (API fallback): {nombre_final}")
+                                    continue
+                                except Exception as e:
+                                    print(f"  - Error API fallback para '{texto_enlace}': {e}")
+                        # Aún no sabemos la URL de descarga; se omite
+                        continue
                 
-                # Descargar archivo si tenemos URL
-                ruta_archivo = descargar_archivo(href, carpeta_destino, nombre_archivo, driver)
+                    # Descargar archivo si tenemos URL
+                    ruta_archivo = descargar_archivo(href, carpeta_destino, nombre_archivo, driver)
                 
-                if ruta_archivo:
-                    adjuntos_descargados.append(ruta_archivo)
-                    print(f"  - Descargado: {nombre_archivo}")
+                    if ruta_archivo:
+                        adjuntos_descargados.append(ruta_archivo)
+                        print(f"  - Descargado: {nombre_archivo}")
             
-            except Exception as e:
-                print(f"Error al descargar adjunto: {str(e)}")
-                continue
-        
+                except Exception as e:
+                    print(f"Error al descargar adjunto: {str(e)}")
+                    continue
+        finally:
+            # La sesión del cliente es del pool compartido: se cierra aunque falle algo a mitad
+            if cliente_fallback:
+                cliente_fallback.close()
+
         # Actualizar información del proveedor
         proveedor['carpeta_path'] = carpeta_destino
         
@@ -929,7 +1104,7 @@ def descargar_adjuntos_proveedor(proveedor, carpeta_destino, driver):
             except Exception:
                 pass
         
-        time.sleep(1)
+        esperas.esperar_sin_dialogo(driver, nombre="ui_cierre_modal_adjuntos")
         
         return adjuntos_descargados
         
@@ -953,7 +1128,7 @@ def descargar_archivo(url, carpeta_destino, nombre_archivo, driver):
     try:
         # Obtener cookies del navegador para la sesión
         cookies = driver.get_cookies()
-        session = requests.Session()
+        session = motor_descargas.sesion_resiliente()
         
         for cookie in cookies:
             session.cookies.set(cookie['name'], cookie['value'])
@@ -1035,9 +1210,50 @@ def _headers_api(token):
     }
 
 
-def _listar_adjuntos_api(codigo_ca, token):
+class ClienteApiCompraAgil:
+    """
+    Cliente HTTP compartido para la API de Compra Ágil.
+
+    Mantiene una requests.Session con un pool de conexiones keep-alive dimensionado para
+    la concurrencia configurada, y fija una sola vez los headers de _headers_api, de modo
+    que las llamadas sucesivas reutilizan la conexión TCP/TLS con servicios-compra-agil.
+    La sesión usa motor_descargas.AdaptadorResiliente: cada request pasa por el limitador
+    de tasa del host y se reintenta con backoff ante 429/5xx o errores de conexión.
+    Para pruebas se puede inyectar una sesión propia con el parámetro session.
+    """
+
+    def __init__(self, token, session=None, pool_maxsize=None):
+        self.token = token
+        if session is None:
+            tamano_pool = pool_maxsize or max(MAX_WORKERS_API_CA, *CONCURRENCIA_POR_HOST.values())
+            session = motor_descargas.sesion_resiliente(pool_connections=4, pool_maxsize=int(tamano_pool))
+        session.headers.update(_headers_api(token))
+        self.session = session
+
+    @classmethod
+    def desde_archivo_token(cls, token_path="token", **kwargs):
+        return cls(_leer_token(token_path), **kwargs)
+
+    def get(self, url, timeout=40, **kwargs):
+        return self.session.get(url, timeout=timeout, **kwargs)
+
+    def close(self):
+        try:
+            self.session.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _listar_adjuntos_api(codigo_ca, cliente):
     url = f"{API_BASE_CA}/comprador/listar/{codigo_ca}"
-    resp = requests.get(url, headers=_headers_api(token), timeout=40)
+    resp = cliente.get(url, timeout=40)
     if resp.status_code != 200:
         raise RuntimeError(f"HTTP {resp.status_code}: {resp.text}")
     data = resp.json()
@@ -1046,46 +1262,354 @@ def _listar_adjuntos_api(codigo_ca, token):
     return archivos, payload
 
 
-def _descargar_archivo_api(file_id, token, nombre_archivo):
-    url = f"{API_BASE_CA}/comprador/descargar?id={file_id}"
-    resp = requests.get(url, headers=_headers_api(token), timeout=60, stream=True)
-    if resp.status_code != 200:
-        raise RuntimeError(f"HTTP {resp.status_code}: {resp.text}")
+def _nombre_desde_disposition(disposition, nombre_archivo):
+    """Si Content-Disposition trae nombre de archivo, lo devuelve; si no, retorna nombre_archivo."""
+    if not disposition:
+        return nombre_archivo
+    try:
+        # Soporta filename= y filename*=UTF-8''...
+        m_star = re.search(r"filename\\*=(?:UTF-8''|utf-8'')?([^;]+)", disposition)
+        if m_star:
+            candidato = unquote(m_star.group(1).strip().strip('"').strip("'"))
+            if candidato:
+                return candidato
+        else:
+            m = re.search(r"filename=([^;]+)", disposition)
+            if m:
+                candidato = m.group(1).strip().strip('"').strip("'")
+                if candidato:
+                    return candidato
+    except Exception:
+        pass
+    return nombre_archivo
+
 
-    # Si Content-Disposition trae nombre de archivo, respetarlo
-    disposition = resp.headers.get("content-disposition") or resp.headers.get("Content-Disposition")
-    if disposition:
+def _generar_comprobantes_desde_api(pendientes, payloads_cotizacion, codigo_ca, nombre_proyecto):
+    """
+    Genera CERTIFICADOS/ComprobanteOferta.html (y .pdf si hay pool de impresión) por postulante
+    a partir del payload de su cotización. Anota las rutas en entry_manifest["comprobante_api"].
+    """
+    pool = _pool_impresion
+
+    def _generar(pendiente):
+        etiqueta, entry_manifest, rut_candidato, _ = pendiente
+        payload = payloads_cotizacion.get(str(entry_manifest.get("id_cotizacion")))
+        if not payload:
+            return False
+        carpeta = entry_manifest["carpeta"]
+        if _archivo_listo(os.path.join(carpeta, "CERTIFICADOS", comprobante_oferta.NOMBRE_PDF)):
+            return True
         try:
-            # Soporta filename= y filename*=UTF-8''...
-            m_star = re.search(r"filename\\*=(?:UTF-8''|utf-8'')?([^;]+)", disposition)
-            if m_star:
-                candidato = unquote(m_star.group(1).strip().strip('"').strip("'"))
-                if candidato:
-                    nombre_archivo = candidato
-            else:
-                m = re.search(r"filename=([^;]+)", disposition)
-                if m:
-                    candidato = m.group(1).strip().strip('"').strip("'")
-                    if candidato:
-                        nombre_archivo = candidato
+            resultado = comprobante_oferta.generar_comprobante_oferta(
+                payload,
+                carpeta,
+                codigo_ca,
+                nombre_proyecto=nombre_proyecto or "",
+                proveedor=etiqueta,
+                rut=entry_manifest.get("rut") or rut_candidato or "",
+                pool=pool,
+            )
+        except Exception as e:
+            print(f"[VOUCHER_API] Error generando comprobante de {etiqueta}: {e}")
+            return False
+        entry_manifest["comprobante_api"] = resultado
+        return bool(resultado.get("pdf"))
+
+    with ThreadPoolExecutor(max_workers=hilos_impresion(), thread_name_prefix="voucher") as pool_voucher:
+        generados = sum(pool_voucher.map(_generar, pendientes))
+    detalle = "" if pool else " (sin pool de impresión: solo HTML, el PDF se captura por UI)"
+    print(f"[VOUCHER_API] Comprobantes PDF desde la API: {generados}/{len(pendientes)}{detalle}")
+
+
+def _descargar_certificados_candidato(etiqueta, rut, carpeta_candidato, driver):
+    """Certificado de habilidad + declaración jurada de un postulante. Retorna (exitos, errores)."""
+    exitos = 0
+    errores = 0
+    try:
+        if descargar_certificado_habilidad(rut, carpeta_candidato, driver):
+            exitos += 1
+    except Exception as cert_error:
+        errores += 1
+        print(f"[CERT] Error al descargar certificado de {etiqueta}: {cert_error}")
+
+    try:
+        if descargar_declaracion_jurada(rut, carpeta_candidato, driver):
+            exitos += 1
+    except Exception as dj_error:
+        errores += 1
+        print(f"[DJ] Error al descargar declaración jurada de {etiqueta}: {dj_error}")
+    return exitos, errores
+
+
+def _descargar_archivo_api(
+    file_id, cliente, nombre_archivo, carpeta_destino, nombre_reemplazable=None, almacen_blobs=None, al_guardar=None
+):
+    """
+    Descarga un archivo de la API escribiéndolo por bloques en un temporal dentro de
+    carpeta_destino y, al completar, lo renombra de forma atómica a un nombre único.
+    La memoria usada no depende del tamaño del adjunto. Seguro para usar desde varios hilos.
+    nombre_reemplazable: archivo propio de una ejecución anterior (incompleto o alterado)
+    que se sobrescribe en lugar de crear un duplicado numerado.
+    almacen_blobs: si se entrega, el contenido se publica en el almacén por contenido y el
+    archivo final queda enlazado a él.
+    al_guardar: callable que recibe la ruta final de un archivo recién descargado.
+
+    Returns:
+        dict: {"id", "nombre", "ruta", "bytes", "sha256", "content_type"}
+    """
+    url = f"{API_BASE_CA}/comprador/descargar?id={file_id}"
+    os.makedirs(carpeta_destino, exist_ok=True)
+    with _semaforo_host(url):
+        resp = cliente.get(url, timeout=60, stream=True)
+        try:
+            if resp.status_code != 200:
+                raise RuntimeError(f"HTTP {resp.status_code}: {resp.text}")
+
+            disposition = resp.headers.get("content-disposition") or resp.headers.get("Content-Disposition")
+            nombre_final = _limpiar_nombre_archivo_con_extension(_nombre_desde_disposition(disposition, nombre_archivo))
+            content_type = _normalizar_content_type(resp.headers.get("content-type", ""))
+            if not os.path.splitext(nombre_final)[1]:
+                extension = obtener_extension_por_content_type(content_type)
+                if extension:
+                    nombre_final += extension
+
+            ruta_tmp, total, sha256 = escribir_stream_temporal(resp, carpeta_destino)
+        finally:
+            resp.close()
+
+    # Si el mismo contenido ya está en la carpeta (re-ejecución), se reutiliza en vez de duplicarlo
+    existente = _buscar_copia_existente(carpeta_destino, nombre_final, total, sha256)
+    if existente:
+        try:
+            os.remove(ruta_tmp)
         except Exception:
             pass
+        nombre_final = existente
+        ruta_archivo = os.path.join(carpeta_destino, nombre_final)
+    else:
+        try:
+            if nombre_reemplazable:
+                nombre_final = nombre_reemplazable
+            else:
+                nombre_final = _reservar_nombre_unico(carpeta_destino, nombre_final)
+            ruta_archivo = os.path.join(carpeta_destino, nombre_final)
+            if almacen_blobs:
+                almacen_blobs.publicar(ruta_tmp, sha256, ruta_archivo)
+            else:
+                os.replace(ruta_tmp, ruta_archivo)
+        except Exception:
+            try:
+                os.remove(ruta_tmp)
+            except Exception:
+                pass
+            raise
+        if al_guardar:
+            al_guardar(ruta_archivo)
+
+    return {
+        "id": file_id,
+        "nombre": nombre_final,
+        "ruta": ruta_archivo,
+        "bytes": total,
+        "sha256": sha256,
+        "content_type": content_type,
+        "reutilizado": bool(existente),
+    }
+
+
+def _descargar_o_reutilizar_archivo_api(
+    file_id, cliente, nombre_archivo, carpeta_destino, previo=None, almacen_blobs=None, al_guardar=None
+):
+    """
+    Si el manifest anterior registra este archivo (previo) y sigue en carpeta_destino con el
+    mismo tamaño y SHA-256, lo reutiliza sin tocar la red; si no, lo descarga.
+    """
+    nombre_previo = os.path.basename((previo or {}).get("nombre") or "")
+    if nombre_previo:
+        ruta_previa = os.path.join(carpeta_destino, nombre_previo)
+        if archivo_coincide(ruta_previa, previo.get("bytes"), previo.get("sha256")):
+            return {
+                "id": file_id,
+                "nombre": nombre_previo,
+                "ruta": ruta_previa,
+                "bytes": previo.get("bytes"),
+                "sha256": previo.get("sha256"),
+                "content_type": "",
+                "reutilizado": True,
+            }
+    return _descargar_archivo_api(
+        file_id,
+        cliente,
+        nombre_archivo,
+        carpeta_destino,
+        nombre_reemplazable=nombre_previo or None,
+        almacen_blobs=almacen_blobs,
+        al_guardar=al_guardar,
+    )
+
+
+def _metadata_archivo_manifest(info_archivo):
+    """Subconjunto de la metadata de descarga que se guarda en el manifest."""
+    return {
+        "id": info_archivo.get("id"),
+        "nombre": info_archivo.get("nombre"),
+        "bytes": info_archivo.get("bytes"),
+        "sha256": info_archivo.get("sha256"),
+    }
 
-    content_type = _normalizar_content_type(resp.headers.get("content-type", ""))
-    return resp.content, nombre_archivo, content_type
 
+def _indice_descargas_previas(manifest_previo):
+    """
+    Indexa por id de archivo las descargas registradas en un manifest_adjuntos.json anterior:
+    {"generales": {id: archivo}, "proveedores": {id_cotizacion: {id: archivo}}}.
+    """
+    def _por_id(archivos):
+        return {str(a["id"]): a for a in archivos or [] if isinstance(a, dict) and a.get("id") is not None}
+
+    proveedores = {}
+    for entry in (manifest_previo or {}).get("proveedores") or []:
+        if isinstance(entry, dict) and entry.get("id_cotizacion") is not None:
+            proveedores[str(entry["id_cotizacion"])] = _por_id(entry.get("archivos"))
+    return {
+        "generales": _por_id((manifest_previo or {}).get("adjuntos_generales")),
+        "proveedores": proveedores,
+    }
 
-def _obtener_info_compra(codigo_compra, token):
-    url = f"{API_BASE_CA}/solicitud/{codigo_compra}?size=20&page=0"
-    resp = requests.get(url, headers=_headers_api(token), timeout=40)
+
+def _guardar_manifest_adjuntos(carpeta_base, manifest):
+    """Escribe el manifest de forma atómica (temporal + os.replace) y retorna su ruta."""
+    ruta_manifest = os.path.join(carpeta_base, MANIFEST_ADJUNTOS_FILENAME)
+    ruta_tmp = f"{ruta_manifest}.tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(ruta_tmp, ruta_manifest)
+    return ruta_manifest
+
+
+def _guardar_solicitud_api(carpeta_base, info_data):
+    """Guarda la respuesta de /solicitud junto al manifest (para generar el Excel sin navegador)."""
+    ruta = os.path.join(carpeta_base, SOLICITUD_API_FILENAME)
+    ruta_tmp = f"{ruta}.tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(info_data, f, ensure_ascii=False)
+    os.replace(ruta_tmp, ruta)
+    return ruta
+
+
+def cargar_solicitud_api(carpeta_base):
+    """Respuesta de /solicitud guardada por la última descarga API ({} si no hay)."""
+    return _cargar_manifest(os.path.join(carpeta_base, SOLICITUD_API_FILENAME))
+
+
+def _obtener_pagina_info_compra(codigo_compra, cliente, page, size=None):
+    size = size or TAMANO_PAGINA_OFERTAS
+    url = f"{API_BASE_CA}/solicitud/{codigo_compra}?size={size}&page={page}"
+    with _semaforo_host(url):
+        resp = cliente.get(url, timeout=40)
     if resp.status_code != 200:
         raise RuntimeError(f"HTTP {resp.status_code}: {resp.text}")
     return resp.json()
 
 
-def _obtener_documentos_por_cotizacion(id_objetivo, token):
+def _obtener_info_compra(codigo_compra, cliente, max_workers=None):
+    """
+    Obtiene /solicitud/{codigo} recorriendo todas las páginas de ofertas y fusiona las
+    secciones de ofertas (SECCIONES_OFERTAS) en el payload de la primera página, para que
+    extract_candidate_ids vea a todos los postulantes.
+
+    Si la respuesta informa el total (páginas u ofertas), las páginas restantes se piden en
+    paralelo; si no, se avanza página a página hasta que una página no aporte ofertas nuevas.
+    """
+    size = TAMANO_PAGINA_OFERTAS
+    info_data = _obtener_pagina_info_compra(codigo_compra, cliente, 0, size)
+    payload = info_data.get("payload") if isinstance(info_data, dict) else None
+    if not isinstance(payload, dict):
+        return info_data
+
+    total_paginas = _total_paginas_ofertas(payload, size)
+    if total_paginas is not None:
+        paginas = list(range(1, min(total_paginas, MAX_PAGINAS_OFERTAS)))
+        if paginas:
+            workers = max(1, min(len(paginas), int(max_workers or MAX_WORKERS_API_CA)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api_ca_pag") as pool:
+                for data in pool.map(lambda p: _obtener_pagina_info_compra(codigo_compra, cliente, p, size), paginas):
+                    _fusionar_secciones_ofertas(payload, (data or {}).get("payload") or {})
+        return info_data
+
+    vistos = {_identificador_oferta(r) for r in _registros_ofertas(payload)}
+    pagina_actual = payload
+    page = 1
+    while page < MAX_PAGINAS_OFERTAS and _pagina_ofertas_llena(pagina_actual, size):
+        data = _obtener_pagina_info_compra(codigo_compra, cliente, page, size)
+        pagina_actual = (data or {}).get("payload") or {}
+        nuevos = {_identificador_oferta(r) for r in _registros_ofertas(pagina_actual)} - vistos
+        nuevos.discard(None)
+        if not nuevos:
+            # La API ignoró el número de página o ya no quedan ofertas
+            break
+        vistos.update(nuevos)
+        _fusionar_secciones_ofertas(payload, pagina_actual)
+        page += 1
+    return info_data
+
+
+def _registros_ofertas(payload):
+    registros = []
+    for key in SECCIONES_OFERTAS:
+        registros.extend(_registros_seccion_ofertas(payload.get(key)))
+    return registros
+
+
+def _pagina_ofertas_llena(payload, size):
+    """True si alguna sección de ofertas trae una página completa (puede haber más)."""
+    return any(len(_registros_seccion_ofertas(payload.get(key))) >= size for key in SECCIONES_OFERTAS)
+
+
+def _total_paginas_ofertas(payload, size):
+    """
+    Busca en el payload (y en sus sub-objetos de paginación/secciones) el total de páginas
+    o de ofertas. Retorna la cantidad de páginas, o None si la respuesta no lo informa.
+    """
+    candidatos = [payload]
+    for key in ("paginacion", "pageable", "page", "pagina", *SECCIONES_OFERTAS):
+        valor = payload.get(key)
+        if isinstance(valor, dict):
+            candidatos.append(valor)
+
+    total_paginas = None
+    for obj in candidatos:
+        for key in ("totalPages", "totalPaginas"):
+            valor = obj.get(key)
+            if isinstance(valor, int) and valor >= 0:
+                total_paginas = max(total_paginas or 0, valor)
+        for key in ("totalElements", "totalElementos", "totalOfertas", "cantidadOfertas", "totalRegistros"):
+            valor = obj.get(key)
+            if isinstance(valor, int) and valor >= 0:
+                total_paginas = max(total_paginas or 0, -(-valor // size))
+    return total_paginas
+
+
+def _fusionar_secciones_ofertas(destino, origen):
+    """Agrega al payload destino las ofertas de cada sección presentes en el payload origen."""
+    for key in SECCIONES_OFERTAS:
+        nueva = origen.get(key)
+        if nueva is None:
+            continue
+        actual = destino.get(key)
+        if actual is None:
+            destino[key] = nueva
+        elif isinstance(actual, list):
+            actual.extend(_registros_seccion_ofertas(nueva))
+        elif isinstance(actual, dict) and isinstance(actual.get("content"), list):
+            actual["content"].extend(_registros_seccion_ofertas(nueva))
+        elif isinstance(actual, dict) and isinstance(nueva, dict):
+            actual.update(nueva)
+
+
+def _obtener_documentos_por_cotizacion(id_objetivo, cliente):
     url = f"{API_BASE_CA}/solicitud/cotizacion/{id_objetivo}"
-    resp = requests.get(url, headers=_headers_api(token), timeout=40)
+    with _semaforo_host(url):
+        resp = cliente.get(url, timeout=40)
     if resp.status_code != 200:
         raise RuntimeError(f"HTTP {resp.status_code}: {resp.text}")
     data = resp.json()
@@ -1101,7 +1625,7 @@ def _obtener_documentos_por_cotizacion(id_objetivo, token):
         if not doc_id:
             continue
         resultados.append({"id": doc_id, "filename": nombre})
-    return resultados, rut
+    return resultados, rut, payload
 
 
 def _normalizar_nombre_laxo(nombre):
@@ -1275,7 +1799,7 @@ def _listar_nombres_adjuntos_ui(proveedor, driver):
             except Exception:
                 pass
 
-        time.sleep(0.5)
+        esperas.esperar_sin_dialogo(driver, nombre="ui_cierre_modal_nombres")
         return nombres
     except Exception:
         # Intentar cerrar en caso de error
@@ -1385,7 +1909,9 @@ def descargar_certificado_habilidad(rut, carpeta_proveedor, driver=None):
     destino_pdf = os.path.join(carpeta_certificados, "CertificadoHabilidad.pdf")
     url = f"{CERT_BASE_URL}/{rut_normalizado}"
 
-    return descargar_pdf_a_archivo(url, destino_pdf, driver=driver, tag="[CERT]")
+    return descargar_pdf_a_archivo(
+        url, destino_pdf, driver=driver, tag="[CERT]", clave_cache=f"habilidad/{rut_normalizado}"
+    )
 
 
 def descargar_declaracion_jurada(rut, carpeta_proveedor, driver=None):
@@ -1404,17 +1930,81 @@ def descargar_declaracion_jurada(rut, carpeta_proveedor, driver=None):
     destino_pdf = os.path.join(carpeta_certificados, "DeclaracionJurada.pdf")
     url = f"{DECLARACION_JURADA_BASE_URL}/{rut_normalizado}"
 
-    return descargar_pdf_a_archivo(url, destino_pdf, driver=driver, tag="[DJ]")
+    return descargar_pdf_a_archivo(
+        url, destino_pdf, driver=driver, tag="[DJ]", clave_cache=f"beneficiarios/{rut_normalizado}"
+    )
+
+
+def configurar_cache_certificados(directorio=None, ttl_horas=None):
+    """Cambia la carpeta y/o la vigencia (horas, 0 = desactivada) de la caché de certificados."""
+    global CACHE_CERTIFICADOS_DIR, CACHE_CERTIFICADOS_TTL_HORAS
+    if directorio:
+        CACHE_CERTIFICADOS_DIR = directorio
+    if ttl_horas is not None:
+        CACHE_CERTIFICADOS_TTL_HORAS = max(0.0, float(ttl_horas))
+
+
+def _ruta_cache_certificado(clave_cache):
+    partes = [limpiar_nombre_archivo(p) for p in str(clave_cache).split("/") if p]
+    return os.path.join(CACHE_CERTIFICADOS_DIR, *partes) + ".pdf"
+
+
+def _cache_certificado_vigente(ruta_cache):
+    try:
+        edad = time.time() - os.path.getmtime(ruta_cache)
+        if edad > CACHE_CERTIFICADOS_TTL_HORAS * 3600:
+            return False
+        with open(ruta_cache, "rb") as f:
+            return f.read(4) == b"%PDF"
+    except OSError:
+        return False
+
 
+def _lock_cache_certificado(clave_cache):
+    return _cache_certificados_locks[hash(clave_cache) % len(_cache_certificados_locks)]
 
-def descargar_pdf_a_archivo(url, destino_pdf, driver=None, tag="[PDF]"):
+
+def descargar_pdf_a_archivo(url, destino_pdf, driver=None, tag="[PDF]", clave_cache=None):
     """
     Descarga/guarda un PDF desde una URL.
     - Intenta requests (PDF directo).
     - Si no es PDF o falla, usa el navegador (si está disponible) para imprimir a PDF vía Chrome DevTools.
+
+    Con clave_cache (ej: "habilidad/76.709.823-5") el PDF se guarda en CACHE_CERTIFICADOS_DIR y,
+    mientras tenga menos de CACHE_CERTIFICADOS_TTL_HORAS, las siguientes llamadas con la misma
+    clave lo enlazan/copian a destino_pdf sin red ni navegador. Llamadas simultáneas con la misma
+    clave esperan a la primera en vez de repetir la descarga.
     """
+    if not clave_cache or CACHE_CERTIFICADOS_TTL_HORAS <= 0:
+        return _descargar_pdf_sin_cache(url, destino_pdf, driver, tag)
+
+    ruta_cache = _ruta_cache_certificado(clave_cache)
+    with _lock_cache_certificado(clave_cache):
+        if not _cache_certificado_vigente(ruta_cache):
+            # Se descarga a un temporal junto a la caché: destino_pdf puede ser un enlace a una
+            # versión anterior y escribir sobre él alteraría las demás copias.
+            os.makedirs(os.path.dirname(ruta_cache), exist_ok=True)
+            ruta_tmp = f"{ruta_cache}.{uuid.uuid4().hex}.part"
+            try:
+                if not _descargar_pdf_sin_cache(url, ruta_tmp, driver, tag):
+                    return False
+                os.replace(ruta_tmp, ruta_cache)
+            finally:
+                if os.path.exists(ruta_tmp):
+                    os.remove(ruta_tmp)
+        else:
+            print(f"{tag} PDF desde caché ({clave_cache}) -> {destino_pdf}")
+        try:
+            motor_descargas.materializar_archivo(ruta_cache, destino_pdf)
+        except Exception as e:
+            print(f"{tag} Error copiando PDF desde caché: {e}")
+            return False
+    return True
+
+
+def _descargar_pdf_sin_cache(url, destino_pdf, driver, tag):
     try:
-        resp = requests.get(url, timeout=60)
+        resp = motor_descargas.sesion_compartida().get(url, timeout=60)
         resp.raise_for_status()
         contenido = resp.content or b""
         content_type = (resp.headers.get("content-type") or "").lower()
@@ -1428,6 +2018,12 @@ def descargar_pdf_a_archivo(url, destino_pdf, driver=None, tag="[PDF]"):
     except Exception as e:
         print(f"{tag} Error descargando PDF vía requests: {e}")
 
+    pool = _pool_impresion
+    if pool is not None:
+        if pool.imprimir(url, destino_pdf, tag=tag):
+            return True
+        print(f"{tag} Pool de impresión falló, se intenta con el navegador interactivo.")
+
     if not driver:
         print(f"{tag} No hay navegador disponible para imprimir el PDF.")
         return False
@@ -1436,7 +2032,25 @@ def descargar_pdf_a_archivo(url, destino_pdf, driver=None, tag="[PDF]"):
         os.makedirs(os.path.dirname(destino_pdf), exist_ok=True)
     except Exception:
         pass
-    return _imprimir_certificado_con_navegador(url, destino_pdf, driver)
+    with _driver_interactivo_lock:
+        return _imprimir_certificado_con_navegador(url, destino_pdf, driver)
+
+
+def configurar_pool_impresion(pool):
+    """
+    Activa (o desactiva con None) el pool de navegadores headless para imprimir PDFs.
+    Retorna el pool anterior para que el llamador lo cierre si corresponde.
+    """
+    global _pool_impresion
+    anterior = _pool_impresion
+    _pool_impresion = pool
+    return anterior
+
+
+def hilos_impresion():
+    """Cantidad de certificados que conviene pedir en paralelo (1 sin pool de impresión)."""
+    pool = _pool_impresion
+    return pool.tamano if pool is not None else 1
 
 
 def descargar_certificado_habilidad_a_carpeta(rut, carpeta_certificados, driver=None, nombre_archivo="CertificadoHabilidad.pdf"):
@@ -1446,7 +2060,9 @@ def descargar_certificado_habilidad_a_carpeta(rut, carpeta_certificados, driver=
         return False
     destino_pdf = os.path.join(carpeta_certificados, nombre_archivo)
     url = f"{CERT_BASE_URL}/{rut_normalizado}"
-    return descargar_pdf_a_archivo(url, destino_pdf, driver=driver, tag="[CERT]")
+    return descargar_pdf_a_archivo(
+        url, destino_pdf, driver=driver, tag="[CERT]", clave_cache=f"habilidad/{rut_normalizado}"
+    )
 
 
 def descargar_declaracion_jurada_licitacion_a_carpeta(
@@ -1471,7 +2087,9 @@ def descargar_declaracion_jurada_licitacion_a_carpeta(
         return False
     destino_pdf = os.path.join(carpeta_certificados, nombre_archivo)
     url = f"{DECLARACION_JURADA_LICITACION_BASE_URL}/{codigo}/{rut_normalizado}"
-    return descargar_pdf_a_archivo(url, destino_pdf, driver=driver, tag="[DJ]")
+    return descargar_pdf_a_archivo(
+        url, destino_pdf, driver=driver, tag="[DJ]", clave_cache=f"dj-requisitos/{codigo}/{rut_normalizado}"
+    )
 
 
 def imprimir_pagina_actual_a_pdf(
@@ -1492,11 +2110,7 @@ def imprimir_pagina_actual_a_pdf(
     except Exception:
         pass
     try:
-        try:
-            WebDriverWait(driver, 20).until(lambda d: d.execute_script("return document.readyState") == "complete")
-        except Exception:
-            pass
-        time.sleep(1.0)
+        esperas.esperar_dom_estable(driver, timeout=20, nombre="pdf_pagina_actual")
         params = {"printBackground": True}
         if prefer_css_page_size:
             params["preferCSSPageSize"] = True
@@ -1563,17 +2177,8 @@ def _imprimir_certificado_con_navegador(url, destino_pdf, driver):
 
     try:
         driver.get(url)
-        try:
-            WebDriverWait(driver, 20).until(lambda d: d.execute_script("return document.readyState") == "complete")
-        except Exception:
-            pass
-        time.sleep(2)
-        resultado_pdf = driver.execute_cdp_cmd("Page.printToPDF", {"printBackground": True})
-        data_base64 = resultado_pdf.get("data") if isinstance(resultado_pdf, dict) else None
-        if not data_base64:
-            raise RuntimeError("Chrome no entregó datos para el PDF")
-        with open(destino_pdf, "wb") as f:
-            f.write(base64.b64decode(data_base64))
+        pool_impresion.esperar_pagina_lista(driver)
+        pool_impresion.imprimir_a_pdf(driver, destino_pdf)
         print(f"[CERT] Certificado generado con navegador -> {destino_pdf}")
         return True
     except Exception as e:
@@ -1614,7 +2219,7 @@ def descargar_comprobante_oferta_compra_agil_por_proveedor(proveedor, carpeta_pr
             driver.execute_script("window.scrollTo(0, 0);")
         except Exception:
             pass
-        time.sleep(0.2)
+        esperas.esperar_dom_estable(driver, timeout=1.5, quieto=0.15, nombre="voucher_scroll")
 
         last_y = None
 
@@ -1664,7 +2269,7 @@ def descargar_comprobante_oferta_compra_agil_por_proveedor(proveedor, carpeta_pr
                 driver.execute_script("window.scrollBy(0, 700);")
             except Exception:
                 break
-            time.sleep(0.4)
+            esperas.esperar_dom_estable(driver, timeout=1.5, quieto=0.15, nombre="voucher_scroll")
 
         # Fallback al XPath conocido (último recurso).
         try:
@@ -1693,7 +2298,7 @@ def descargar_comprobante_oferta_compra_agil_por_proveedor(proveedor, carpeta_pr
                     f"[VOUCHER_CA] No se encontró enlace 'Ver detalle' para proveedor "
                     f"{proveedor.get('nombre')} ({proveedor.get('rut')}) (intento {intento}/3)."
                 )
-                time.sleep(0.6)
+                esperas.esperar_dom_estable(driver, timeout=2, quieto=0.2, nombre="voucher_reintento")
                 continue
 
             # Capturar contexto ANTES del click para detectar navegación/ventanas nuevas.
@@ -1730,7 +2335,7 @@ def descargar_comprobante_oferta_compra_agil_por_proveedor(proveedor, carpeta_pr
                     click_ok = True
                     ultimo_error_click = None
                     break
-                time.sleep(0.6)
+                esperas.esperar_dom_estable(driver, timeout=2, quieto=0.2, nombre="voucher_reintento")
                 continue
             except Exception as exc:
                 ultimo_error_click = exc
@@ -1738,7 +2343,7 @@ def descargar_comprobante_oferta_compra_agil_por_proveedor(proveedor, carpeta_pr
                     click_ok = True
                     ultimo_error_click = None
                     break
-                time.sleep(0.6)
+                esperas.esperar_dom_estable(driver, timeout=2, quieto=0.2, nombre="voucher_reintento")
                 continue
 
             # Click exitoso: salir del loop de reintentos
@@ -1747,7 +2352,7 @@ def descargar_comprobante_oferta_compra_agil_por_proveedor(proveedor, carpeta_pr
             break
         except Exception as exc:
             ultimo_error_click = exc
-            time.sleep(0.6)
+            esperas.esperar_dom_estable(driver, timeout=2, quieto=0.2, nombre="voucher_reintento")
             continue
 
     if not click_ok:
@@ -1774,24 +2379,25 @@ def descargar_comprobante_oferta_compra_agil_por_proveedor(proveedor, carpeta_pr
 
     # Esperar que cargue el modal/detalle
     try:
-        wait.until(
-            lambda d: (
-                d.find_elements(
-                    By.XPATH,
-                    "//p[contains(normalize-space(),'Adjuntos de la cotización') or contains(normalize-space(),'Adjuntos de la cotizacion')]",
-                )
-                or d.find_elements(
-                    By.XPATH,
-                    "//*[contains(normalize-space(),'Cotización enviada') or contains(normalize-space(),'Cotizacion enviada')]",
-                )
-                or d.find_elements(
-                    By.XPATH,
-                    "//button[contains(normalize-space(),'Cerrar') or contains(normalize-space(),'Volver') or contains(normalize-space(),'Atrás')]",
+        with esperas.medir("voucher_detalle_visible"):
+            wait.until(
+                lambda d: (
+                    d.find_elements(
+                        By.XPATH,
+                        "//p[contains(normalize-space(),'Adjuntos de la cotización') or contains(normalize-space(),'Adjuntos de la cotizacion')]",
+                    )
+                    or d.find_elements(
+                        By.XPATH,
+                        "//*[contains(normalize-space(),'Cotización enviada') or contains(normalize-space(),'Cotizacion enviada')]",
+                    )
+                    or d.find_elements(
+                        By.XPATH,
+                        "//button[contains(normalize-space(),'Cerrar') or contains(normalize-space(),'Volver') or contains(normalize-space(),'Atrás')]",
+                    )
                 )
             )
-        )
     except TimeoutException:
-        time.sleep(1.5)
+        esperas.esperar_dom_estable(driver, timeout=5, nombre="voucher_detalle")
 
     try:
         driver.execute_script("window.scrollTo(0, 0);")
@@ -1840,15 +2446,76 @@ def descargar_comprobante_oferta_compra_agil_por_proveedor(proveedor, carpeta_pr
                 body.send_keys(Keys.ESCAPE)
             except Exception:
                 pass
+        esperas.esperar_sin_dialogo(driver, nombre="voucher_cierre")
 
-    time.sleep(0.5)
     return bool(ok)
 
 
-def descargar_comprobantes_oferta_compra_agil(codigo_ca, driver, base_dir="Descargas"):
+def _resumen_ca_listo(driver, codigo_ca):
+    """True si el navegador ya está en el resumen de la compra ágil, sin modal abierto."""
+    try:
+        if f"resumen-cotizacion/{codigo_ca}" not in (driver.current_url or ""):
+            return False
+        if not driver.find_elements(By.XPATH, "//a[contains(normalize-space(),'Ver detalle')]"):
+            return False
+    except Exception:
+        return False
+    return not esperas.hay_dialogo_visible(driver)
+
+
+def _restablecer_resumen_ca(driver, codigo_ca, handle_resumen=None):
+    """
+    Deja el resumen listo para el siguiente 'Ver detalle' sin recargar la página: cierra
+    ventanas/modales sobrantes y vuelve arriba. Retorna False si hace falta recargar.
+    """
+    try:
+        if handle_resumen and len(driver.window_handles) > 1:
+            for handle in list(driver.window_handles):
+                if handle != handle_resumen:
+                    driver.switch_to.window(handle)
+                    driver.close()
+            driver.switch_to.window(handle_resumen)
+    except Exception:
+        return False
+    if not _resumen_ca_listo(driver, codigo_ca):
+        try:
+            driver.find_element(By.TAG_NAME, "body").send_keys(Keys.ESCAPE)
+        except Exception:
+            pass
+        esperas.esperar_sin_dialogo(driver, timeout=3, nombre="voucher_reset")
+    try:
+        driver.execute_script("window.scrollTo(0, 0);")
+    except Exception:
+        pass
+    return _resumen_ca_listo(driver, codigo_ca)
+
+
+def _cargar_resumen_ca(driver, codigo_ca):
+    if not navegar_a_compra_agil(codigo_ca, driver):
+        return False
+    return bool(
+        esperas.esperar_condicion(
+            driver,
+            lambda d: d.find_elements(By.XPATH, "//a[contains(normalize-space(),'Ver detalle')]"),
+            timeout=20,
+            nombre="voucher_resumen",
+        )
+    )
+
+
+def descargar_comprobantes_oferta_compra_agil(
+    codigo_ca, driver, base_dir="Descargas", recargar_por_intento=False, metricas=None
+):
     """
     Recorre proveedores de una compra ágil, abre 'Ver detalle' y guarda ComprobanteOferta.pdf
     en la carpeta CERTIFICADOS de cada proveedor.
+
+    El resumen se carga una sola vez: entre proveedores solo se cierra el detalle y se vuelve
+    arriba en la misma página; se recarga únicamente tras un intento fallido o si el resumen
+    no quedó utilizable (recargar_por_intento=True recupera el modo anterior, que recargaba
+    antes de cada intento).
+
+    metricas: lista donde se agrega por proveedor {rut, nombre, ok, intentos, recargas, segundos}.
     """
     if not driver:
         return False
@@ -1881,8 +2548,17 @@ def descargar_comprobantes_oferta_compra_agil(codigo_ca, driver, base_dir="Desca
         print("[VOUCHER_CA] No se encontraron proveedores en la UI para imprimir comprobantes.")
         return False
 
+    try:
+        handle_resumen = driver.current_window_handle
+    except Exception:
+        handle_resumen = None
+
+    if metricas is None:
+        metricas = []
+    inicio_lote = time.perf_counter()
     ok_any = False
     max_intentos_por_proveedor = 4
+    recargar = recargar_por_intento
     for prov in proveedores:
         rut = _normalizar_rut(prov.get("rut")) or (prov.get("rut") or "").strip()
         carpeta_prov = None
@@ -1896,28 +2572,29 @@ def descargar_comprobantes_oferta_compra_agil(codigo_ca, driver, base_dir="Desca
         except Exception:
             pass
 
+        metrica = {"rut": rut, "nombre": prov.get("nombre"), "ok": False, "intentos": 0, "recargas": 0, "segundos": 0.0}
+        inicio_prov = time.perf_counter()
         try:
             destino_pdf = os.path.join(carpeta_prov, "CERTIFICADOS", "ComprobanteOferta.pdf")
             if _archivo_listo(destino_pdf):
                 ok_any = True
+                metrica["ok"] = True
                 continue
 
             ok = False
             for intento in range(1, max_intentos_por_proveedor + 1):
+                metrica["intentos"] = intento
                 try:
-                    # Ir siempre al resumen antes de cada intento para evitar DOM inestable/stale.
-                    if not navegar_a_compra_agil(codigo_ca, driver):
-                        time.sleep(0.8)
-                        continue
-                    try:
-                        WebDriverWait(driver, 20).until(
-                            lambda d: len(
-                                d.find_elements(By.XPATH, "//a[contains(normalize-space(),'Ver detalle')]")
-                            )
-                            > 0
-                        )
-                    except Exception:
-                        pass
+                    # Reutilizar el resumen cargado; recargar solo tras un fallo o si no se pudo restablecer.
+                    if recargar or not _restablecer_resumen_ca(driver, codigo_ca, handle_resumen):
+                        metrica["recargas"] += 1
+                        if not _cargar_resumen_ca(driver, codigo_ca):
+                            esperas.esperar_dom_estable(driver, timeout=2, quieto=0.2, nombre="voucher_reintento")
+                            continue
+                        try:
+                            handle_resumen = driver.current_window_handle
+                        except Exception:
+                            pass
 
                     ok = descargar_comprobante_oferta_compra_agil_por_proveedor(prov, carpeta_prov, driver)
                 except Exception as exc:
@@ -1929,17 +2606,19 @@ def descargar_comprobantes_oferta_compra_agil(codigo_ca, driver, base_dir="Desca
 
                 if ok and _archivo_listo(destino_pdf):
                     ok_any = True
+                    recargar = recargar_por_intento
                     break
 
-                # Limpieza mínima antes de reintentar
+                # Fallo detectado: el próximo intento parte de una recarga completa del resumen
+                recargar = True
                 try:
                     body = driver.find_element(By.TAG_NAME, "body")
                     body.send_keys(Keys.ESCAPE)
                 except Exception:
                     pass
-                time.sleep(0.8)
 
-            if not ok or not _archivo_listo(destino_pdf):
+            metrica["ok"] = bool(ok and _archivo_listo(destino_pdf))
+            if not metrica["ok"]:
                 print(
                     f"[VOUCHER_CA] No se pudo generar ComprobanteOferta.pdf para "
                     f"{prov.get('nombre')} ({prov.get('rut')})."
@@ -1947,37 +2626,65 @@ def descargar_comprobantes_oferta_compra_agil(codigo_ca, driver, base_dir="Desca
         except Exception as exc:
             print(f"[VOUCHER_CA] Error imprimiendo comprobante para {prov.get('nombre')} ({prov.get('rut')}): {exc}")
             continue
+        finally:
+            metrica["segundos"] = round(time.perf_counter() - inicio_prov, 3)
+            metricas.append(metrica)
+            print(
+                f"[VOUCHER_CA] {prov.get('nombre')} ({prov.get('rut')}): "
+                f"{'ok' if metrica['ok'] else 'fallo'} en {metrica['segundos']:.2f}s "
+                f"(intentos {metrica['intentos']}, recargas {metrica['recargas']})"
+            )
 
+    total = time.perf_counter() - inicio_lote
+    procesados = [m for m in metricas if m["intentos"]]
+    print(
+        f"[VOUCHER_CA] Lote: {len(metricas)} proveedores en {total:.2f}s "
+        f"({total / max(1, len(procesados)):.2f}s por comprobante generado, "
+        f"recargas del resumen: {sum(m['recargas'] for m in metricas)})"
+    )
     return ok_any
 
 
+def _registros_seccion_ofertas(section):
+    """Normaliza una sección de ofertas del payload a una lista de registros."""
+    if isinstance(section, list):
+        return list(section)
+    if isinstance(section, dict):
+        # Página estilo Spring: {"content": [...], "totalPages": N, ...}
+        if isinstance(section.get("content"), list):
+            return list(section["content"])
+        if all(isinstance(item, dict) for item in section.values()):
+            return list(section.values())
+        return [section]
+    return []
+
+
+def _identificador_oferta(record):
+    if not isinstance(record, dict):
+        return None
+    identifier = (
+        record.get("idEntidad")
+        or record.get("idRespuesta")
+        or record.get("id")
+        or record.get("codigoEmpresa")
+        or record.get("codigoSucursalEmpresa")
+    )
+    if identifier is None:
+        return None
+    return str(identifier).strip() or None
+
+
 def extract_candidate_ids(info_data):
     payload = info_data.get("payload") or {}
     records = []
-    for key in ("ofertasSeleccionadas", "ofertas", "detalleOfertasProveedor", "ofertasInadmisibles"):
-        section = payload.get(key)
-        if isinstance(section, list):
-            records.extend(section)
-        elif isinstance(section, dict):
-            if all(isinstance(item, dict) for item in section.values()):
-                records.extend(section.values())
-            else:
-                records.append(section)
+    for key in SECCIONES_OFERTAS:
+        records.extend(_registros_seccion_ofertas(payload.get(key)))
     candidates = []
     seen = set()
     for record in records:
         if not isinstance(record, dict):
             continue
-        identifier = (
-            record.get("idEntidad")
-            or record.get("idRespuesta")
-            or record.get("id")
-            or record.get("codigoEmpresa")
-            or record.get("codigoSucursalEmpresa")
-        )
-        if identifier is None:
-            continue
-        identifier_str = str(identifier).strip()
+        identifier_str = _identificador_oferta(record)
         if not identifier_str or identifier_str in seen:
             continue
         label = (
@@ -2018,6 +2725,9 @@ def build_user_label(file_info):
         return f"RUT {rut}"
     return "Adjuntos"
 
+def _excluir_de_zip(_ruta, nombre):
+    return _es_temporal_descarga(nombre)
+
 def crear_zip_proveedor(ruta_proveedor, nombre_proveedor):
     """
     Crea un archivo ZIP con todos los adjuntos de un proveedor
@@ -2032,30 +2742,54 @@ def crear_zip_proveedor(ruta_proveedor, nombre_proveedor):
     try:
         nombre_zip = f"{nombre_proveedor}.zip"
         ruta_zip = os.path.join(os.path.dirname(ruta_proveedor), nombre_zip)
-        
-        with zipfile.ZipFile(ruta_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Agregar todos los archivos de la carpeta del proveedor
-            for root, dirs, files in os.walk(ruta_proveedor):
-                for file in files:
-                    ruta_archivo = os.path.join(root, file)
-                    # Nombre relativo en el ZIP
-                    nombre_en_zip = os.path.relpath(ruta_archivo, ruta_proveedor)
-                    zipf.write(ruta_archivo, nombre_en_zip)
-        
-        print(f"ZIP creado: {nombre_zip}")
+        estadisticas = empaquetado_zip.crear_zip(ruta_proveedor, ruta_zip, excluir=_excluir_de_zip)
+        print(f"ZIP creado: {nombre_zip} - {empaquetado_zip.describir(estadisticas)}")
         return ruta_zip
         
     except Exception as e:
         print(f"Error al crear ZIP para {nombre_proveedor}: {str(e)}")
         return None
 
-def crear_zip_carpeta(ruta_carpeta, ruta_zip):
+def ruta_zip_proceso(carpeta):
+    """ZIP de un proceso: junto a su carpeta, con el mismo nombre."""
+    carpeta = os.path.normpath(carpeta)
+    return os.path.join(os.path.dirname(carpeta), f"{os.path.basename(carpeta)}.zip")
+
+def crear_zip_en_curso():
+    """ZipEnCurso para entregar a los flujos de descarga (mismas exclusiones que crear_zip_carpeta)."""
+    return empaquetado_zip.ZipEnCurso(excluir=_excluir_de_zip)
+
+def cerrar_zip_en_curso(zip_en_curso):
     """
-    Crea un archivo ZIP con el contenido de una carpeta completa.
+    Cierra un ZipEnCurso y deja su ZIP al día con la carpeta del proceso.
+
+    Returns:
+        str: Ruta del ZIP, o None si nunca se abrió o falló (el llamador puede usar crear_zip_carpeta)
+    """
+    try:
+        estadisticas = zip_en_curso.cerrar()
+        if estadisticas is None:
+            return None
+        al_cerrar = estadisticas.get("nuevos", 0) + estadisticas.get("modificados", 0)
+        print(
+            f"[ZIP] ZIP listo: {zip_en_curso.ruta_zip} - {estadisticas['en_curso']} archivos agregados "
+            f"durante la descarga, {al_cerrar} al cerrar ({estadisticas['segundos']:.2f}s), "
+            f"{estadisticas['bytes_zip'] / (1024 * 1024):.1f} MB"
+        )
+        return zip_en_curso.ruta_zip
+    except Exception as e:
+        print(f"[ZIP] Error al cerrar ZIP en curso: {str(e)}")
+        return None
+
+def crear_zip_carpeta(ruta_carpeta, ruta_zip, incremental=False):
+    """
+    Crea un archivo ZIP con el contenido de una carpeta completa. Los formatos ya comprimidos
+    se guardan sin recomprimir y el resto se comprime en paralelo (empaquetado_zip).
 
     Args:
         ruta_carpeta (str): Ruta a la carpeta a comprimir
         ruta_zip (str): Ruta final del ZIP a generar
+        incremental (bool): Si el ZIP ya existe, agregar solo lo nuevo o modificado en vez de reconstruirlo
 
     Returns:
         str: Ruta del archivo ZIP creado, o None si falla
@@ -2065,20 +2799,19 @@ def crear_zip_carpeta(ruta_carpeta, ruta_zip):
             print(f"[ZIP] Carpeta no existe: {ruta_carpeta}")
             return None
 
-        os.makedirs(os.path.dirname(ruta_zip), exist_ok=True)
-        ruta_zip_abs = os.path.abspath(ruta_zip)
-        ruta_carpeta_abs = os.path.abspath(ruta_carpeta)
-
-        with zipfile.ZipFile(ruta_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(ruta_carpeta):
-                for file in files:
-                    ruta_archivo = os.path.join(root, file)
-                    if os.path.abspath(ruta_archivo) == ruta_zip_abs:
-                        continue
-                    nombre_en_zip = os.path.relpath(ruta_archivo, ruta_carpeta_abs)
-                    zipf.write(ruta_archivo, nombre_en_zip)
-
-        print(f"[ZIP] ZIP creado: {ruta_zip}")
+        if incremental:
+            estadisticas = empaquetado_zip.actualizar_zip(ruta_carpeta, ruta_zip, excluir=_excluir_de_zip)
+            if estadisticas["modo"] != "nuevo":
+                print(
+                    f"[ZIP] ZIP actualizado ({estadisticas['modo']}): {ruta_zip} - "
+                    f"{estadisticas['vigentes']} sin cambios, {estadisticas['nuevos']} nuevos, "
+                    f"{estadisticas['modificados']} modificados, {estadisticas['eliminados']} eliminados; "
+                    f"{empaquetado_zip.describir(estadisticas)}"
+                )
+                return ruta_zip
+        else:
+            estadisticas = empaquetado_zip.crear_zip(ruta_carpeta, ruta_zip, excluir=_excluir_de_zip)
+        print(f"[ZIP] ZIP creado: {ruta_zip} - {empaquetado_zip.describir(estadisticas)}")
         return ruta_zip
     except Exception as e:
         print(f"[ZIP] Error al crear ZIP para carpeta {ruta_carpeta}: {str(e)}")
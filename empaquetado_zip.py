@@ -0,0 +1,510 @@
+"""
+Construcción de ZIPs de carpetas de proceso con compresión en paralelo.
+
+- Los formatos ya comprimidos (PDF, imágenes, .zip/.rar, Office, audio/video) se guardan
+  con ZIP_STORED: re-comprimirlos cuesta CPU y no reduce el tamaño.
+- El resto se comprime (deflate crudo con zlib, que libera el GIL) en un pool de hilos;
+  el hilo principal solo escribe las entradas ya comprimidas en el orden del recorrido.
+- Si un archivo comprimido no queda más chico que el original, se guarda sin comprimir.
+- El ZIP se escribe en un temporal y se renombra al terminar (nunca queda uno a medias).
+
+actualizar_zip() evita reconstruir en re-ejecuciones: compara la carpeta con el directorio
+central del ZIP existente (tamaño/fecha y, si la fecha cambió, CRC) y solo agrega al final
+los archivos nuevos o modificados. Las versiones anteriores quedan como bytes muertos fuera
+del directorio central; cuando superan UMBRAL_COMPACTAR se reescribe el ZIP copiando las
+entradas vigentes sin recomprimirlas.
+
+ZipEnCurso arma el ZIP mientras se descarga: cada archivo terminado se encola y un hilo
+escritor lo comprime y agrega de inmediato; al cerrar, actualizar_zip incorpora lo que no
+pasó por la cola (certificados, manifest) y lo que cambió después de agregarse.
+"""
+import copy
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+EXTENSIONES_SIN_COMPRIMIR = frozenset(
+    {
+        ".zip", ".rar", ".7z", ".gz", ".tgz", ".bz2", ".xz", ".zst",
+        ".pdf",
+        ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".tif", ".tiff",
+        ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp",
+        ".mp3", ".m4a", ".mp4", ".mov", ".avi", ".mkv",
+    }
+)
+MAX_WORKERS_ZIP = min(8, os.cpu_count() or 2)
+NIVEL_DEFLATE = 6
+CHUNK_ZIP = 1024 * 1024
+# Bytes comprimidos que se mantienen en memoria por archivo antes de pasar a disco
+MAX_BUFFER_MEMORIA = 32 * 1024 * 1024
+# Fracción de bytes muertos (entradas reemplazadas/eliminadas) sobre la cual se compacta el ZIP
+UMBRAL_COMPACTAR = 0.25
+
+
+def debe_comprimir(nombre):
+    return os.path.splitext(nombre)[1].lower() not in EXTENSIONES_SIN_COMPRIMIR
+
+
+def listar_archivos(ruta_carpeta, excluir=None):
+    """[(ruta, nombre_en_zip)] de la carpeta, en orden estable; excluir(ruta, nombre) -> bool."""
+    ruta_carpeta_abs = os.path.abspath(ruta_carpeta)
+    archivos = []
+    for root, dirs, files in os.walk(ruta_carpeta_abs):
+        dirs.sort()
+        for nombre in sorted(files):
+            ruta = os.path.join(root, nombre)
+            if excluir and excluir(ruta, nombre):
+                continue
+            archivos.append((ruta, os.path.relpath(ruta, ruta_carpeta_abs).replace(os.sep, "/")))
+    return archivos
+
+
+def _deflate_archivo(ruta, nivel):
+    """Comprime ruta con deflate crudo. Retorna (buffer posicionado al inicio, crc, tamaño original)."""
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, -15)
+    salida = tempfile.SpooledTemporaryFile(max_size=MAX_BUFFER_MEMORIA)
+    crc = 0
+    tamano = 0
+    try:
+        with open(ruta, "rb") as f:
+            while True:
+                bloque = f.read(CHUNK_ZIP)
+                if not bloque:
+                    break
+                crc = zlib.crc32(bloque, crc)
+                tamano += len(bloque)
+                salida.write(compresor.compress(bloque))
+        salida.write(compresor.flush())
+        salida.seek(0)
+    except Exception:
+        salida.close()
+        raise
+    return salida, crc, tamano
+
+
+def _copiar_bytes(origen, destino, cantidad):
+    while cantidad > 0:
+        bloque = origen.read(min(CHUNK_ZIP, cantidad))
+        if not bloque:
+            raise EOFError("Fin de archivo inesperado al copiar una entrada del ZIP")
+        destino.write(bloque)
+        cantidad -= len(bloque)
+
+
+def _escribir_entrada_cruda(zf, zinfo, datos, compress_size):
+    """
+    Escribe una entrada cuyos bytes ya vienen comprimidos (zinfo trae compress_type, CRC y
+    file_size). zipfile no expone esta operación, así que se replica lo que hacen
+    ZipFile._open_to_write y _ZipWriteFile.close, pero con CRC y tamaños conocidos de
+    antemano (el header local queda correcto a la primera, sin data descriptor).
+    """
+    zinfo.compress_size = compress_size
+    zinfo.flag_bits &= ~0x08
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or compress_size > zipfile.ZIP64_LIMIT
+    zf.fp.seek(zf.start_dir)
+    zinfo.header_offset = zf.fp.tell()
+    zf._writecheck(zinfo)
+    zf._didModify = True
+    zf.fp.write(zinfo.FileHeader(zip64))
+    _copiar_bytes(datos, zf.fp, compress_size)
+    zf.start_dir = zf.fp.tell()
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[zinfo.filename] = zinfo
+
+
+def _escribir_entrada_comprimida(zf, zinfo, datos, crc, tamano):
+    """Escribe el resultado de _deflate_archivo como entrada ZIP_DEFLATED."""
+    compress_size = datos.seek(0, os.SEEK_END)
+    datos.seek(0)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.CRC = crc
+    zinfo.file_size = tamano
+    zinfo.flag_bits = 0
+    _escribir_entrada_cruda(zf, zinfo, datos, compress_size)
+
+
+def _copiar_entrada(zf, fp_origen, info):
+    """Copia una entrada de otro ZIP tal cual (sin descomprimir ni recomprimir)."""
+    fp_origen.seek(info.header_offset)
+    header = fp_origen.read(30)
+    if header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Header local inválido para {info.filename}")
+    largo_nombre, largo_extra = struct.unpack("<HH", header[26:30])
+    fp_origen.seek(info.header_offset + 30 + largo_nombre + largo_extra)
+    nueva = copy.copy(info)
+    nueva.extra = zipfile._strip_extra(info.extra, (1,))  # zip64 se recalcula al escribir
+    _escribir_entrada_cruda(zf, nueva, fp_origen, info.compress_size)
+
+
+def agregar_archivos(zf, archivos, max_workers=None, nivel=NIVEL_DEFLATE, estadisticas=None):
+    """
+    Agrega [(ruta, nombre_en_zip)] a un ZipFile abierto en escritura, comprimiendo en paralelo.
+    Las entradas quedan en el mismo orden de `archivos`. Actualiza estadisticas (dict) si se entrega.
+    """
+    estadisticas = estadisticas if estadisticas is not None else {}
+    for clave in ("archivos", "comprimidos", "almacenados", "bytes_origen"):
+        estadisticas.setdefault(clave, 0)
+    max_workers = max(1, int(max_workers or MAX_WORKERS_ZIP))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="zip") as pool:
+        # Ventana acotada de trabajos en vuelo: limita la memoria/temporales usados a la vez
+        ventana = deque()
+        pendientes = iter(archivos)
+
+        def _encolar():
+            for ruta, nombre_zip in pendientes:
+                futuro = pool.submit(_deflate_archivo, ruta, nivel) if debe_comprimir(nombre_zip) else None
+                ventana.append((ruta, nombre_zip, futuro))
+                if len(ventana) >= max_workers * 2:
+                    return
+
+        _encolar()
+        while ventana:
+            ruta, nombre_zip, futuro = ventana.popleft()
+            _encolar()
+            zinfo = zipfile.ZipInfo.from_file(ruta, nombre_zip)
+            if futuro is None:
+                zf.write(ruta, nombre_zip, compress_type=zipfile.ZIP_STORED)
+                estadisticas["almacenados"] += 1
+                estadisticas["bytes_origen"] += zinfo.file_size
+            else:
+                datos, crc, tamano = futuro.result()
+                try:
+                    if datos.seek(0, os.SEEK_END) >= tamano:
+                        # No se redujo: se guarda tal cual
+                        zf.write(ruta, nombre_zip, compress_type=zipfile.ZIP_STORED)
+                        estadisticas["almacenados"] += 1
+                    else:
+                        _escribir_entrada_comprimida(zf, zinfo, datos, crc, tamano)
+                        estadisticas["comprimidos"] += 1
+                finally:
+                    datos.close()
+                estadisticas["bytes_origen"] += tamano
+            estadisticas["archivos"] += 1
+    return estadisticas
+
+
+def crear_zip(ruta_carpeta, ruta_zip, max_workers=None, nivel=NIVEL_DEFLATE, excluir=None):
+    """
+    Crea ruta_zip con el contenido de ruta_carpeta (rutas relativas a la carpeta).
+
+    Args:
+        max_workers (int): Hilos de compresión (por defecto MAX_WORKERS_ZIP)
+        nivel (int): Nivel de deflate para los formatos comprimibles
+        excluir (callable): excluir(ruta, nombre) -> True para omitir un archivo
+
+    Returns:
+        dict: {ruta, archivos, comprimidos, almacenados, bytes_origen, bytes_zip, segundos, mb_s}
+    """
+    inicio = time.perf_counter()
+    ruta_zip_abs = os.path.abspath(ruta_zip)
+    ruta_tmp = f"{ruta_zip_abs}.part"
+
+    def _excluir(ruta, nombre):
+        if os.path.abspath(ruta) in (ruta_zip_abs, ruta_tmp):
+            return True
+        return bool(excluir and excluir(ruta, nombre))
+
+    archivos = listar_archivos(ruta_carpeta, _excluir)
+    os.makedirs(os.path.dirname(ruta_zip_abs), exist_ok=True)
+    estadisticas = {"ruta": ruta_zip}
+    try:
+        with zipfile.ZipFile(ruta_tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+            agregar_archivos(zf, archivos, max_workers=max_workers, nivel=nivel, estadisticas=estadisticas)
+        os.replace(ruta_tmp, ruta_zip_abs)
+    finally:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+
+    estadisticas["segundos"] = time.perf_counter() - inicio
+    estadisticas["bytes_zip"] = os.path.getsize(ruta_zip_abs)
+    estadisticas["mb_s"] = estadisticas["bytes_origen"] / (1024 * 1024) / max(estadisticas["segundos"], 1e-9)
+    return estadisticas
+
+
+def _crc_archivo(ruta):
+    crc = 0
+    with open(ruta, "rb") as f:
+        while True:
+            bloque = f.read(CHUNK_ZIP)
+            if not bloque:
+                return crc
+            crc = zlib.crc32(bloque, crc)
+
+
+def _fecha_zip(date_time):
+    """El formato DOS guarda los segundos con resolución de 2."""
+    return tuple(date_time[:5]) + (date_time[5] // 2 * 2,)
+
+
+def _entrada_vigente(info, ruta, mtime_zip):
+    """
+    True si la entrada del ZIP corresponde al archivo actual: mismo tamaño y misma fecha, o
+    mismo CRC. Si el archivo se modificó cerca o después de escribir el ZIP la fecha (2 s de
+    resolución) no basta y se compara el CRC.
+    """
+    actual = zipfile.ZipInfo.from_file(ruta, info.filename)
+    if actual.file_size != info.file_size:
+        return False
+    if _fecha_zip(actual.date_time) == _fecha_zip(info.date_time) and os.path.getmtime(ruta) < mtime_zip - 2:
+        return True
+    return _crc_archivo(ruta) == info.CRC
+
+
+def _bytes_entrada(info):
+    """Bytes que ocupa una entrada en el cuerpo del ZIP (header local aproximado + datos)."""
+    descriptor = 16 if info.flag_bits & 0x08 else 0
+    return 30 + len(info.filename.encode("utf-8")) + len(info.extra) + info.compress_size + descriptor
+
+
+def _comparar_con_zip(zf, archivos, mtime_zip):
+    """Clasifica archivos contra el directorio central: (vigentes, modificados, nuevos, eliminados)."""
+    vigentes, modificados, nuevos = [], [], []
+    en_carpeta = set()
+    for ruta, nombre_zip in archivos:
+        en_carpeta.add(nombre_zip)
+        info = zf.NameToInfo.get(nombre_zip)
+        if info is None:
+            nuevos.append((ruta, nombre_zip))
+        elif _entrada_vigente(info, ruta, mtime_zip):
+            vigentes.append(info)
+        else:
+            modificados.append((ruta, nombre_zip))
+    eliminados = [info for info in zf.infolist() if info.filename not in en_carpeta]
+    return vigentes, modificados, nuevos, eliminados
+
+
+def _reescribir_zip(ruta_zip_abs, vigentes, pendientes, max_workers, nivel, estadisticas):
+    """ZIP nuevo con las entradas vigentes copiadas en crudo más los archivos pendientes."""
+    ruta_tmp = f"{ruta_zip_abs}.part"
+    try:
+        with open(ruta_zip_abs, "rb") as fp_origen, zipfile.ZipFile(ruta_tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+            for info in vigentes:
+                _copiar_entrada(zf, fp_origen, info)
+            agregar_archivos(zf, pendientes, max_workers=max_workers, nivel=nivel, estadisticas=estadisticas)
+        os.replace(ruta_tmp, ruta_zip_abs)
+    finally:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+
+
+def _agregar_al_final(ruta_zip_abs, pendientes, eliminados, max_workers, nivel, estadisticas):
+    """
+    Agrega los pendientes al final del ZIP existente (modo "a": se escribe desde el inicio del
+    directorio central) y saca del directorio central las versiones anteriores y los eliminados.
+    Si algo falla a mitad, close() igual escribe un directorio central consistente: las entradas
+    ya reemplazadas salen y las que no alcanzaron a reemplazarse conservan su versión anterior
+    (sus datos siguen en el archivo, antes del punto donde se empezó a escribir).
+    """
+    with zipfile.ZipFile(ruta_zip_abs, "a", zipfile.ZIP_DEFLATED) as zf:
+        nombres = [nombre_zip for _, nombre_zip in pendientes] + [info.filename for info in eliminados]
+        quitar = [zf.NameToInfo.pop(nombre) for nombre in nombres if nombre in zf.NameToInfo]
+        zf._didModify = True
+        completo = False
+        try:
+            agregar_archivos(zf, pendientes, max_workers=max_workers, nivel=nivel, estadisticas=estadisticas)
+            completo = True
+        finally:
+            for info in quitar:
+                if completo or zf.NameToInfo.get(info.filename) is not None:
+                    zf.filelist.remove(info)
+                else:
+                    zf.NameToInfo[info.filename] = info
+
+
+def actualizar_zip(
+    ruta_carpeta, ruta_zip, max_workers=None, nivel=NIVEL_DEFLATE, excluir=None, umbral_compactar=UMBRAL_COMPACTAR
+):
+    """
+    Deja ruta_zip al día con ruta_carpeta leyendo y comprimiendo solo lo que cambió.
+    Si el ZIP no existe o no se puede leer, se crea completo con crear_zip.
+
+    Returns:
+        dict: las estadísticas de crear_zip (sobre lo agregado) más modo ("nuevo", "sin_cambios",
+        "incremental" o "compactado") y la cantidad de archivos vigentes, modificados, nuevos y eliminados
+    """
+    ruta_zip_abs = os.path.abspath(ruta_zip)
+    ruta_tmp = f"{ruta_zip_abs}.part"
+
+    def _excluir(ruta, nombre):
+        if os.path.abspath(ruta) in (ruta_zip_abs, ruta_tmp):
+            return True
+        return bool(excluir and excluir(ruta, nombre))
+
+    inicio = time.perf_counter()
+    archivos = listar_archivos(ruta_carpeta, _excluir)
+    try:
+        with zipfile.ZipFile(ruta_zip_abs) as zf:
+            vigentes, modificados, nuevos, eliminados = _comparar_con_zip(zf, archivos, os.path.getmtime(ruta_zip_abs))
+            inicio_directorio = zf.start_dir
+    except (FileNotFoundError, zipfile.BadZipFile, EOFError, OSError) as e:
+        if os.path.exists(ruta_zip_abs):
+            print(f"[ZIP] No se pudo leer {ruta_zip}, se reconstruye: {e}")
+        estadisticas = crear_zip(ruta_carpeta, ruta_zip, max_workers=max_workers, nivel=nivel, excluir=excluir)
+        estadisticas.update({"modo": "nuevo", "nuevos": estadisticas["archivos"]})
+        return estadisticas
+
+    estadisticas = {
+        "ruta": ruta_zip,
+        "vigentes": len(vigentes),
+        "modificados": len(modificados),
+        "nuevos": len(nuevos),
+        "eliminados": len(eliminados),
+    }
+    pendientes = modificados + nuevos
+    if not pendientes and not eliminados:
+        estadisticas["modo"] = "sin_cambios"
+    else:
+        # Lo que no es una entrada vigente (versiones reemplazadas o eliminadas) queda muerto
+        muertos = max(0, inicio_directorio - sum(_bytes_entrada(info) for info in vigentes))
+        if inicio_directorio and muertos / inicio_directorio > umbral_compactar:
+            estadisticas["modo"] = "compactado"
+            _reescribir_zip(ruta_zip_abs, vigentes, pendientes, max_workers, nivel, estadisticas)
+        else:
+            estadisticas["modo"] = "incremental"
+            _agregar_al_final(ruta_zip_abs, pendientes, eliminados, max_workers, nivel, estadisticas)
+
+    for clave in ("archivos", "comprimidos", "almacenados", "bytes_origen"):
+        estadisticas.setdefault(clave, 0)
+    estadisticas["segundos"] = time.perf_counter() - inicio
+    estadisticas["bytes_zip"] = os.path.getsize(ruta_zip_abs)
+    estadisticas["mb_s"] = estadisticas["bytes_origen"] / (1024 * 1024) / max(estadisticas["segundos"], 1e-9)
+    return estadisticas
+
+
+class ZipEnCurso:
+    """
+    Etapa opcional del pipeline de descarga que agrega cada archivo al ZIP del proceso apenas
+    termina de escribirse, solapando la compresión con la red.
+
+    Uso: abrir(carpeta, ruta_zip) cuando se conoce la carpeta del proceso, agregar(ruta) desde
+    los hilos de descarga (no bloquea) y cerrar() al terminar, que deja el ZIP completo y al día.
+    Si el ZIP ya existía (re-ejecución) no se arma en paralelo: cerrar() lo actualiza en forma
+    incremental con actualizar_zip.
+    """
+
+    def __init__(self, max_workers=None, nivel=NIVEL_DEFLATE, excluir=None):
+        self.max_workers = max_workers
+        self.nivel = nivel
+        self.excluir = excluir
+        self.ruta_carpeta = None
+        self.ruta_zip = None
+        self.estadisticas = {}
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._zf = None
+        self._ruta_tmp = None
+        self._lock = threading.Lock()
+
+    @property
+    def activo(self):
+        """True mientras hay un hilo escritor recibiendo archivos."""
+        return self._hilo is not None
+
+    def abrir(self, ruta_carpeta, ruta_zip):
+        with self._lock:
+            if self.ruta_carpeta is not None:
+                return
+            self.ruta_carpeta = os.path.abspath(ruta_carpeta)
+            self.ruta_zip = ruta_zip
+            if os.path.exists(ruta_zip):
+                return  # re-ejecución: se actualiza al cerrar
+            self._ruta_tmp = f"{os.path.abspath(ruta_zip)}.part"
+            os.makedirs(os.path.dirname(self._ruta_tmp), exist_ok=True)
+            self._zf = zipfile.ZipFile(self._ruta_tmp, "w", zipfile.ZIP_DEFLATED)
+            self._hilo = threading.Thread(target=self._escritor, name="zip_en_curso", daemon=True)
+            self._hilo.start()
+
+    def agregar(self, ruta):
+        """Encola un archivo ya completo de la carpeta del proceso (lo demás se ignora)."""
+        if not self.activo or not ruta:
+            return
+        ruta = os.path.abspath(ruta)
+        nombre_zip = os.path.relpath(ruta, self.ruta_carpeta)
+        if nombre_zip.startswith(os.pardir):
+            return
+        if self.excluir and self.excluir(ruta, os.path.basename(ruta)):
+            return
+        self._cola.put((ruta, nombre_zip.replace(os.sep, "/")))
+
+    def _escritor(self):
+        terminar = False
+        while not terminar:
+            lote = [self._cola.get()]
+            while True:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            if None in lote:
+                terminar = True
+            # Un archivo reemplazado después de agregarse lo corrige la actualización final
+            lote = [
+                item
+                for item in dict.fromkeys(i for i in lote if i is not None)
+                if item[1] not in self._zf.NameToInfo and os.path.isfile(item[0])
+            ]
+            if not lote:
+                continue
+            try:
+                agregar_archivos(
+                    self._zf, lote, max_workers=self.max_workers, nivel=self.nivel, estadisticas=self.estadisticas
+                )
+            except Exception as e:
+                print(f"[ZIP] Error agregando al ZIP en curso (se completará al cerrar): {e}")
+
+    def _detener(self):
+        if self._hilo is None:
+            return
+        self._cola.put(None)
+        self._hilo.join()
+        self._hilo = None
+        self._zf.close()
+        self._zf = None
+
+    def cerrar(self):
+        """
+        Termina de escribir lo encolado, publica el ZIP y lo pone al día con la carpeta.
+        Retorna las estadísticas de actualizar_zip (modo "incremental"/"sin_cambios" si el
+        ZIP en curso ya tenía casi todo) o None si nunca se abrió.
+        """
+        if self.ruta_carpeta is None:
+            return None
+        if self._hilo is not None:
+            try:
+                self._detener()
+                os.replace(self._ruta_tmp, self.ruta_zip)
+            finally:
+                if os.path.exists(self._ruta_tmp):
+                    os.remove(self._ruta_tmp)
+        # Después de _detener: hasta que el hilo escritor termina la cola el contador sigue subiendo
+        agregados = self.estadisticas.get("archivos", 0)
+        estadisticas = actualizar_zip(
+            self.ruta_carpeta, self.ruta_zip, max_workers=self.max_workers, nivel=self.nivel, excluir=self.excluir
+        )
+        estadisticas["en_curso"] = agregados
+        return estadisticas
+
+    def descartar(self):
+        """Detiene el escritor y elimina el ZIP parcial (ej: la descarga falló)."""
+        self._detener()
+        if self._ruta_tmp and os.path.exists(self._ruta_tmp):
+            os.remove(self._ruta_tmp)
+
+
+def describir(estadisticas):
+    """Texto corto para logs: archivos, tamaño y throughput."""
+    return (
+        f"{estadisticas.get('archivos', 0)} archivos "
+        f"({estadisticas.get('comprimidos', 0)} comprimidos, {estadisticas.get('almacenados', 0)} sin comprimir), "
+        f"{estadisticas.get('bytes_origen', 0) / (1024 * 1024):.1f} MB -> "
+        f"{estadisticas.get('bytes_zip', 0) / (1024 * 1024):.1f} MB en {estadisticas.get('segundos', 0):.2f}s "
+        f"({estadisticas.get('mb_s', 0):.1f} MB/s)"
+    )
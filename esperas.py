@@ -0,0 +1,189 @@
+"""
+Esperas por condición para Selenium, en reemplazo de pausas fijas (time.sleep).
+
+- esperar_condicion: WebDriverWait que no lanza excepción (retorna None al expirar).
+- esperar_dom_estable: readyState complete, sin requests fetch/XHR pendientes y sin
+  mutaciones del DOM ni recursos nuevos durante `quieto` segundos.
+- esperar_sin_dialogo: hasta que no quede ningún modal ([role=dialog]) visible.
+
+Con la variable de entorno MP_MEDIR_ESPERAS=1 cada espera registra cuánto tiempo consumió
+y resumen_esperas() imprime el total por tipo de espera.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+MEDIR_ESPERAS = os.environ.get("MP_MEDIR_ESPERAS", "").strip().lower() in ("1", "true", "si", "sí", "yes")
+INTERVALO_SONDEO = 0.1
+
+# Cuenta los fetch/XHR en vuelo del documento. Se registra vía CDP para que corra en cada
+# documento nuevo (incluidos iframes) antes que los scripts de la página.
+_SCRIPT_MONITOR_RED = """
+(function () {
+  if (window.__mpRed) return;
+  var r = window.__mpRed = {pendientes: 0, ultimo: performance.now()};
+  function ini() { r.pendientes++; r.ultimo = performance.now(); }
+  function fin() { r.pendientes = Math.max(0, r.pendientes - 1); r.ultimo = performance.now(); }
+  if (window.fetch) {
+    var fetchOriginal = window.fetch;
+    window.fetch = function () {
+      ini();
+      return fetchOriginal.apply(this, arguments).then(
+        function (x) { fin(); return x; },
+        function (e) { fin(); throw e; }
+      );
+    };
+  }
+  var sendOriginal = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function () {
+    ini();
+    this.addEventListener('loadend', fin);
+    return sendOriginal.apply(this, arguments);
+  };
+})();
+"""
+
+_SCRIPT_ESTADO_PAGINA = """
+var w = window, d = document, ahora = performance.now();
+if (!w.__mpMut) {
+  w.__mpMut = {t: ahora};
+  new MutationObserver(function () { w.__mpMut.t = performance.now(); })
+    .observe(d, {subtree: true, childList: true, attributes: true, characterData: true});
+}
+var red = w.__mpRed;
+return [
+  d.readyState === 'complete',
+  ahora - w.__mpMut.t,
+  red ? red.pendientes : 0,
+  red ? ahora - red.ultimo : 1e9,
+  performance.getEntriesByType('resource').length
+];
+"""
+
+_tiempos = defaultdict(lambda: [0, 0.0, 0])  # nombre -> [llamadas, segundos, expiradas]
+_tiempos_lock = threading.Lock()
+
+
+def _registrar(nombre, segundos, expirada):
+    with _tiempos_lock:
+        registro = _tiempos[nombre]
+        registro[0] += 1
+        registro[1] += segundos
+        registro[2] += 1 if expirada else 0
+
+
+@contextmanager
+def medir(nombre):
+    """
+    Mide el bloque si MP_MEDIR_ESPERAS está activo. El bloque puede marcar expiración
+    asignando estado["expirada"] = True.
+    """
+    estado = {"expirada": False}
+    if not MEDIR_ESPERAS:
+        yield estado
+        return
+    t0 = time.perf_counter()
+    try:
+        yield estado
+    finally:
+        _registrar(nombre, time.perf_counter() - t0, estado["expirada"])
+
+
+def resumen_esperas(reiniciar=True):
+    """Imprime el tiempo consumido por cada tipo de espera (solo con MP_MEDIR_ESPERAS=1)."""
+    if not MEDIR_ESPERAS:
+        return {}
+    with _tiempos_lock:
+        datos = {k: tuple(v) for k, v in _tiempos.items()}
+        if reiniciar:
+            _tiempos.clear()
+    if not datos:
+        return datos
+    total = sum(v[1] for v in datos.values())
+    print(f"[ESPERAS] Tiempo total en esperas: {total:.2f}s")
+    for nombre, (llamadas, segundos, expiradas) in sorted(datos.items(), key=lambda kv: -kv[1][1]):
+        print(
+            f"[ESPERAS]   {nombre:<32} {llamadas:>5} llamadas {segundos:>8.2f}s "
+            f"(prom {segundos / llamadas:.3f}s, expiradas {expiradas})"
+        )
+    return datos
+
+
+def instalar_monitor_red(driver):
+    """Registra el contador de fetch/XHR en los documentos nuevos y en el actual (idempotente)."""
+    if getattr(driver, "_mp_monitor_red", False):
+        return
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": _SCRIPT_MONITOR_RED})
+        driver._mp_monitor_red = True
+    except Exception:
+        pass  # driver sin CDP: se usa solo Resource Timing y mutaciones
+    try:
+        driver.execute_script(_SCRIPT_MONITOR_RED)
+    except Exception:
+        pass
+
+
+def esperar_condicion(driver, condicion, timeout=10, nombre="condicion"):
+    """WebDriverWait(driver, timeout).until(condicion) que retorna None al expirar en vez de lanzar."""
+    with medir(nombre) as estado:
+        try:
+            return WebDriverWait(driver, timeout, poll_frequency=INTERVALO_SONDEO).until(condicion)
+        except TimeoutException:
+            estado["expirada"] = True
+            return None
+
+
+def esperar_dom_estable(driver, timeout=10, quieto=0.3, nombre="dom_estable"):
+    """
+    Espera a que la página (o el frame actual) quede quieta: readyState complete, ningún
+    fetch/XHR en vuelo y `quieto` segundos sin mutaciones del DOM, sin actividad de red ni
+    recursos nuevos en Resource Timing. Retorna True si se logró antes de timeout.
+    """
+    if not driver:
+        return False
+    instalar_monitor_red(driver)
+    quieto_ms = quieto * 1000
+    with medir(nombre) as estado:
+        limite = time.monotonic() + timeout
+        recursos_previos = None
+        recursos_desde = time.monotonic()
+        while time.monotonic() < limite:
+            try:
+                listo, sin_mutar_ms, pendientes, sin_red_ms, recursos = driver.execute_script(_SCRIPT_ESTADO_PAGINA)
+            except Exception:
+                listo = False
+            else:
+                if recursos != recursos_previos:
+                    recursos_previos = recursos
+                    recursos_desde = time.monotonic()
+                if (
+                    listo
+                    and not pendientes
+                    and sin_mutar_ms >= quieto_ms
+                    and sin_red_ms >= quieto_ms
+                    and time.monotonic() - recursos_desde >= quieto
+                ):
+                    return True
+            time.sleep(INTERVALO_SONDEO)
+        estado["expirada"] = True
+        return False
+
+
+def hay_dialogo_visible(driver):
+    """True si hay algún modal ([role=dialog]) visible; ante elementos stale también True."""
+    try:
+        return any(e.is_displayed() for e in driver.find_elements(By.CSS_SELECTOR, "[role='dialog']"))
+    except Exception:
+        return True  # elemento stale: el modal está cambiando, se vuelve a sondear
+
+
+def esperar_sin_dialogo(driver, timeout=5, nombre="cierre_dialogo"):
+    """Espera a que no quede ningún modal visible (tras hacer click en Cerrar o ESC)."""
+    return bool(esperar_condicion(driver, lambda d: not hay_dialogo_visible(d), timeout=timeout, nombre=nombre))
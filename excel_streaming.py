@@ -0,0 +1,104 @@
+"""
+Libros Excel en modo write-only (openpyxl) para los resúmenes de compras ágiles y licitaciones.
+
+Las filas se escriben en streaming a disco, así que una hoja de detalle con decenas de miles
+de adjuntos no se mantiene en memoria. Los formatos son NamedStyles registrados una vez por
+libro: cada celda guarda solo el nombre del estilo, no objetos Font/Fill/Border propios.
+
+En write-only no se puede volver sobre una celda ya escrita ni combinar celdas: los anchos
+de columna y paneles fijos se definen antes de agregar filas y el estilo va en cada celda.
+"""
+from copy import copy
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+_BORDE_FINO = Side(style="thin")
+_BORDE = Border(left=_BORDE_FINO, right=_BORDE_FINO, top=_BORDE_FINO, bottom=_BORDE_FINO)
+
+
+def _estilos():
+    return [
+        NamedStyle(
+            name="mp_titulo",
+            font=Font(size=14, bold=True, color="FFFFFF"),
+            fill=PatternFill(start_color="366092", end_color="366092", fill_type="solid"),
+        ),
+        NamedStyle(
+            name="mp_encabezado",
+            font=Font(bold=True),
+            fill=PatternFill(start_color="D9E2F3", end_color="D9E2F3", fill_type="solid"),
+            alignment=Alignment(horizontal="center", vertical="center"),
+            border=_BORDE,
+        ),
+        NamedStyle(name="mp_etiqueta", font=Font(bold=True)),
+        NamedStyle(name="mp_celda", border=_BORDE),
+        NamedStyle(name="mp_numero", border=_BORDE, number_format="#,##0"),
+    ]
+
+
+TITULO = "mp_titulo"
+ENCABEZADO = "mp_encabezado"
+ETIQUETA = "mp_etiqueta"
+CELDA = "mp_celda"
+NUMERO = "mp_numero"
+
+
+def nuevo_libro():
+    """Workbook write-only con los estilos compartidos registrados."""
+    wb = Workbook(write_only=True)
+    for estilo in _estilos():
+        wb.add_named_style(estilo)
+    return wb
+
+
+def nueva_hoja(wb, titulo, anchos=None, fijar=None):
+    """
+    Crea una hoja; anchos es la lista de anchos de columna (A, B, ...) y fijar la celda
+    de paneles fijos (ej: "A4" deja fijas las 3 primeras filas).
+    """
+    ws = wb.create_sheet(titulo)
+    for idx, ancho in enumerate(anchos or [], start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = ancho
+    if fijar:
+        ws.freeze_panes = fijar
+    return ws
+
+
+def fila(ws, valores, estilo=None):
+    """
+    Agrega una fila. estilo es un nombre de estilo para todas las celdas o una lista con un
+    estilo (o None) por columna.
+    """
+    if estilo is None:
+        ws.append(list(valores))
+        return
+    estilos = estilo if isinstance(estilo, (list, tuple)) else None
+    # Resolver un NamedStyle por nombre es lo más caro de cada celda: se resuelve una vez por
+    # hoja y las celdas siguientes copian el arreglo de índices de estilo ya calculado.
+    resueltos = ws.__dict__.setdefault("_mp_estilos", {})
+    celdas = []
+    for idx, valor in enumerate(valores):
+        celda = WriteOnlyCell(ws, value=valor)
+        nombre = estilos[idx] if estilos is not None else estilo
+        if nombre:
+            if nombre in resueltos:
+                celda._style = copy(resueltos[nombre])
+            else:
+                celda.style = nombre
+                resueltos[nombre] = celda._style
+        celdas.append(celda)
+    ws.append(celdas)
+
+
+def tabla(ws, encabezados, filas, estilos_columnas=None):
+    """Encabezado + filas (iterable, se consume en streaming) con bordes. Retorna cuántas filas escribió."""
+    fila(ws, encabezados, ENCABEZADO)
+    estilos = estilos_columnas or [CELDA] * len(encabezados)
+    total = 0
+    for valores in filas:
+        fila(ws, valores, estilos)
+        total += 1
+    return total
@@ -1,18 +1,40 @@
 # flujo_licitacion.py
 # Flujo de prueba para licitaciones (scraping, sin API) hasta anexos administrativos/técnicos/económicos.
 
+import json
 import os
 import re
+import threading
 import time
+from html import unescape
 from urllib.parse import urljoin, unquote, urlparse
 
-import requests
 import descarga_ca
+import motor_descargas
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
 BUSCADOR_URL = "https://mercadopublico.cl/Procurement/Modules/RFB/SearchAcquisitions.aspx"
+FICHA_URL = "https://www.mercadopublico.cl/Procurement/Modules/RFB/DetailsAcquisition.aspx"
+
+# Caché código -> ficha (url, nombre_proyecto, carpeta) en <base_dir>/.cache_licitaciones.json,
+# para no volver a pasar por el buscador al repetir o retomar una licitación; 0 días = sin caché
+CACHE_LICITACIONES_FILENAME = ".cache_licitaciones.json"
+CACHE_LICITACIONES_TTL_DIAS = 30
+_cache_licitaciones_lock = threading.Lock()
+
+_LINK_RESULTADO_RE = re.compile(r"<a\b[^>]*hlkNumAcquisition[^>]*>(.*?)</a>", re.IGNORECASE | re.DOTALL)
+_URL_FICHA_RE = re.compile(r"DetailsAcquisition\.aspx\?[^\"'\s<>)]+", re.IGNORECASE)
+_TAGS_RE = re.compile(r"<[^>]+>")
+# Mismo orden que los xpaths de extraer_nombre_licitacion; el <title> queda como último recurso
+_NOMBRE_FICHA_RES = [
+    re.compile(r"<span\b[^>]*\bid=\"[^\"]*lblNombre[^\"]*\"[^>]*>(.*?)</span>", re.IGNORECASE | re.DOTALL),
+    re.compile(r"<span\b[^>]*\bid=\"[^\"]*lblAdquisicion[^\"]*\"[^>]*>(.*?)</span>", re.IGNORECASE | re.DOTALL),
+    re.compile(r"<h1\b[^>]*>(.*?)</h1>", re.IGNORECASE | re.DOTALL),
+    re.compile(r"<h2\b[^>]*>(.*?)</h2>", re.IGNORECASE | re.DOTALL),
+    re.compile(r"<title\b[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL),
+]
 
 
 def obtener_url_licitacion(codigo_lici, driver, timeout=20):
@@ -78,6 +100,192 @@ def obtener_url_licitacion(codigo_lici, driver, timeout=20):
     return url_ficha
 
 
+def extraer_nombre_licitacion(url_directa, codigo, driver):
+    """Nombre del proyecto desde la ficha de la licitación (sin el código ni frases genéricas)."""
+    if not driver or not url_directa:
+        return ""
+    try:
+        driver.get(url_directa)
+        WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+    except Exception:
+        return ""
+
+    xpaths = [
+        "//span[contains(@id,'lblNombre') and normalize-space()]",
+        "//span[contains(@id,'lblAdquisicion') and normalize-space()]",
+        "//h1[normalize-space()]",
+        "//h2[normalize-space()]",
+        "//div[contains(@class,'title') and normalize-space()]",
+        "//div[contains(@class,'titulo') and normalize-space()]",
+    ]
+    for xp in xpaths:
+        try:
+            elem = driver.find_element(By.XPATH, xp)
+        except Exception:
+            continue
+        texto = (elem.text or "").strip()
+        if texto:
+            return descarga_ca._limpiar_nombre_proyecto(codigo, texto)
+
+    try:
+        titulo = (driver.title or "").strip()
+    except Exception:
+        titulo = ""
+    return descarga_ca._limpiar_nombre_proyecto(codigo, titulo) if titulo else ""
+
+
+def obtener_ficha_http(codigo_lici, session, timeout=20):
+    """
+    Ficha de la licitación sin navegador: {"url", "html"} o None si no se encontró.
+
+    Primero pide DetailsAcquisition.aspx?idlicitacion=<código>; si esa página no es la ficha del
+    código, emula el postback del buscador (txt_Nombre + buttonSearchByAll) con los campos ocultos
+    de la página y sigue el link hlkNumAcquisition del resultado.
+    """
+    try:
+        resp = session.get(FICHA_URL, params={"idlicitacion": codigo_lici}, timeout=timeout)
+        if resp.ok and _es_ficha(resp.text, codigo_lici):
+            print(f"[HTTP] Ficha por idlicitacion: {resp.url}")
+            return {"url": resp.url, "html": resp.text}
+    except Exception as e:
+        print(f"[HTTP] Error pidiendo la ficha por idlicitacion: {e}")
+
+    try:
+        resp = session.get(BUSCADOR_URL, timeout=timeout)
+        resp.raise_for_status()
+        formulario = motor_descargas.parsear_formulario_aspnet(resp.text)
+        datos = motor_descargas.datos_postback(formulario, "buttonSearchByAll")
+        datos[formulario["nombres"].get("txt_Nombre", "txt_Nombre")] = codigo_lici
+        accion = urljoin(resp.url, formulario["action"] or BUSCADOR_URL)
+        resp = session.post(accion, data=datos, timeout=timeout, headers={"Referer": resp.url})
+        resp.raise_for_status()
+        url_ficha = _url_resultado_busqueda(resp.text, codigo_lici, resp.url)
+        if not url_ficha:
+            print(f"[HTTP] El buscador no devolvió la licitación {codigo_lici}.")
+            return None
+        resp = session.get(url_ficha, timeout=timeout, headers={"Referer": accion})
+        resp.raise_for_status()
+    except Exception as e:
+        print(f"[HTTP] Error buscando la licitación sin navegador: {e}")
+        return None
+    if not _es_ficha(resp.text, codigo_lici):
+        return None
+    print(f"[HTTP] Ficha por buscador: {resp.url}")
+    return {"url": resp.url, "html": resp.text}
+
+
+def _es_ficha(html, codigo_lici):
+    """True si el HTML es la ficha (DetailsAcquisition) de la licitación indicada."""
+    html = html or ""
+    return "lblNumLicitacion" in html and codigo_lici.lower() in html.lower()
+
+
+def _url_resultado_busqueda(html, codigo_lici, base_url):
+    """URL de la ficha en la grilla de resultados: el link con el código exacto o, si no, el primero."""
+    candidatos = []
+    for m in _LINK_RESULTADO_RE.finditer(html or ""):
+        url = _URL_FICHA_RE.search(m.group(0))
+        if not url:
+            continue
+        texto = " ".join(unescape(_TAGS_RE.sub("", m.group(1))).split())
+        if texto == codigo_lici:
+            candidatos.insert(0, url.group(0))
+        else:
+            candidatos.append(url.group(0))
+    return urljoin(base_url, unescape(candidatos[0])) if candidatos else ""
+
+
+def nombre_licitacion_desde_html(html, codigo):
+    """Lo mismo que extraer_nombre_licitacion pero sobre el HTML de la ficha ya descargado."""
+    for patron in _NOMBRE_FICHA_RES:
+        for m in patron.finditer(html or ""):
+            texto = " ".join(unescape(_TAGS_RE.sub("", m.group(1))).split())
+            if texto:
+                return descarga_ca._limpiar_nombre_proyecto(codigo, texto)
+    return ""
+
+
+def configurar_cache_licitaciones(ttl_dias=None):
+    """Cambia la vigencia (días, 0 = desactivada) de la caché de fichas de licitación."""
+    global CACHE_LICITACIONES_TTL_DIAS
+    if ttl_dias is not None:
+        CACHE_LICITACIONES_TTL_DIAS = max(0.0, float(ttl_dias))
+
+
+def leer_cache_licitacion(codigo, base_dir="Descargas"):
+    """
+    Ficha guardada para el código: {"url", "nombre_proyecto", "carpeta", "guardado_en"} con la
+    carpeta ya unida a base_dir, o None si no hay o venció.
+    """
+    if CACHE_LICITACIONES_TTL_DIAS <= 0:
+        return None
+    with _cache_licitaciones_lock:
+        entrada = _cargar_cache_licitaciones(base_dir).get(codigo)
+    if not isinstance(entrada, dict) or not entrada.get("url"):
+        return None
+    if time.time() - float(entrada.get("guardado_en") or 0) > CACHE_LICITACIONES_TTL_DIAS * 86400:
+        return None
+    entrada = dict(entrada)
+    carpeta = entrada.get("carpeta") or ""
+    entrada["carpeta"] = os.path.join(base_dir, carpeta) if carpeta else ""
+    entrada["nombre_proyecto"] = entrada.get("nombre_proyecto") or ""
+    return entrada
+
+
+def guardar_cache_licitacion(codigo, base_dir="Descargas", url=None, nombre_proyecto="", carpeta=None):
+    """
+    Guarda (url=None: borra) la ficha del código. La carpeta se guarda relativa a base_dir para
+    que la caché siga sirviendo si se mueve la carpeta de descargas.
+    """
+    if CACHE_LICITACIONES_TTL_DIAS <= 0:
+        return
+    with _cache_licitaciones_lock:
+        cache = _cargar_cache_licitaciones(base_dir)
+        if url:
+            cache[codigo] = {
+                "url": url,
+                "nombre_proyecto": nombre_proyecto or "",
+                "carpeta": os.path.relpath(carpeta, base_dir) if carpeta else "",
+                "guardado_en": time.time(),
+            }
+        elif cache.pop(codigo, None) is None:
+            return
+        ruta = os.path.join(base_dir, CACHE_LICITACIONES_FILENAME)
+        try:
+            os.makedirs(base_dir, exist_ok=True)
+            with open(f"{ruta}.part", "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+            os.replace(f"{ruta}.part", ruta)
+        except Exception as e:
+            print(f"[CACHE] No se pudo guardar la caché de licitaciones: {e}")
+
+
+def _cargar_cache_licitaciones(base_dir):
+    return descarga_ca._cargar_manifest(os.path.join(base_dir, CACHE_LICITACIONES_FILENAME))
+
+
+def guardar_manifest_licitacion(codigo, resumen, base_dir="Descargas", carpeta_base=None, nombre_proyecto=None):
+    """Guarda el resumen de la descarga como manifest_licitacion.json; retorna su ruta o None."""
+    try:
+        if not carpeta_base:
+            carpeta_base = descarga_ca.resolver_carpeta_base(base_dir, "Licitaciones", codigo)
+        os.makedirs(carpeta_base, exist_ok=True)
+        ruta = os.path.join(carpeta_base, descarga_ca.MANIFEST_LICITACION_FILENAME)
+        data = resumen or {}
+        if "archivos" not in data:
+            # Conservar el ledger de descargas previo aunque esta ejecución no haya llegado a descargar
+            data["archivos"] = descarga_ca._cargar_manifest(ruta).get("archivos") or []
+        data["codigo"] = codigo
+        if nombre_proyecto:
+            data["nombre_proyecto"] = nombre_proyecto
+        data["generado_en"] = time.time()
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        return ruta
+    except Exception:
+        return None
+
+
 def test_flujo_licitacion(codigo_lici, driver, carpeta_base="Descargas/Licitaciones", url_directa=None):
     """
     Ejecuta el flujo de licitación:
@@ -460,82 +668,35 @@ def _descargar_adjuntos_popup(driver, session, carpeta_destino):
 
 def _descargar_adjuntos_viewbid(session, url, carpeta_destino):
     """
-    Descarga adjuntos desde ViewBidAttachment.aspx replicando la lógica robusta de scrape_cuadro.py.
+    Descarga los adjuntos de ViewBidAttachment.aspx (todas las páginas) con motor_descargas,
+    el mismo motor que usa scrape_cuadro. Retorna (descargados, errores).
     """
-    descargados = 0
-    errores = []
     if not url:
-        return descargados, errores
+        return 0, []
 
     try:
         session.headers.setdefault("Referer", url)
     except Exception:
         pass
 
-    pending_pages = ["1"]
-    processed_pages = set()
-    state = {}
-    os.makedirs(carpeta_destino, exist_ok=True)
-
-    while pending_pages:
-        page = pending_pages.pop(0)
-        if page in processed_pages:
-            continue
-        processed_pages.add(page)
-
-        try:
-            if page == "1":
-                resp = session.get(url, timeout=30)
-            else:
-                data = state.copy()
-                data["__EVENTTARGET"] = "DWNL$grdId"
-                data["__EVENTARGUMENT"] = f"Page${page}"
-                resp = session.post(url, data=data, timeout=30)
-            resp.raise_for_status()
-        except Exception as exc:
-            errores.append(f"Error al obtener popup página {page}: {exc}")
-            continue
-
-        html = resp.text
-        state = _parse_state(html)
-        search_names = re.findall(r'name="(DWNL\$grdId\$ctl\d+\$search)"', html)
-        page_links = re.findall(r"__doPostBack\\('DWNL\$grdId','Page\$(\d+)'", html)
-        for p in page_links:
-            if p not in processed_pages and p not in pending_pages:
-                pending_pages.append(p)
-
-        meta = _parse_popup_metadata(html)
-        for idx, name in enumerate(search_names, start=1):
-            data = state.copy()
-            data["__EVENTTARGET"] = name
-            data["__EVENTARGUMENT"] = ""
-            data[name + ".x"] = "10"
-            data[name + ".y"] = "10"
-            data.setdefault("DWNL$ctl10", "")
-            try:
-                r = session.post(url, data=data, stream=True, timeout=60)
-                r.raise_for_status()
-            except Exception as exc:
-                errores.append(f"Error al postear {name} (página {page}): {exc}")
-                continue
+    resultado = _motor_flujo().descargar_trabajo(
+        motor_descargas.TrabajoDescarga(url, carpeta_destino, nombre_hint="adjunto"), session
+    )
+    for archivo in resultado["archivos"]:
+        print(f"[LICI] Descargado desde popup: {archivo['ruta']}")
+    return len(resultado["archivos"]), resultado["errores"]
 
-            ctl = name.split("$")[-2] if "$" in name else ""
-            file_name, _file_type = meta.get(ctl, ("", ""))
-            saved = _guardar_stream_descarga(
-                r,
-                carpeta_destino,
-                name_hint=f"{page}_{idx}",
-                file_name=file_name,
-                fallback_ext=_guess_ext(r.headers.get("content-type", "")),
-            )
-            if saved:
-                descargados += 1
 
-    return descargados, errores
+def _motor_flujo():
+    # Flujo de depuración: secuencial (comparte la sesión del navegador) y sin sobrescribir archivos
+    return motor_descargas.MotorDescargas(
+        concurrencia=motor_descargas.PoliticaConcurrencia(max_workers=1),
+        almacenamiento=motor_descargas.AlmacenamientoCarpeta(sobrescribir=False),
+    )
 
 
 def _requests_session_from_driver(driver):
-    session = requests.Session()
+    session = motor_descargas.sesion_resiliente()
     try:
         for cookie in driver.get_cookies():
             session.cookies.set(cookie["name"], cookie["value"])
@@ -591,108 +752,14 @@ def _inferir_nombre(url, texto):
 
 
 def _descargar_archivo(session, url, carpeta, nombre):
-    os.makedirs(carpeta, exist_ok=True)
-    resp = session.get(url, stream=True, timeout=60)
-    resp.raise_for_status()
-
-    # Si content-disposition trae un nombre, usarlo
-    dispo = resp.headers.get("content-disposition") or resp.headers.get("Content-Disposition")
-    if dispo:
-        m = re.search(r"filename\\*=(?:UTF-8''|utf-8'')?([^;]+)", dispo)
-        if m:
-            candidato = unquote(m.group(1).strip().strip('"').strip("'"))
-            if candidato:
-                nombre = candidato
-        else:
-            m = re.search(r"filename=([^;]+)", dispo)
-            if m:
-                candidato = m.group(1).strip().strip('"').strip("'")
-                if candidato:
-                    nombre = candidato
-
-    nombre = _asegurar_nombre_unico(carpeta, _limpiar_nombre_archivo(nombre))
-    ruta = os.path.join(carpeta, nombre)
-    with open(ruta, "wb") as f:
-        for chunk in resp.iter_content(chunk_size=8192):
-            f.write(chunk)
+    resultado = _motor_flujo().descargar_trabajo(motor_descargas.TrabajoDescarga(url, carpeta, nombre_hint=nombre), session)
+    if resultado["errores"]:
+        raise RuntimeError("; ".join(resultado["errores"]))
+    ruta = resultado["archivos"][0]["ruta"]
     print(f"[LICI] Descargado: {ruta}")
     return ruta
 
 
-def _extract_hidden(html, field):
-    m = re.search(rf'name="{re.escape(field)}"[^>]*value="([^"]*)"', html)
-    return m.group(1) if m else ""
-
-
-def _parse_state(html):
-    state = {}
-    for field in ("__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION"):
-        val = _extract_hidden(html, field)
-        if val:
-            state[field] = val
-    return state
-
-
-def _parse_popup_metadata(html):
-    """
-    Devuelve un dict ctlXX -> (filename, type) del grid DWNL.
-    """
-    meta = {}
-    rows = re.findall(
-        r'id="DWNL_grdId_(ctl\d+)_File">([^<]+)</span>.*?id="DWNL_grdId_\1_Type">([^<]+)</span>',
-        html,
-        flags=re.DOTALL,
-    )
-    for ctl, fname, ftype in rows:
-        meta[ctl] = (fname.strip(), ftype.strip())
-    return meta
-
-
-def _filename_from_disposition(dispo):
-    m = re.search(r'filename="?([^";]+)"?', dispo or "")
-    return m.group(1) if m else ""
-
-
-def _guess_ext(content_type):
-    """Devuelve una extensión simple a partir del content-type."""
-    ct = (content_type or "").lower()
-    if "pdf" in ct:
-        return ".pdf"
-    if "zip" in ct:
-        return ".zip"
-    if "msword" in ct or "officedocument" in ct or "doc" in ct:
-        return ".doc"
-    if "excel" in ct or "spreadsheet" in ct or "xls" in ct:
-        return ".xls"
-    if "xml" in ct:
-        return ".xml"
-    if "jpeg" in ct:
-        return ".jpg"
-    if "png" in ct:
-        return ".png"
-    return ".bin"
-
-
-def _guardar_stream_descarga(resp, carpeta_destino, name_hint, file_name="", fallback_ext=".bin"):
-    dispo = resp.headers.get("content-disposition") or resp.headers.get("Content-Disposition") or ""
-    fname = file_name or _filename_from_disposition(dispo)
-    if not fname:
-        ext = fallback_ext if fallback_ext.startswith(".") else f".{fallback_ext or 'bin'}"
-        fname = f"{name_hint}{ext}"
-    safe_name = _asegurar_nombre_unico(carpeta_destino, _limpiar_nombre_archivo(fname))
-    path = os.path.join(carpeta_destino, safe_name)
-    try:
-        with open(path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        print(f"[LICI] Descargado desde popup: {path}")
-        return path
-    except Exception as exc:
-        print(f"[LICI] Error guardando {path}: {exc}")
-        return ""
-
-
 def _click_y_capturar_nueva_ventana(driver, elemento):
     handles_prev = driver.window_handles[:]
     print(f"[LICI] Handles antes de click: {handles_prev}")
@@ -830,18 +897,6 @@ def _debug_dump_context(driver, label):
         pass
 
 
-def _asegurar_nombre_unico(carpeta, nombre):
-    base, ext = os.path.splitext(nombre)
-    if not base:
-        base = "archivo"
-    candidato = f"{base}{ext}"
-    i = 2
-    while os.path.exists(os.path.join(carpeta, candidato)):
-        candidato = f"{base} ({i}){ext}"
-        i += 1
-    return candidato
-
-
 def _limpiar_nombre_archivo(nombre, max_len=160):
     nombre = (nombre or "").strip()
     nombre = re.sub(r'[<>:"/\\\\|?*]', "_", nombre)
@@ -1,5 +1,4 @@
 import configparser
-import re
 import json
 import os
 import threading
@@ -10,15 +9,13 @@ from tkinter import filedialog, messagebox, ttk
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 
 import descarga_ca
+import esperas
 import flujo_licitacion
-import genera_xls_ca
-import genera_xls_lici
-import scrape_cuadro
+import lote
+import motor_descargas
+import pool_impresion
 
 
 class DescargadorProduccionApp:
@@ -35,6 +32,7 @@ class DescargadorProduccionApp:
         )
 
         self.driver = None
+        self.pool_impresion = None
         self.navegador_iniciado = False
         self.token_guardado = False
         self._token_poll_after_id = None
@@ -385,6 +383,11 @@ class DescargadorProduccionApp:
                 pass
             self._token_poll_after_id = None
 
+        if self.pool_impresion:
+            descarga_ca.configurar_pool_impresion(None)
+            self.pool_impresion.cerrar()
+            self.pool_impresion = None
+
         if self.driver:
             try:
                 self.driver.quit()
@@ -470,18 +473,23 @@ class DescargadorProduccionApp:
             if tipo == "compra_agil" and not self._asegurar_token_compra_agil(mostrar_mensaje=True):
                 return
 
-            exitosos = []
-            fallidos = []
-            for idx, codigo in enumerate(codigos, 1):
-                self.status_var.set(f"Procesando {codigo} ({idx}/{total})...")
-                if tipo == "compra_agil":
-                    ok = self._proceso_compra_agil(codigo, mostrar_mensaje=mostrar_mensajes)
-                else:
-                    ok = self._proceso_licitacion(codigo, mostrar_mensaje=mostrar_mensajes)
-                if ok:
-                    exitosos.append(codigo)
-                else:
-                    fallidos.append(codigo)
+            if total > 1 and self._workers_lote(tipo) > 1:
+                resumen = self._proceso_lote(codigos, tipo)
+                exitosos = resumen["exitosos"]
+                fallidos = resumen["fallidos"]
+            else:
+                exitosos = []
+                fallidos = []
+                for idx, codigo in enumerate(codigos, 1):
+                    self.status_var.set(f"Procesando {codigo} ({idx}/{total})...")
+                    if tipo == "compra_agil":
+                        ok = self._proceso_compra_agil(codigo, mostrar_mensaje=mostrar_mensajes)
+                    else:
+                        ok = self._proceso_licitacion(codigo, mostrar_mensaje=mostrar_mensajes)
+                    if ok:
+                        exitosos.append(codigo)
+                    else:
+                        fallidos.append(codigo)
 
             if not mostrar_mensajes:
                 if fallidos and exitosos:
@@ -508,46 +516,98 @@ class DescargadorProduccionApp:
             messagebox.showerror("Error", f"Error inesperado al procesar:\n{exc}")
             self.status_var.set("Error general")
         finally:
+            esperas.resumen_esperas()
             self.btn_procesar.configure(state="normal")
             if self.navegador_iniciado:
                 self.btn_listo.configure(state="normal")
 
-    def _proceso_compra_agil(self, codigo, mostrar_mensaje=True):
+    def _proceso_lote(self, codigos, tipo):
+        """
+        Procesa varios códigos en paralelo con lote.ejecutar_lote. Las compras ágiles van solo
+        por API (sin navegador); las licitaciones van por HTTP y, si eso falla, toman un Chrome
+        headless propio de un pool con las cookies de la sesión interactiva.
+        """
         base_dir = self._normalizar_base_descargas()
-        if not self._asegurar_token_compra_agil(mostrar_mensaje=mostrar_mensaje):
-            return False
-
-        self.status_var.set(f"Descargando adjuntos de compra agil {codigo}...")
-        ok = descarga_ca.descargar_compra_agil_api(codigo, driver=self.driver, base_dir=base_dir)
-        if not ok:
-            if mostrar_mensaje:
-                messagebox.showerror("Descarga", "No se pudieron descargar los adjuntos de la compra agil.")
-            self.status_var.set("Fallo descarga compra agil")
-            return False
+        self._configurar_cache_certificados(base_dir)
+        self._configurar_cache_licitaciones()
+        self._preparar_pool_impresion()
+        estado = {"en_curso": set()}
+        lock = threading.Lock()
+
+        def _al_progresar(codigo, evento, hechos, total):
+            with lock:
+                if evento == "iniciado":
+                    estado["en_curso"].add(codigo)
+                else:
+                    estado["en_curso"].discard(codigo)
+                    estado["hechos"] = hechos
+                en_curso = ", ".join(sorted(estado["en_curso"]))
+                listos = estado.get("hechos", 0)
+            self.status_var.set(f"Lote: {listos}/{total} listos. En curso: {en_curso or '-'}")
+
+        if tipo == "compra_agil":
+            return lote.ejecutar_lote(
+                codigos,
+                lambda codigo: self._proceso_compra_agil(codigo, mostrar_mensaje=False, en_lote=True),
+                max_workers=self._workers_lote(tipo),
+                al_progresar=_al_progresar,
+            )
 
-        carpeta = descarga_ca.resolver_carpeta_base(base_dir, "ComprasAgiles", codigo)
+        navegadores = pool_impresion.PoolImpresion(self._navegadores_lote(), driver_origen=self.driver)
         try:
-            self.status_var.set("Generando ZIP de compra agil...")
-            zip_destino = os.path.join(os.path.dirname(carpeta), f"{os.path.basename(carpeta)}.zip")
-            descarga_ca.crear_zip_carpeta(carpeta, zip_destino)
+            cookies = self.driver.get_cookies() if self.driver else []
         except Exception:
-            pass
+            cookies = []
+
+        def _procesar_licitacion(codigo):
+            return self._proceso_licitacion(
+                codigo,
+                mostrar_mensaje=False,
+                en_lote=True,
+                prestar_navegador=navegadores.prestar,
+                cookies=cookies,
+            )
+
+        try:
+            return lote.ejecutar_lote(
+                codigos,
+                _procesar_licitacion,
+                max_workers=self._workers_lote(tipo),
+                al_progresar=_al_progresar,
+            )
+        finally:
+            navegadores.cerrar()
 
-        self.status_var.set("Generando Excel de compra agil...")
-        ruta_excel = genera_xls_ca.generar_excel_compra_agil(
+    def _proceso_compra_agil(self, codigo, mostrar_mensaje=True, en_lote=False):
+        """en_lote: llamado desde _proceso_lote en un hilo del pool; no usa el navegador interactivo."""
+        base_dir = self._normalizar_base_descargas()
+        if not en_lote:
+            self._configurar_cache_certificados(base_dir)
+            self._preparar_pool_impresion()
+        if not self._asegurar_token_compra_agil(mostrar_mensaje=mostrar_mensaje):
+            return False
+
+        resultado = lote.procesar_compra_agil(
             codigo,
-            self.driver,
             base_dir=base_dir,
-            carpeta_base=carpeta,
+            driver=None if en_lote else self.driver,
+            almacen_blobs=self._almacen_blobs(base_dir),
+            zip_en_curso=self._zip_en_curso(),
+            zip_incremental=self._zip_incremental(),
+            al_avanzar=self.status_var.set,
         )
-        if ruta_excel:
+        if resultado["ok"]:
             self.status_var.set(f"Flujo completado: {codigo}")
             if mostrar_mensaje:
                 messagebox.showinfo(
                     "Proceso completado",
-                    f"Compra agil {codigo} procesada.\n\nExcel generado en:\n{ruta_excel}",
+                    f"Compra agil {codigo} procesada.\n\nExcel generado en:\n{resultado['ruta_excel']}",
                 )
             return True
+        if resultado["etapa"] == "descarga":
+            if mostrar_mensaje:
+                messagebox.showerror("Descarga", "No se pudieron descargar los adjuntos de la compra agil.")
+            self.status_var.set("Fallo descarga compra agil")
         else:
             self.status_var.set("Excel no generado")
             if mostrar_mensaje:
@@ -555,72 +615,46 @@ class DescargadorProduccionApp:
                     "Excel",
                     "La descarga termino pero el Excel no se genero correctamente.",
                 )
-            return False
+        return False
 
-    def _proceso_licitacion(self, codigo, mostrar_mensaje=True):
+    def _proceso_licitacion(self, codigo, mostrar_mensaje=True, en_lote=False, prestar_navegador=None, cookies=None):
+        """
+        en_lote: llamado desde _proceso_lote en un hilo del pool; no usa el navegador interactivo
+        y, si hace falta Selenium, toma uno propio con prestar_navegador.
+        """
         base_dir = self._normalizar_base_descargas()
-        self.status_var.set(f"Descargando adjuntos de licitacion {codigo}...")
-        url_directa = flujo_licitacion.obtener_url_licitacion(codigo, self.driver)
-        if not url_directa:
-            resumen = {"ok": False, "proveedores": [], "errores": ["No se pudo obtener la URL de la licitación."]}
-        else:
-            nombre_proyecto = self._extraer_nombre_licitacion(url_directa, codigo)
-            carpeta_licitacion = descarga_ca.resolver_carpeta_base(
-                base_dir, "Licitaciones", codigo, nombre_proyecto
-            )
-            resumen = scrape_cuadro.descargar_adjuntos_desde_url(
-                url_directa,
-                self.driver,
-                codigo=codigo,
-                download_dir=carpeta_licitacion,
-            )
-            if isinstance(resumen, dict):
-                resumen.setdefault("url", url_directa)
-        if not url_directa:
-            nombre_proyecto = ""
-            carpeta_licitacion = descarga_ca.resolver_carpeta_base(base_dir, "Licitaciones", codigo)
-        manifest_path = self._guardar_manifest_licitacion(
+        if not en_lote:
+            self._configurar_cache_certificados(base_dir)
+            self._configurar_cache_licitaciones()
+            self._preparar_pool_impresion()
+        resultado = lote.procesar_licitacion(
             codigo,
-            resumen,
+            driver=None if en_lote else self.driver,
             base_dir=base_dir,
-            carpeta_base=carpeta_licitacion,
-            nombre_proyecto=nombre_proyecto,
+            almacen_blobs=self._almacen_blobs(base_dir),
+            zip_en_curso=self._zip_en_curso(),
+            zip_incremental=self._zip_incremental(),
+            al_avanzar=self.status_var.set,
+            prestar_navegador=prestar_navegador,
+            http=self._licitacion_http(),
+            cookies=cookies,
         )
-
-        if not resumen.get("ok"):
-            errores = "\n".join(resumen.get("errores") or [])
-            if mostrar_mensaje:
-                messagebox.showwarning(
-                    "Licitacion",
-                    f"No se pudieron descargar adjuntos de la licitacion.\n{errores}",
-                )
-            self.status_var.set("Fallo descarga licitacion")
-            return False
-
-        try:
-            self.status_var.set("Generando ZIP de licitacion...")
-            carpeta = carpeta_licitacion
-            zip_destino = os.path.join(os.path.dirname(carpeta), f"{os.path.basename(carpeta)}.zip")
-            descarga_ca.crear_zip_carpeta(carpeta, zip_destino)
-        except Exception:
-            pass
-
-        self.status_var.set("Generando Excel de licitacion...")
-        ruta_excel = genera_xls_lici.generar_excel_licitacion(
-            codigo,
-            resumen=resumen,
-            manifest_path=manifest_path,
-            base_dir=base_dir,
-            carpeta_base=carpeta_licitacion,
-        )
-        if ruta_excel:
+        if resultado["ok"]:
             self.status_var.set(f"Flujo completado: {codigo}")
             if mostrar_mensaje:
                 messagebox.showinfo(
                     "Proceso completado",
-                    f"Licitacion {codigo} procesada.\n\nExcel generado en:\n{ruta_excel}",
+                    f"Licitacion {codigo} procesada.\n\nExcel generado en:\n{resultado['ruta_excel']}",
                 )
             return True
+        if resultado["etapa"] == "descarga":
+            errores = "\n".join(resultado["errores"])
+            if mostrar_mensaje:
+                messagebox.showwarning(
+                    "Licitacion",
+                    f"No se pudieron descargar adjuntos de la licitacion.\n{errores}",
+                )
+            self.status_var.set("Fallo descarga licitacion")
         else:
             self.status_var.set("Excel no generado")
             if mostrar_mensaje:
@@ -628,79 +662,7 @@ class DescargadorProduccionApp:
                     "Excel",
                     "La descarga termino pero el Excel no se genero correctamente.",
                 )
-            return False
-
-    def _extraer_nombre_licitacion(self, url_directa, codigo):
-        if not self.driver or not url_directa:
-            return ""
-        try:
-            self.driver.get(url_directa)
-            WebDriverWait(self.driver, 20).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-        except Exception:
-            return ""
-
-        xpaths = [
-            "//span[contains(@id,'lblNombre') and normalize-space()]",
-            "//span[contains(@id,'lblAdquisicion') and normalize-space()]",
-            "//h1[normalize-space()]",
-            "//h2[normalize-space()]",
-            "//div[contains(@class,'title') and normalize-space()]",
-            "//div[contains(@class,'titulo') and normalize-space()]",
-        ]
-        for xp in xpaths:
-            try:
-                elem = self.driver.find_element(By.XPATH, xp)
-            except Exception:
-                continue
-            texto = (elem.text or "").strip()
-            if texto:
-                return self._limpiar_nombre_proyecto(codigo, texto)
-
-        try:
-            titulo = (self.driver.title or "").strip()
-        except Exception:
-            titulo = ""
-        return self._limpiar_nombre_proyecto(codigo, titulo) if titulo else ""
-
-    def _limpiar_nombre_proyecto(self, codigo, nombre):
-        nombre = " ".join((nombre or "").split()).strip()
-        if not nombre:
-            return ""
-        codigo_str = (str(codigo) or "").strip()
-        codigo_norm = codigo_str.lower()
-        if codigo_norm and nombre.lower().startswith(codigo_norm):
-            nombre = nombre[len(codigo_str):].strip(" -_/()[]")
-        if codigo_norm and nombre.lower().endswith(codigo_norm):
-            nombre = nombre[: -len(codigo_str)].strip(" -_/()[]")
-        frases_genericas = {
-            "detalle de la cotizacion",
-            "detalle de la cotización",
-            "detalle cotizacion",
-            "detalle cotización",
-        }
-        nombre_norm = nombre.lower()
-        for frase in frases_genericas:
-            if nombre_norm == frase:
-                return ""
-            if nombre_norm.startswith(f"{frase} "):
-                nombre = nombre[len(frase) :].strip(" -_/()[]")
-                nombre_norm = nombre.lower()
-            if nombre_norm.endswith(f" {frase}"):
-                nombre = nombre[: -len(frase)].strip(" -_/()[]")
-                nombre_norm = nombre.lower()
-        if codigo_norm and nombre.lower().startswith(codigo_norm):
-            nombre = nombre[len(codigo_str):].strip(" -_/()[]")
-        if codigo_norm and nombre.lower().endswith(codigo_norm):
-            nombre = nombre[: -len(codigo_str)].strip(" -_/()[]")
-        if nombre.lower() in frases_genericas:
-            return ""
-        nombre = re.sub(
-            r"^DAG\s*N[º°]?\s*[:#-]?\s*[\w/-]+",
-            "",
-            nombre,
-            flags=re.IGNORECASE,
-        ).strip(" -_/()[]")
-        return nombre
+        return False
 
     # ---------------- Token helpers ----------------
     def capturar_y_guardar_token_desde_selenium(self):
@@ -1012,6 +974,124 @@ class DescargadorProduccionApp:
                 return base_dir
         return None
 
+    def _config_descargas(self):
+        """Sección [DESCARGAS] de config.conf (vacía si no existe o no se puede leer)."""
+        config = configparser.ConfigParser()
+        try:
+            config.read(self._ruta_config())
+        except Exception:
+            config = configparser.ConfigParser()
+        if not config.has_section("DESCARGAS"):
+            config.add_section("DESCARGAS")
+        return config["DESCARGAS"]
+
+    def _almacen_blobs(self, base_dir):
+        """
+        Almacén por contenido en <base_dir>/.blobs si config.conf tiene [DESCARGAS] deduplicar = true;
+        los adjuntos idénticos entre procesos quedan como hardlinks a una sola copia.
+        """
+        try:
+            activo = self._config_descargas().getboolean("deduplicar", fallback=False)
+        except ValueError:
+            activo = False
+        if not activo:
+            return None
+        return motor_descargas.AlmacenBlobs(os.path.join(base_dir, ".blobs"))
+
+    def _zip_incremental(self):
+        """[DESCARGAS] zip_incremental (por defecto true): actualizar el ZIP del proceso en vez de reconstruirlo."""
+        try:
+            return self._config_descargas().getboolean("zip_incremental", fallback=True)
+        except ValueError:
+            return True
+
+    def _zip_en_curso(self):
+        """
+        ZipEnCurso si [DESCARGAS] zip_durante_descarga = true: el ZIP del proceso se arma
+        mientras se descarga en vez de al final. None si está desactivado (por defecto).
+        """
+        try:
+            activo = self._config_descargas().getboolean("zip_durante_descarga", fallback=False)
+        except ValueError:
+            activo = False
+        return descarga_ca.crear_zip_en_curso() if activo else None
+
+    def _licitacion_http(self):
+        """[DESCARGAS] licitacion_http (por defecto true): intentar las licitaciones sin navegador antes que con Selenium."""
+        try:
+            return self._config_descargas().getboolean("licitacion_http", fallback=True)
+        except ValueError:
+            return True
+
+    def _workers_lote(self, tipo):
+        """
+        Códigos procesados a la vez cuando se ingresan varios: [DESCARGAS] lote_workers (1 = uno
+        tras otro). Si las licitaciones van solo con Selenium se acota además a lote_navegadores;
+        por HTTP el navegador es solo un respaldo y los demás códigos no lo esperan.
+
+        Con pool_impresion = 0 se procesa uno tras otro: en lote no se usa el navegador
+        interactivo y los certificados que llegan como HTML no tendrían con qué imprimirse.
+        """
+        if self._tamano_pool_impresion() <= 0:
+            return 1
+        config = self._config_descargas()
+        try:
+            workers = config.getint("lote_workers", fallback=lote.MAX_WORKERS_LOTE)
+        except ValueError:
+            workers = lote.MAX_WORKERS_LOTE
+        if tipo != "compra_agil" and not self._licitacion_http():
+            workers = min(workers, self._navegadores_lote())
+        return max(1, workers)
+
+    def _navegadores_lote(self):
+        """[DESCARGAS] lote_navegadores: Chrome headless para licitaciones en paralelo."""
+        try:
+            navegadores = self._config_descargas().getint("lote_navegadores", fallback=lote.MAX_NAVEGADORES_LOTE)
+        except ValueError:
+            navegadores = lote.MAX_NAVEGADORES_LOTE
+        return max(1, navegadores)
+
+    def _configurar_cache_certificados(self, base_dir):
+        """Caché de certificados por RUT en <base_dir>/.cache_certificados; vigencia en [DESCARGAS] cache_certificados_horas."""
+        try:
+            ttl_horas = self._config_descargas().getfloat(
+                "cache_certificados_horas", fallback=descarga_ca.CACHE_CERTIFICADOS_TTL_HORAS
+            )
+        except ValueError:
+            ttl_horas = None
+        descarga_ca.configurar_cache_certificados(os.path.join(base_dir, ".cache_certificados"), ttl_horas)
+
+    def _configurar_cache_licitaciones(self):
+        """Vigencia de la caché código -> ficha de licitación: [DESCARGAS] cache_licitaciones_dias (0 = sin caché)."""
+        try:
+            ttl_dias = self._config_descargas().getfloat(
+                "cache_licitaciones_dias", fallback=flujo_licitacion.CACHE_LICITACIONES_TTL_DIAS
+            )
+        except ValueError:
+            ttl_dias = None
+        flujo_licitacion.configurar_cache_licitaciones(ttl_dias)
+
+    def _tamano_pool_impresion(self):
+        """[DESCARGAS] pool_impresion: Chrome headless para imprimir certificados (0 = solo el navegador interactivo)."""
+        try:
+            return self._config_descargas().getint("pool_impresion", fallback=pool_impresion.TAMANO_POOL_IMPRESION)
+        except ValueError:
+            return pool_impresion.TAMANO_POOL_IMPRESION
+
+    def _preparar_pool_impresion(self):
+        """
+        Pool de Chrome headless para imprimir certificados en paralelo ([DESCARGAS] pool_impresion,
+        0 = usar solo el navegador interactivo). Se refrescan las cookies en cada proceso.
+        """
+        tamano = self._tamano_pool_impresion()
+        if tamano <= 0:
+            return
+        if self.pool_impresion is None:
+            self.pool_impresion = pool_impresion.PoolImpresion(tamano, driver_origen=self.driver)
+            descarga_ca.configurar_pool_impresion(self.pool_impresion)
+        elif self.driver:
+            self.pool_impresion.actualizar_cookies(self.driver)
+
     def _normalizar_base_descargas(self):
         base_dir = (self.base_descargas_dir.get() or "").strip() or os.path.abspath("Descargas")
         base_dir = self._limpiar_path_config(base_dir)
@@ -1041,24 +1121,6 @@ class DescargadorProduccionApp:
         except Exception:
             pass
 
-    # ---------------- Utilidades licitacion ----------------
-    def _guardar_manifest_licitacion(self, codigo, resumen, base_dir="Descargas", carpeta_base=None, nombre_proyecto=None):
-        try:
-            if not carpeta_base:
-                carpeta_base = descarga_ca.resolver_carpeta_base(base_dir, "Licitaciones", codigo)
-            os.makedirs(carpeta_base, exist_ok=True)
-            ruta = os.path.join(carpeta_base, "manifest_licitacion.json")
-            data = resumen or {}
-            data["codigo"] = codigo
-            if nombre_proyecto:
-                data["nombre_proyecto"] = nombre_proyecto
-            data["generado_en"] = time.time()
-            with open(ruta, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            return ruta
-        except Exception:
-            return None
-
     def elegir_carpeta_descargas(self):
         actual = (self.base_descargas_dir.get() or "").strip() or os.path.abspath("Descargas")
         try:
@@ -4,14 +4,15 @@
 import os
 import pandas as pd
 import json
+import time
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils.dataframe import dataframe_to_rows
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+import comprobante_oferta
 import descarga_ca
+import excel_streaming
 
 
 def _cargar_manifest_adjuntos(codigo_ca, base_dir="Descargas", carpeta_base=None):
@@ -36,17 +37,29 @@ def _cargar_manifest_adjuntos(codigo_ca, base_dir="Descargas", carpeta_base=None
         by_rut[rut_norm] = p
     return by_rut
 
-def generar_excel_compra_agil(codigo_ca, driver=None, base_dir="Descargas", carpeta_base=None):
+def generar_excel_compra_agil(codigo_ca, driver=None, base_dir="Descargas", carpeta_base=None, desde_manifest=None):
     """
     Genera un archivo Excel con la información de una compra ágil
     
     Args:
         codigo_ca (str): Código de la compra ágil
-        driver: Instancia del navegador Selenium
+        driver: Instancia del navegador Selenium (solo se usa si no hay manifest)
+        desde_manifest (bool): True arma el Excel solo con manifest_adjuntos.json y el JSON de
+            /solicitud que guarda la descarga API, sin navegador; False navega la compra con el
+            driver; None (por defecto) navega si hay driver y, sin driver, usa el manifest si existe
     
     Returns:
         str: Ruta del archivo Excel generado
     """
+    if not carpeta_base:
+        carpeta_base = descarga_ca.resolver_carpeta_base(base_dir, "ComprasAgiles", codigo_ca)
+    if desde_manifest is None:
+        desde_manifest = driver is None and os.path.exists(
+            os.path.join(carpeta_base, descarga_ca.MANIFEST_ADJUNTOS_FILENAME)
+        )
+    if desde_manifest:
+        return generar_excel_desde_manifest(codigo_ca, base_dir=base_dir, carpeta_base=carpeta_base)
+
     if not driver:
         print("Error: Se requiere una instancia del navegador")
         return None
@@ -81,6 +94,9 @@ def generar_excel_compra_agil(codigo_ca, driver=None, base_dir="Descargas", carp
             info_compra,
             base_dir=base_dir,
             carpeta_destino=carpeta_base,
+            manifest=descarga_ca._cargar_manifest(
+                os.path.join(carpeta_base, descarga_ca.MANIFEST_ADJUNTOS_FILENAME)
+            ),
         )
         
         if ruta_excel:
@@ -94,6 +110,43 @@ def generar_excel_compra_agil(codigo_ca, driver=None, base_dir="Descargas", carp
         print(f"Error al generar Excel: {str(e)}")
         return None
 
+def generar_excel_desde_manifest(codigo_ca, base_dir="Descargas", carpeta_base=None):
+    """
+    Genera el Excel de la compra ágil sin navegador: la información general sale del JSON de
+    /solicitud guardado por la descarga API y los proveedores de manifest_adjuntos.json.
+    
+    Returns:
+        str: Ruta del archivo Excel generado, o None si no hay manifest con proveedores
+    """
+    try:
+        inicio = time.perf_counter()
+        if not carpeta_base:
+            carpeta_base = descarga_ca.resolver_carpeta_base(base_dir, "ComprasAgiles", codigo_ca)
+        manifest = descarga_ca._cargar_manifest(os.path.join(carpeta_base, descarga_ca.MANIFEST_ADJUNTOS_FILENAME))
+        solicitud = descarga_ca.cargar_solicitud_api(carpeta_base)
+        
+        info_compra = extraer_informacion_desde_api(codigo_ca, solicitud, manifest)
+        datos_proveedores = datos_proveedores_desde_manifest(manifest, carpeta_base)
+        if not datos_proveedores:
+            print("No se encontraron proveedores en el manifest para generar el Excel")
+            return None
+        
+        ruta_excel = crear_estructura_excel(
+            datos_proveedores,
+            codigo_ca,
+            info_compra,
+            base_dir=base_dir,
+            carpeta_destino=carpeta_base,
+            manifest=manifest,
+        )
+        if ruta_excel:
+            print(f"Excel generado desde manifest en {time.perf_counter() - inicio:.3f}s: {ruta_excel}")
+        return ruta_excel
+        
+    except Exception as e:
+        print(f"Error al generar Excel desde manifest: {str(e)}")
+        return None
+
 def extraer_informacion_compra_agil(codigo_ca, driver):
     """
     Extrae información general de la compra ágil
@@ -164,6 +217,111 @@ def extraer_informacion_compra_agil(codigo_ca, driver):
         print(f"Error al extraer información de la compra ágil: {str(e)}")
         return info_compra
 
+# Campos de /solicitud por dato del Excel, en orden de preferencia
+CLAVES_INFO_API = {
+    'organismo': ("nombreOrganismo", "organismo", "nombreInstitucion", "institucion", "nombreUnidadCompra", "unidadCompra"),
+    'fecha_publicacion': ("fechaPublicacion", "fechaInicio", "fechaCreacion"),
+    'fecha_cierre': ("fechaCierre", "fechaCierreCotizacion", "fechaTermino", "fechaFin"),
+    'estado': ("estado", "nombreEstado", "estadoSolicitud", "descripcionEstado"),
+    'monto_estimado': ("montoDisponible", "montoEstimado", "presupuesto", "montoTotal", "monto"),
+    'descripcion': ("descripcion", "detalle"),
+}
+
+def _valor_simple(valor):
+    """Valor mostrable de un campo del JSON; en objetos ({"nombre": ...}) toma su nombre/glosa."""
+    if isinstance(valor, dict):
+        for clave in ("nombre", "descripcion", "glosa", "valor"):
+            if valor.get(clave) not in (None, ""):
+                return valor.get(clave)
+        return None
+    if isinstance(valor, (list, tuple)):
+        return None
+    return valor
+
+def _buscar_en_solicitud(payload, claves):
+    """(clave, valor) del primer campo encontrado en el payload o en sus sub-objetos directos."""
+    objetos = [payload] + [v for v in payload.values() if isinstance(v, dict)]
+    for clave in claves:
+        for obj in objetos:
+            valor = _valor_simple(obj.get(clave))
+            if valor not in (None, ""):
+                return clave, valor
+    return None, None
+
+def extraer_informacion_desde_api(codigo_ca, info_data, manifest=None):
+    """
+    Información general de la compra ágil a partir de la respuesta de /solicitud
+    (mismas claves que extraer_informacion_compra_agil)
+    """
+    payload = (info_data or {}).get("payload") or info_data or {}
+    info_compra = {
+        'codigo': codigo_ca,
+        'nombre': descarga_ca._extraer_nombre_proyecto_compra_info(info_data or {})
+        or (manifest or {}).get("nombre_proyecto")
+        or f"Compra Ágil {codigo_ca}",
+    }
+    vacios = []
+    for campo, claves in CLAVES_INFO_API.items():
+        clave, valor = _buscar_en_solicitud(payload, claves) if isinstance(payload, dict) else (None, None)
+        info_compra[campo] = comprobante_oferta.formatear_valor(clave, valor) if clave else ''
+        if not clave:
+            vacios.append(campo)
+    if vacios:
+        # Las claves de CLAVES_INFO_API no están verificadas contra todas las respuestas de /solicitud
+        disponibles = sorted(payload) if isinstance(payload, dict) else []
+        print(f"[XLS] {codigo_ca}: /solicitud sin valor para {', '.join(vacios)}; claves recibidas: {disponibles}")
+    return info_compra
+
+def datos_proveedores_desde_manifest(manifest, carpeta_base):
+    """Filas de la hoja Proveedores a partir de manifest_adjuntos.json (sin navegador)"""
+    ruta_zip = descarga_ca.ruta_zip_proceso(carpeta_base)
+    datos_proveedores = []
+    for i, entry in enumerate((manifest or {}).get("proveedores") or [], 1):
+        if not isinstance(entry, dict):
+            continue
+        nombre = entry.get("label") or f"Postulante {entry.get('id_cotizacion') or i}"
+        datos_proveedores.append(_datos_proveedor(i, nombre, entry.get("rut") or '', entry, carpeta_base, ruta_zip))
+    return datos_proveedores
+
+def _datos_proveedor(i, nombre, rut, entry, carpeta_base, ruta_zip):
+    """Fila de la hoja Proveedores; entry es el registro del proveedor en el manifest (o None)"""
+    if entry and entry.get("carpeta"):
+        carpeta_proveedor = entry.get("carpeta")
+    else:
+        carpeta_proveedor = os.path.join(carpeta_base, descarga_ca.limpiar_nombre_archivo(nombre))
+
+    adjuntos_esperados = None
+    if entry:
+        adjuntos_esperados = entry.get("esperados_ui")
+        if adjuntos_esperados is None:
+            adjuntos_esperados = entry.get("esperados_api")
+    
+    # Verificar si existen los archivos/carpetas
+    existe_carpeta = os.path.exists(carpeta_proveedor)
+    existe_zip = os.path.exists(ruta_zip)
+    
+    # Contar adjuntos si existe la carpeta
+    num_adjuntos = 0
+    if existe_carpeta:
+        try:
+            archivos = [f for f in os.listdir(carpeta_proveedor) if os.path.isfile(os.path.join(carpeta_proveedor, f))]
+            num_adjuntos = len(archivos)
+        except:
+            pass
+    
+    return {
+        'N°': i,
+        'Nombre Proveedor': nombre,
+        'RUT': rut,
+        'Carpeta Path': carpeta_proveedor if existe_carpeta else 'No descargada',
+        'ZIP Path': ruta_zip if existe_zip else 'No creado',
+        'Adjuntos Esperados': adjuntos_esperados if adjuntos_esperados is not None else '',
+        'Número Adjuntos': num_adjuntos,
+        'Estado Descarga': 'Completada' if existe_carpeta and num_adjuntos > 0 else 'Pendiente',
+        'Estado ZIP': 'Creado' if existe_zip else 'No creado',
+        'Fecha Procesamiento': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
 def extraer_datos_proveedores(codigo_ca, driver, base_dir="Descargas", carpeta_base=None):
     """
     Extrae los datos de los proveedores participantes
@@ -186,56 +344,15 @@ def extraer_datos_proveedores(codigo_ca, driver, base_dir="Descargas", carpeta_b
             carpeta_base=carpeta_base,
         )
         
+        ruta_zip = descarga_ca.ruta_zip_proceso(carpeta_base)
         datos_proveedores = []
         
         for i, proveedor in enumerate(proveedores, 1):
-            # Construir rutas basadas en la estructura de carpetas
             rut_norm = descarga_ca._normalizar_rut(proveedor.get("rut")) or (proveedor.get("rut") or "").strip()
             entry = manifest_by_rut.get(rut_norm) if rut_norm else None
-
-            carpeta_proveedor = None
-            if entry and entry.get("carpeta"):
-                carpeta_proveedor = entry.get("carpeta")
-            else:
-                nombre_proveedor_limpio = descarga_ca.limpiar_nombre_archivo(proveedor['nombre'])
-                carpeta_proveedor = os.path.join(carpeta_base, nombre_proveedor_limpio)
-
-            zip_proceso = os.path.join(os.path.dirname(carpeta_base), f"{os.path.basename(carpeta_base)}.zip")
-            ruta_zip = zip_proceso if os.path.basename(zip_proceso) else "No creado"
-
-            adjuntos_esperados = None
-            if entry:
-                adjuntos_esperados = entry.get("esperados_ui")
-                if adjuntos_esperados is None:
-                    adjuntos_esperados = entry.get("esperados_api")
-            
-            # Verificar si existen los archivos/carpetas
-            existe_carpeta = os.path.exists(carpeta_proveedor)
-            existe_zip = os.path.exists(ruta_zip)
-            
-            # Contar adjuntos si existe la carpeta
-            num_adjuntos = 0
-            if existe_carpeta:
-                try:
-                    archivos = [f for f in os.listdir(carpeta_proveedor) if os.path.isfile(os.path.join(carpeta_proveedor, f))]
-                    num_adjuntos = len(archivos)
-                except:
-                    pass
-            
-            datos_proveedor = {
-                'N°': i,
-                'Nombre Proveedor': proveedor['nombre'],
-                'RUT': proveedor['rut'],
-                'Carpeta Path': carpeta_proveedor if existe_carpeta else 'No descargada',
-                'ZIP Path': ruta_zip if existe_zip else 'No creado',
-                'Adjuntos Esperados': adjuntos_esperados if adjuntos_esperados is not None else '',
-                'Número Adjuntos': num_adjuntos,
-                'Estado Descarga': 'Completada' if existe_carpeta and num_adjuntos > 0 else 'Pendiente',
-                'Estado ZIP': 'Creado' if existe_zip else 'No creado',
-                'Fecha Procesamiento': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            
-            datos_proveedores.append(datos_proveedor)
+            datos_proveedores.append(
+                _datos_proveedor(i, proveedor['nombre'], proveedor['rut'], entry, carpeta_base, ruta_zip)
+            )
         
         return datos_proveedores
         
@@ -243,14 +360,18 @@ def extraer_datos_proveedores(codigo_ca, driver, base_dir="Descargas", carpeta_b
         print(f"Error al extraer datos de proveedores: {str(e)}")
         return []
 
-def crear_estructura_excel(datos_proveedores, codigo_ca, info_compra, base_dir="Descargas", carpeta_destino=None):
+def crear_estructura_excel(
+    datos_proveedores, codigo_ca, info_compra, base_dir="Descargas", carpeta_destino=None, manifest=None
+):
     """
-    Crea la estructura del archivo Excel
+    Crea la estructura del archivo Excel (libro write-only: las filas se escriben en streaming)
     
     Args:
         datos_proveedores (list): Lista con datos de proveedores
         codigo_ca (str): Código de la compra ágil
         info_compra (dict): Información general de la compra ágil
+        manifest (dict): manifest_adjuntos.json; si se entrega se agrega la hoja Adjuntos con
+            una fila por archivo
     
     Returns:
         str: Ruta del archivo Excel creado
@@ -266,21 +387,19 @@ def crear_estructura_excel(datos_proveedores, codigo_ca, info_compra, base_dir="
         nombre_excel = f"CompraAgil_{codigo_ca}_{timestamp}.xlsx"
         ruta_excel = os.path.join(carpeta_destino, nombre_excel)
         
-        # Crear workbook
-        wb = Workbook()
-        
-        # Crear hoja de información general
-        ws_info = wb.active
-        ws_info.title = "Información General"
-        crear_hoja_informacion(ws_info, info_compra, codigo_ca)
-        
-        # Crear hoja de proveedores
-        ws_proveedores = wb.create_sheet("Proveedores")
-        crear_hoja_proveedores(ws_proveedores, datos_proveedores)
-        
-        # Crear hoja de resumen
-        ws_resumen = wb.create_sheet("Resumen")
-        crear_hoja_resumen(ws_resumen, datos_proveedores, info_compra)
+        wb = excel_streaming.nuevo_libro()
+        crear_hoja_informacion(
+            excel_streaming.nueva_hoja(wb, "Información General", [20, 50]), info_compra, codigo_ca
+        )
+        crear_hoja_proveedores(
+            excel_streaming.nueva_hoja(wb, "Proveedores", [5, 30, 15, 40, 40, 18, 15, 15, 15, 20], fijar="A4"),
+            datos_proveedores,
+        )
+        crear_hoja_resumen(excel_streaming.nueva_hoja(wb, "Resumen", [25, 20]), datos_proveedores, info_compra)
+        if manifest:
+            crear_hoja_adjuntos(
+                excel_streaming.nueva_hoja(wb, "Adjuntos", [30, 15, 45, 14, 66, 30, 50], fijar="A4"), manifest
+            )
         
         # Guardar archivo
         wb.save(ruta_excel)
@@ -296,15 +415,9 @@ def crear_hoja_informacion(ws, info_compra, codigo_ca):
     """
     Crea la hoja de información general
     """
-    # Título
-    ws['A1'] = f"COMPRA ÁGIL - {codigo_ca}"
-    ws['A1'].font = Font(size=16, bold=True)
-    ws['A1'].fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    ws['A1'].font = Font(size=16, bold=True, color="FFFFFF")
-    ws.merge_cells('A1:B1')
+    excel_streaming.fila(ws, [f"COMPRA ÁGIL - {codigo_ca}", None], excel_streaming.TITULO)
+    excel_streaming.fila(ws, [])
     
-    # Información
-    row = 3
     campos = [
         ('Código:', info_compra['codigo']),
         ('Nombre:', info_compra['nombre']),
@@ -315,69 +428,43 @@ def crear_hoja_informacion(ws, info_compra, codigo_ca):
         ('Monto Estimado:', info_compra['monto_estimado']),
         ('Fecha Generación Excel:', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     ]
-    
     for campo, valor in campos:
-        ws[f'A{row}'] = campo
-        ws[f'A{row}'].font = Font(bold=True)
-        ws[f'B{row}'] = valor
-        row += 1
-    
-    # Ajustar anchos de columna
-    ws.column_dimensions['A'].width = 20
-    ws.column_dimensions['B'].width = 50
+        excel_streaming.fila(ws, [campo, valor], [excel_streaming.ETIQUETA, None])
 
 def crear_hoja_proveedores(ws, datos_proveedores):
     """
     Crea la hoja de proveedores
     """
-    # Título
-    ws['A1'] = "LISTA DE PROVEEDORES"
-    ws['A1'].font = Font(size=14, bold=True)
-    ws['A1'].fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    ws['A1'].font = Font(size=14, bold=True, color="FFFFFF")
-    ws.merge_cells('A1:J1')
-    
-    # Encabezados
     encabezados = ['N°', 'Nombre Proveedor', 'RUT', 'Carpeta Path', 'ZIP Path', 
                    'Adjuntos Esperados', 'Número Adjuntos', 'Estado Descarga', 'Estado ZIP', 'Fecha Procesamiento']
-    
-    for col, encabezado in enumerate(encabezados, 1):
-        cell = ws.cell(row=3, column=col, value=encabezado)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="D9E2F3", end_color="D9E2F3", fill_type="solid")
-        cell.alignment = Alignment(horizontal="center")
-    
-    # Datos
-    for row_idx, proveedor in enumerate(datos_proveedores, 4):
-        ws.cell(row=row_idx, column=1, value=proveedor['N°'])
-        ws.cell(row=row_idx, column=2, value=proveedor['Nombre Proveedor'])
-        ws.cell(row=row_idx, column=3, value=proveedor['RUT'])
-        ws.cell(row=row_idx, column=4, value=proveedor['Carpeta Path'])
-        ws.cell(row=row_idx, column=5, value=proveedor['ZIP Path'])
-        ws.cell(row=row_idx, column=6, value=proveedor.get('Adjuntos Esperados', ''))
-        ws.cell(row=row_idx, column=7, value=proveedor['Número Adjuntos'])
-        ws.cell(row=row_idx, column=8, value=proveedor['Estado Descarga'])
-        ws.cell(row=row_idx, column=9, value=proveedor['Estado ZIP'])
-        ws.cell(row=row_idx, column=10, value=proveedor['Fecha Procesamiento'])
-    
-    # Ajustar anchos de columna
-    anchos = [5, 30, 15, 40, 40, 18, 15, 15, 15, 20]
-    for col, ancho in enumerate(anchos, 1):
-        ws.column_dimensions[chr(64 + col)].width = ancho
-    
-    # Aplicar bordes
-    aplicar_bordes_tabla(ws, 3, len(datos_proveedores) + 3, len(encabezados))
+    excel_streaming.fila(ws, ["LISTA DE PROVEEDORES"] + [None] * (len(encabezados) - 1), excel_streaming.TITULO)
+    excel_streaming.fila(ws, [])
+    excel_streaming.tabla(
+        ws,
+        encabezados,
+        (
+            [
+                proveedor['N°'],
+                proveedor['Nombre Proveedor'],
+                proveedor['RUT'],
+                proveedor['Carpeta Path'],
+                proveedor['ZIP Path'],
+                proveedor.get('Adjuntos Esperados', ''),
+                proveedor['Número Adjuntos'],
+                proveedor['Estado Descarga'],
+                proveedor['Estado ZIP'],
+                proveedor['Fecha Procesamiento'],
+            ]
+            for proveedor in datos_proveedores
+        ),
+    )
 
 def crear_hoja_resumen(ws, datos_proveedores, info_compra):
     """
     Crea la hoja de resumen
     """
-    # Título
-    ws['A1'] = "RESUMEN DE PROCESAMIENTO"
-    ws['A1'].font = Font(size=14, bold=True)
-    ws['A1'].fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    ws['A1'].font = Font(size=14, bold=True, color="FFFFFF")
-    ws.merge_cells('A1:B1')
+    excel_streaming.fila(ws, ["RESUMEN DE PROCESAMIENTO", None], excel_streaming.TITULO)
+    excel_streaming.fila(ws, [])
     
     # Estadísticas
     total_proveedores = len(datos_proveedores)
@@ -396,7 +483,6 @@ def crear_hoja_resumen(ws, datos_proveedores, info_compra):
             except Exception:
                 pass
     
-    row = 3
     estadisticas = [
         ('Total Proveedores:', total_proveedores),
         ('Proveedores Descargados:', proveedores_descargados),
@@ -405,31 +491,34 @@ def crear_hoja_resumen(ws, datos_proveedores, info_compra):
         ('Total Adjuntos:', total_adjuntos),
         ('Porcentaje Completado:', f"{(proveedores_descargados/total_proveedores*100):.1f}%" if total_proveedores > 0 else "0%")
     ]
-    
     for estadistica, valor in estadisticas:
-        ws[f'A{row}'] = estadistica
-        ws[f'A{row}'].font = Font(bold=True)
-        ws[f'B{row}'] = valor
-        row += 1
-    
-    # Ajustar anchos
-    ws.column_dimensions['A'].width = 25
-    ws.column_dimensions['B'].width = 20
+        excel_streaming.fila(ws, [estadistica, valor], [excel_streaming.ETIQUETA, None])
 
-def aplicar_bordes_tabla(ws, fila_inicio, fila_fin, num_columnas):
+def filas_adjuntos_manifest(manifest):
+    """Una fila por archivo del manifest (descargado o con error), generada a demanda"""
+    for archivo in manifest.get("adjuntos_generales") or []:
+        yield ["Adjuntos generales", "", archivo.get("nombre"), archivo.get("bytes"), archivo.get("sha256"), "Descargado", ""]
+    for entry in manifest.get("proveedores") or []:
+        if not isinstance(entry, dict):
+            continue
+        proveedor = entry.get("label") or ""
+        rut = entry.get("rut") or ""
+        carpeta = entry.get("carpeta") or ""
+        for archivo in entry.get("archivos") or []:
+            yield [proveedor, rut, archivo.get("nombre"), archivo.get("bytes"), archivo.get("sha256"), "Descargado", carpeta]
+        for error in entry.get("errores_descarga") or []:
+            yield [proveedor, rut, error.get("nombre"), None, None, f"Error: {error.get('error')}", carpeta]
+
+def crear_hoja_adjuntos(ws, manifest):
     """
-    Aplica bordes a una tabla
+    Crea la hoja de detalle con un archivo por fila
     """
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    for row in range(fila_inicio, fila_fin + 1):
-        for col in range(1, num_columnas + 1):
-            ws.cell(row=row, column=col).border = thin_border
+    encabezados = ['Proveedor', 'RUT', 'Archivo', 'Bytes', 'SHA-256', 'Estado', 'Carpeta']
+    excel_streaming.fila(ws, ["DETALLE DE ADJUNTOS"] + [None] * (len(encabezados) - 1), excel_streaming.TITULO)
+    excel_streaming.fila(ws, [])
+    estilos = [excel_streaming.CELDA] * len(encabezados)
+    estilos[3] = excel_streaming.NUMERO
+    excel_streaming.tabla(ws, encabezados, filas_adjuntos_manifest(manifest), estilos)
 
 if __name__ == "__main__":
     # Función principal para pruebas
@@ -3,9 +3,7 @@ import os
 from datetime import datetime
 
 import descarga_ca
-
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font, PatternFill
+import excel_streaming
 
 
 def generar_excel_licitacion(
@@ -38,19 +36,17 @@ def generar_excel_licitacion(
     os.makedirs(carpeta, exist_ok=True)
     ruta_excel = os.path.join(carpeta, f"resumen_{codigo_lici}.xlsx")
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Resumen"
+    # Libro write-only: las hojas se escriben en orden y fila a fila (ver excel_streaming)
+    wb = excel_streaming.nuevo_libro()
+    ws = excel_streaming.nueva_hoja(wb, "Resumen", [28, 16, 16, 16, 16, 16, 16, 48], fijar="A5")
 
     _render_encabezado(ws, codigo_lici)
 
     headers = ["Proveedor", "RUT", "Total adjuntos", "Administrativos", "Tecnicos", "Economicos", "Otros", "Carpeta"]
-    ws.append(headers)
-    _pintar_encabezado(ws, ws.max_row, len(headers))
-
+    filas = []
     for prov in proveedores:
         counts = _contar_adjuntos(prov)
-        ws.append(
+        filas.append(
             [
                 prov.get("nombre") or "",
                 prov.get("rut") or "",
@@ -62,11 +58,11 @@ def generar_excel_licitacion(
                 prov.get("carpeta") or "",
             ]
         )
-
-    _ajustar_columnas(ws, [28, 16, 16, 16, 16, 16, 16, 48])
+    excel_streaming.tabla(ws, headers, filas)
 
     errores = data.get("errores") or []
     _render_errores_sheet(wb, proveedores, errores)
+    _render_adjuntos_sheet(wb, proveedores, data.get("archivos") or [])
 
     wb.save(ruta_excel)
     return ruta_excel
@@ -119,41 +115,60 @@ def _contar_adjuntos(prov_entry):
 
 
 def _render_encabezado(ws, codigo):
-    ws.append(["Licitacion", codigo])
-    ws.append(["Generado", datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
-    ws.append([])  # linea en blanco
-
-
-def _pintar_encabezado(ws, row_index, num_cols):
-    fill = PatternFill(start_color="D9EAF7", end_color="D9EAF7", fill_type="solid")
-    bold = Font(bold=True)
-    for col in range(1, num_cols + 1):
-        cell = ws.cell(row=row_index, column=col)
-        cell.fill = fill
-        cell.font = bold
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-
-def _ajustar_columnas(ws, widths):
-    for idx, width in enumerate(widths, start=1):
-        ws.column_dimensions[chr(64 + idx)].width = width
+    excel_streaming.fila(ws, ["Licitacion", codigo], [excel_streaming.ETIQUETA, None])
+    excel_streaming.fila(ws, ["Generado", datetime.now().strftime("%Y-%m-%d %H:%M:%S")], [excel_streaming.ETIQUETA, None])
+    excel_streaming.fila(ws, [])  # linea en blanco
 
 
 def _render_errores_sheet(wb, proveedores, errores_generales):
-    ws_err = wb.create_sheet("Errores")
-    ws_err.append(["Origen", "Detalle"])
-    _pintar_encabezado(ws_err, 1, 2)
+    ws_err = excel_streaming.nueva_hoja(wb, "Errores", [28, 80], fijar="A2")
+
+    def _filas():
+        for err in errores_generales:
+            yield ["General", err]
+
+        for prov in proveedores:
+            nombre = prov.get("nombre") or prov.get("rut") or "Proveedor"
+            for etiqueta, info in [
+                ("Administrativos", prov.get("admin") or {}),
+                ("Tecnicos", prov.get("tecnico") or {}),
+                ("Economicos", prov.get("economico") or {}),
+                ("Otros", prov.get("otros") or {}),
+            ]:
+                for err in info.get("errores") or []:
+                    yield [nombre, f"{etiqueta}: {err}"]
+
+    excel_streaming.tabla(ws_err, ["Origen", "Detalle"], _filas())
+
+
+def _render_adjuntos_sheet(wb, proveedores, archivos):
+    """Detalle con un adjunto por fila, desde el ledger del resumen (ruta_rel, tipo, bytes, sha256)."""
+    ws_adj = excel_streaming.nueva_hoja(wb, "Adjuntos", [28, 16, 16, 45, 14, 66, 60], fijar="A2")
+    # ruta_rel parte con la carpeta del proveedor: se cruza con el nombre de su carpeta
+    por_carpeta = {
+        os.path.basename(os.path.normpath(prov["carpeta"])): prov
+        for prov in proveedores
+        if prov.get("carpeta")
+    }
 
-    for err in errores_generales:
-        ws_err.append(["General", err])
+    def _filas():
+        for archivo in archivos:
+            if not isinstance(archivo, dict):
+                continue
+            ruta_rel = archivo.get("ruta_rel") or ""
+            partes = ruta_rel.replace("\\", "/").split("/")
+            prov = por_carpeta.get(partes[0]) or {}
+            tipo = archivo.get("tipo") or (partes[1] if len(partes) > 2 else "")
+            yield [
+                prov.get("nombre") or partes[0],
+                prov.get("rut") or "",
+                tipo,
+                archivo.get("nombre") or os.path.basename(ruta_rel),
+                archivo.get("bytes"),
+                archivo.get("sha256") or "",
+                ruta_rel,
+            ]
 
-    for prov in proveedores:
-        nombre = prov.get("nombre") or prov.get("rut") or "Proveedor"
-        for etiqueta, info in [
-            ("Administrativos", prov.get("admin") or {}),
-            ("Tecnicos", prov.get("tecnico") or {}),
-            ("Economicos", prov.get("economico") or {}),
-            ("Otros", prov.get("otros") or {}),
-        ]:
-            for err in info.get("errores") or []:
-                ws_err.append([nombre, f"{etiqueta}: {err}"])
+    estilos = [excel_streaming.CELDA] * 7
+    estilos[4] = excel_streaming.NUMERO
+    excel_streaming.tabla(ws_adj, ["Proveedor", "RUT", "Tipo", "Archivo", "Bytes", "SHA-256", "Ruta"], _filas(), estilos)
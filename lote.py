@@ -0,0 +1,551 @@
+"""
+Procesamiento de varios códigos (compras ágiles o licitaciones) en paralelo.
+
+ejecutar_lote reparte los códigos en un pool acotado de hilos y llama a `procesar(codigo)`
+en cada uno; informa el avance por código (al_progresar) y retorna un resumen final con el
+resultado y la duración de cada código, en el orden en que se entregaron.
+
+Las compras ágiles por API no usan navegador, así que corren en paralelo sin más. Las
+licitaciones se intentan primero por HTTP (sin navegador); solo si eso falla usan un navegador
+propio, que procesar_licitacion toma de un pool_impresion.PoolImpresion con `prestar()` mientras
+dura el respaldo con Selenium ([DESCARGAS] licitacion_http = false lo usa siempre).
+
+procesar_compra_agil / procesar_licitacion son el flujo completo de un código (descarga,
+certificados, ZIP y Excel) sin interfaz; los usan front_produccion y la línea de comandos
+para trabajos desatendidos (sin pantalla):
+
+  python lote.py codigos.txt [--tipo auto] [--token token] [--cookies sesion/cookies.json]
+                 [--workers 4] [--navegadores 2] [--base-dir Descargas] [--reporte reporte.json]
+
+El archivo de códigos tiene un código por línea (o separados por coma/punto y coma; las
+líneas que empiezan con # se ignoran). Al terminar se escribe un reporte JSON con el
+resultado de cada código y la salida es 0 si todos terminaron bien, 1 si alguno falló.
+"""
+import argparse
+import configparser
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import descarga_ca
+import esperas
+import flujo_licitacion
+import genera_xls_ca
+import genera_xls_lici
+import motor_descargas
+import pool_impresion
+import scrape_cuadro
+
+MAX_WORKERS_LOTE = 4
+MAX_NAVEGADORES_LOTE = 2
+
+
+def _procesar_codigo(codigo, procesar, tag):
+    inicio = time.perf_counter()
+    entrada = {"codigo": codigo, "ok": False, "segundos": 0.0, "error": None}
+    try:
+        resultado = procesar(codigo)
+        if isinstance(resultado, dict):
+            entrada["ok"] = bool(resultado.get("ok"))
+            entrada["error"] = resultado.get("error")
+            entrada["resultado"] = resultado
+        else:
+            entrada["ok"] = bool(resultado)
+    except Exception as e:
+        print(f"{tag} Error procesando {codigo}: {e}")
+        traceback.print_exc()
+        entrada["error"] = str(e)
+    entrada["segundos"] = round(time.perf_counter() - inicio, 2)
+    return entrada
+
+
+def ejecutar_lote(codigos, procesar, max_workers=None, al_progresar=None, tag="[LOTE]"):
+    """
+    Procesa los códigos con hasta max_workers en paralelo.
+
+    Args:
+        codigos (list): Códigos a procesar (los repetidos se procesan una vez)
+        procesar (callable): procesar(codigo) -> bool, o dict con "ok" (y opcionalmente "error")
+        max_workers (int): Códigos simultáneos (por defecto MAX_WORKERS_LOTE)
+        al_progresar (callable): al_progresar(codigo, estado, hechos, total) con estado
+            "iniciado", "ok" o "error"; se llama desde los hilos del pool
+        tag (str): Prefijo de los mensajes de log
+
+    Returns:
+        dict: {total, exitosos, fallidos, segundos, codigos: [{codigo, ok, segundos, error}]}
+    """
+    codigos = list(dict.fromkeys(c for c in codigos if c))
+    total = len(codigos)
+    workers = max(1, min(int(max_workers or MAX_WORKERS_LOTE), total or 1))
+    print(f"{tag} {total} código(s) con {workers} en paralelo")
+
+    def _tarea(codigo):
+        if al_progresar:
+            al_progresar(codigo, "iniciado", None, total)
+        return _procesar_codigo(codigo, procesar, tag)
+
+    inicio = time.perf_counter()
+    por_codigo = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lote") as pool:
+        futuros = {pool.submit(_tarea, codigo): codigo for codigo in codigos}
+        for futuro in as_completed(futuros):
+            entrada = futuro.result()
+            por_codigo[entrada["codigo"]] = entrada
+            hechos = len(por_codigo)
+            estado = "ok" if entrada["ok"] else "error"
+            print(f"{tag} ({hechos}/{total}) {entrada['codigo']}: {estado.upper()} en {entrada['segundos']:.1f}s")
+            if al_progresar:
+                al_progresar(entrada["codigo"], estado, hechos, total)
+
+    entradas = [por_codigo[codigo] for codigo in codigos]
+    resumen = {
+        "total": total,
+        "exitosos": [e["codigo"] for e in entradas if e["ok"]],
+        "fallidos": [e["codigo"] for e in entradas if not e["ok"]],
+        "segundos": round(time.perf_counter() - inicio, 2),
+        "codigos": entradas,
+    }
+    print(describir(resumen, tag=tag))
+    return resumen
+
+
+def describir(resumen, tag="[LOTE]"):
+    """Resumen legible del lote: totales, tiempo de pared vs suma de tiempos y fallidos."""
+    suma = sum(e["segundos"] for e in resumen["codigos"])
+    lineas = [
+        f"{tag} {len(resumen['exitosos'])}/{resumen['total']} código(s) OK en {resumen['segundos']:.1f}s "
+        f"(secuencial habría tomado ~{suma:.1f}s)"
+    ]
+    for entrada in resumen["codigos"]:
+        if not entrada["ok"]:
+            detalle = f": {entrada['error']}" if entrada.get("error") else ""
+            lineas.append(f"{tag}   FALLÓ {entrada['codigo']}{detalle}")
+    return "\n".join(lineas)
+
+
+# ---------------- Flujo por código ----------------
+def tipo_de_codigo(codigo):
+    """compra_agil para códigos de cotización (ej: 1234-56-COT24), licitacion para el resto."""
+    return "compra_agil" if "-COT" in (codigo or "").upper() else "licitacion"
+
+
+def cerrar_zip_proceso(carpeta, zip_en_curso=None, incremental=True):
+    """Deja listo el ZIP del proceso: cierra el ZIP en curso o, si no hay, lo crea/actualiza."""
+    if zip_en_curso is not None:
+        ruta_zip = descarga_ca.cerrar_zip_en_curso(zip_en_curso)
+        if ruta_zip:
+            return ruta_zip
+    return descarga_ca.crear_zip_carpeta(carpeta, descarga_ca.ruta_zip_proceso(carpeta), incremental=incremental)
+
+
+def _avanzar(al_avanzar, mensaje):
+    if al_avanzar:
+        al_avanzar(mensaje)
+
+
+def procesar_compra_agil(
+    codigo,
+    base_dir="Descargas",
+    driver=None,
+    token_path="token",
+    almacen_blobs=None,
+    zip_en_curso=None,
+    zip_incremental=True,
+    al_avanzar=None,
+):
+    """
+    Descarga, certificados, ZIP y Excel de una compra ágil por API.
+
+    Args:
+        driver: Navegador opcional (respaldo para el nombre y la verificación por UI); None = solo API
+        al_avanzar (callable): Recibe un texto por cada etapa (ej: status de la interfaz)
+
+    Returns:
+        dict: {codigo, tipo, ok, etapa, error, carpeta, ruta_zip, ruta_excel}; etapa es la
+            última etapa alcanzada ("descarga", "zip", "excel" o "completado")
+    """
+    resultado = {
+        "codigo": codigo,
+        "tipo": "compra_agil",
+        "ok": False,
+        "etapa": "descarga",
+        "error": None,
+        "carpeta": None,
+        "ruta_zip": None,
+        "ruta_excel": None,
+    }
+    _avanzar(al_avanzar, f"Descargando adjuntos de compra agil {codigo}...")
+    ok = descarga_ca.descargar_compra_agil_api(
+        codigo,
+        token_path=token_path,
+        driver=driver,
+        base_dir=base_dir,
+        almacen_blobs=almacen_blobs,
+        zip_en_curso=zip_en_curso,
+    )
+    if not ok:
+        if zip_en_curso:
+            zip_en_curso.descartar()
+        resultado["error"] = "No se pudieron descargar los adjuntos de la compra agil."
+        return resultado
+
+    carpeta = descarga_ca.resolver_carpeta_base(base_dir, "ComprasAgiles", codigo)
+    resultado["carpeta"] = carpeta
+    resultado["etapa"] = "zip"
+    try:
+        _avanzar(al_avanzar, "Generando ZIP de compra agil...")
+        resultado["ruta_zip"] = cerrar_zip_proceso(carpeta, zip_en_curso, incremental=zip_incremental)
+    except Exception as e:
+        print(f"[ZIP] Error generando ZIP de {codigo}: {e}")
+
+    resultado["etapa"] = "excel"
+    _avanzar(al_avanzar, "Generando Excel de compra agil...")
+    ruta_excel = genera_xls_ca.generar_excel_compra_agil(codigo, driver, base_dir=base_dir, carpeta_base=carpeta)
+    if not ruta_excel:
+        resultado["error"] = "La descarga termino pero el Excel no se genero correctamente."
+        return resultado
+    resultado.update(ok=True, etapa="completado", ruta_excel=ruta_excel)
+    return resultado
+
+
+def procesar_licitacion(
+    codigo,
+    driver=None,
+    base_dir="Descargas",
+    almacen_blobs=None,
+    zip_en_curso=None,
+    zip_incremental=True,
+    al_avanzar=None,
+    prestar_navegador=None,
+    http=True,
+    cookies=None,
+):
+    """
+    Descarga, certificados, ZIP y Excel de una licitación.
+
+    Con http=True se intenta primero sin navegador (ficha, cuadro de ofertas y adjuntos con
+    requests); si eso no llega a la tabla de ofertas se repite con Selenium usando driver o, si no
+    hay, uno tomado con prestar_navegador() (context manager, ej: PoolImpresion.prestar) solo
+    mientras dura ese respaldo. cookies (formato de driver.get_cookies()) van en la sesión HTTP
+    cuando no hay driver del que tomarlas.
+
+    Returns:
+        dict: como procesar_compra_agil, más descargados, errores (los del scraping) y via
+              ("http" o "navegador")
+    """
+    resultado = {
+        "codigo": codigo,
+        "tipo": "licitacion",
+        "ok": False,
+        "etapa": "descarga",
+        "error": None,
+        "carpeta": None,
+        "ruta_zip": None,
+        "ruta_excel": None,
+        "descargados": 0,
+        "errores": [],
+        "via": None,
+    }
+    _avanzar(al_avanzar, f"Descargando adjuntos de licitacion {codigo}...")
+    cache = flujo_licitacion.leer_cache_licitacion(codigo, base_dir)
+    if cache:
+        print(f"[LOTE] {codigo}: ficha desde caché -> {cache['url']}")
+    descarga = None
+    if http:
+        descarga = _descargar_licitacion_http(codigo, driver, cookies, base_dir, almacen_blobs, zip_en_curso, cache)
+    if descarga is not None:
+        resultado["via"] = "http"
+    else:
+        resultado["via"] = "navegador"
+        if driver is None and prestar_navegador is not None:
+            with prestar_navegador() as prestado:
+                descarga = _descargar_licitacion_navegador(
+                    codigo, prestado, base_dir, almacen_blobs, zip_en_curso, cache
+                )
+        else:
+            descarga = _descargar_licitacion_navegador(codigo, driver, base_dir, almacen_blobs, zip_en_curso, cache)
+    resumen, nombre_proyecto, carpeta_licitacion = descarga
+    # Solo se recuerda una ficha con la que se llegó al cuadro de ofertas; una de la caché que
+    # ya no llega se olvida para resolverla de nuevo la próxima vez.
+    if resumen.get("proveedores") and resumen.get("url"):
+        flujo_licitacion.guardar_cache_licitacion(
+            codigo, base_dir, resumen["url"], nombre_proyecto=nombre_proyecto, carpeta=carpeta_licitacion
+        )
+    elif cache:
+        flujo_licitacion.guardar_cache_licitacion(codigo, base_dir, None)
+    manifest_path = flujo_licitacion.guardar_manifest_licitacion(
+        codigo,
+        resumen,
+        base_dir=base_dir,
+        carpeta_base=carpeta_licitacion,
+        nombre_proyecto=nombre_proyecto,
+    )
+    resultado["carpeta"] = carpeta_licitacion
+    resultado["descargados"] = resumen.get("descargados") or 0
+    resultado["errores"] = list(resumen.get("errores") or [])
+
+    if not resumen.get("ok"):
+        if zip_en_curso:
+            zip_en_curso.descartar()
+        resultado["error"] = "\n".join(resultado["errores"]) or "No se descargaron adjuntos."
+        return resultado
+
+    resultado["etapa"] = "zip"
+    try:
+        _avanzar(al_avanzar, "Generando ZIP de licitacion...")
+        resultado["ruta_zip"] = cerrar_zip_proceso(carpeta_licitacion, zip_en_curso, incremental=zip_incremental)
+    except Exception as e:
+        print(f"[ZIP] Error generando ZIP de {codigo}: {e}")
+
+    resultado["etapa"] = "excel"
+    _avanzar(al_avanzar, "Generando Excel de licitacion...")
+    ruta_excel = genera_xls_lici.generar_excel_licitacion(
+        codigo,
+        resumen=resumen,
+        manifest_path=manifest_path,
+        base_dir=base_dir,
+        carpeta_base=carpeta_licitacion,
+    )
+    if not ruta_excel:
+        resultado["error"] = "La descarga termino pero el Excel no se genero correctamente."
+        return resultado
+    resultado.update(ok=True, etapa="completado", ruta_excel=ruta_excel)
+    return resultado
+
+
+def _descargar_licitacion_http(codigo, driver, cookies, base_dir, almacen_blobs, zip_en_curso, cache=None):
+    """
+    (resumen, nombre_proyecto, carpeta) de la descarga sin navegador, o None para usar Selenium.
+    Con cache (leer_cache_licitacion) no se busca la ficha: se va directo a su URL.
+    """
+    sesion = scrape_cuadro.sesion_http(driver, cookies=cookies)
+    if cache:
+        ficha = {"url": cache["url"], "html": None}
+        nombre_proyecto = cache["nombre_proyecto"]
+    else:
+        ficha = flujo_licitacion.obtener_ficha_http(codigo, sesion)
+        if not ficha:
+            return None
+        nombre_proyecto = flujo_licitacion.nombre_licitacion_desde_html(ficha["html"], codigo)
+    carpeta_licitacion = (cache or {}).get("carpeta") or descarga_ca.resolver_carpeta_base(
+        base_dir, "Licitaciones", codigo, nombre_proyecto
+    )
+    resumen = scrape_cuadro.descargar_adjuntos_http(
+        ficha["url"],
+        sesion,
+        codigo=codigo,
+        download_dir=carpeta_licitacion,
+        almacen_blobs=almacen_blobs,
+        zip_en_curso=zip_en_curso,
+        driver=driver,
+        html_ficha=ficha["html"],
+    )
+    if resumen is None:
+        print(f"[LOTE] {codigo}: sin cuadro de ofertas por HTTP, se usa el navegador.")
+        return None
+    resumen.setdefault("url", ficha["url"])
+    return resumen, nombre_proyecto, carpeta_licitacion
+
+
+def _descargar_licitacion_navegador(codigo, driver, base_dir, almacen_blobs, zip_en_curso, cache=None):
+    """
+    (resumen, nombre_proyecto, carpeta) de la descarga con Selenium. Con cache se omiten el
+    buscador y la visita a la ficha para leer el nombre.
+    """
+    if cache:
+        url_directa = cache["url"]
+        nombre_proyecto = cache["nombre_proyecto"]
+    else:
+        url_directa = flujo_licitacion.obtener_url_licitacion(codigo, driver)
+        if not url_directa:
+            resumen = {"ok": False, "proveedores": [], "errores": ["No se pudo obtener la URL de la licitación."]}
+            return resumen, "", descarga_ca.resolver_carpeta_base(base_dir, "Licitaciones", codigo)
+        nombre_proyecto = flujo_licitacion.extraer_nombre_licitacion(url_directa, codigo, driver)
+    carpeta_licitacion = (cache or {}).get("carpeta") or descarga_ca.resolver_carpeta_base(
+        base_dir, "Licitaciones", codigo, nombre_proyecto
+    )
+    resumen = scrape_cuadro.descargar_adjuntos_desde_url(
+        url_directa,
+        driver,
+        codigo=codigo,
+        download_dir=carpeta_licitacion,
+        almacen_blobs=almacen_blobs,
+        zip_en_curso=zip_en_curso,
+    )
+    if isinstance(resumen, dict):
+        resumen.setdefault("url", url_directa)
+    return resumen, nombre_proyecto, carpeta_licitacion
+
+
+# ---------------- Línea de comandos ----------------
+def leer_codigos(ruta):
+    """Códigos del archivo (o stdin con "-"), sin comentarios ni repetidos, en orden."""
+    if ruta == "-":
+        texto = sys.stdin.read()
+    else:
+        with open(ruta, "r", encoding="utf-8") as f:
+            texto = f.read()
+    codigos = []
+    for linea in texto.splitlines():
+        linea = linea.split("#", 1)[0]
+        codigos.extend(p.strip() for p in linea.replace(";", ",").split(","))
+    return list(dict.fromkeys(c for c in codigos if c))
+
+
+def _leer_config(ruta):
+    config = configparser.ConfigParser()
+    try:
+        config.read(ruta)
+    except Exception:
+        config = configparser.ConfigParser()
+    for seccion in ("PATH", "DESCARGAS"):
+        if not config.has_section(seccion):
+            config.add_section(seccion)
+    return config
+
+
+def _opcion(seccion, metodo, clave, defecto):
+    try:
+        return getattr(seccion, metodo)(clave, fallback=defecto)
+    except ValueError:
+        return defecto
+
+
+def _escribir_reporte(ruta, reporte):
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    temporal = f"{ruta}.part"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Procesa un lote de códigos sin interfaz: descarga, certificados, ZIP y Excel.",
+    )
+    parser.add_argument("codigos", help="Archivo con los códigos (uno por línea; '-' para leer de stdin)")
+    parser.add_argument(
+        "--tipo",
+        choices=["auto", "compra_agil", "licitacion"],
+        default="auto",
+        help="Tipo de los códigos; auto detecta compras ágiles por el sufijo -COT (por defecto auto)",
+    )
+    parser.add_argument("--token", default="token", help="Archivo con el token Bearer de la API de compra ágil")
+    parser.add_argument(
+        "--cookies",
+        default=os.path.join("sesion", "cookies.json"),
+        help="Cookies de sesión guardadas por la app, para los navegadores headless",
+    )
+    parser.add_argument("--config", default="config.conf", help="config.conf con [PATH] y [DESCARGAS]")
+    parser.add_argument("--base-dir", help="Carpeta de descargas (por defecto [PATH] download_path o ./Descargas)")
+    parser.add_argument("--workers", type=int, help="Códigos en paralelo (por defecto [DESCARGAS] lote_workers)")
+    parser.add_argument(
+        "--navegadores", type=int, help="Chrome headless para licitaciones (por defecto [DESCARGAS] lote_navegadores)"
+    )
+    parser.add_argument("--reporte", help="Ruta del reporte JSON (por defecto <base-dir>/reportes/lote_<fecha>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    try:
+        codigos = leer_codigos(args.codigos)
+    except OSError as e:
+        print(f"[LOTE] No se pudo leer el archivo de códigos: {e}")
+        return 2
+    if not codigos:
+        print("[LOTE] El archivo no tiene códigos.")
+        return 2
+
+    config = _leer_config(args.config)
+    descargas = config["DESCARGAS"]
+    base_dir = args.base_dir or config.get("PATH", "download_path", fallback="").strip().strip("\"'") or "Descargas"
+    base_dir = os.path.abspath(base_dir)
+    workers = args.workers or _opcion(descargas, "getint", "lote_workers", MAX_WORKERS_LOTE)
+    navegadores = args.navegadores or _opcion(descargas, "getint", "lote_navegadores", MAX_NAVEGADORES_LOTE)
+    zip_incremental = _opcion(descargas, "getboolean", "zip_incremental", True)
+    zip_durante = _opcion(descargas, "getboolean", "zip_durante_descarga", False)
+    licitacion_http = _opcion(descargas, "getboolean", "licitacion_http", True)
+    flujo_licitacion.configurar_cache_licitaciones(
+        _opcion(descargas, "getfloat", "cache_licitaciones_dias", flujo_licitacion.CACHE_LICITACIONES_TTL_DIAS)
+    )
+    almacen_blobs = None
+    if _opcion(descargas, "getboolean", "deduplicar", False):
+        almacen_blobs = motor_descargas.AlmacenBlobs(os.path.join(base_dir, ".blobs"))
+    descarga_ca.configurar_cache_certificados(
+        os.path.join(base_dir, ".cache_certificados"),
+        _opcion(descargas, "getfloat", "cache_certificados_horas", descarga_ca.CACHE_CERTIFICADOS_TTL_HORAS),
+    )
+
+    tipos = {c: (tipo_de_codigo(c) if args.tipo == "auto" else args.tipo) for c in codigos}
+    cookies = pool_impresion.cookies_desde_archivo(args.cookies)
+    if any(t == "licitacion" for t in tipos.values()) and not cookies:
+        print(f"[LOTE] Sin cookies de sesión en {args.cookies}; las licitaciones se abren sin sesión.")
+    # Sin navegador interactivo los certificados siempre se imprimen con el pool headless
+    impresion = pool_impresion.PoolImpresion(
+        max(1, _opcion(descargas, "getint", "pool_impresion", pool_impresion.TAMANO_POOL_IMPRESION)),
+        cookies=cookies,
+    )
+    descarga_ca.configurar_pool_impresion(impresion)
+    navegadores_pool = pool_impresion.PoolImpresion(max(1, navegadores), cookies=cookies)
+
+    def _procesar(codigo):
+        opciones = {
+            "base_dir": base_dir,
+            "almacen_blobs": almacen_blobs,
+            "zip_en_curso": descarga_ca.crear_zip_en_curso() if zip_durante else None,
+            "zip_incremental": zip_incremental,
+        }
+        if tipos[codigo] == "compra_agil":
+            return procesar_compra_agil(codigo, token_path=args.token, **opciones)
+        return procesar_licitacion(
+            codigo,
+            prestar_navegador=navegadores_pool.prestar,
+            http=licitacion_http,
+            cookies=cookies,
+            **opciones,
+        )
+
+    inicio = datetime.now()
+    try:
+        resumen = ejecutar_lote(codigos, _procesar, max_workers=workers)
+    finally:
+        descarga_ca.configurar_pool_impresion(None)
+        impresion.cerrar()
+        navegadores_pool.cerrar()
+        esperas.resumen_esperas()
+
+    reporte = {
+        "inicio": inicio.isoformat(timespec="seconds"),
+        "fin": datetime.now().isoformat(timespec="seconds"),
+        "segundos": resumen["segundos"],
+        "base_dir": base_dir,
+        "workers": workers,
+        "navegadores": navegadores,
+        "total": resumen["total"],
+        "exitosos": resumen["exitosos"],
+        "fallidos": resumen["fallidos"],
+        "codigos": [
+            {
+                **(e.get("resultado") or {"codigo": e["codigo"], "tipo": tipos[e["codigo"]]}),
+                "ok": e["ok"],
+                "segundos": e["segundos"],
+                "error": e["error"],
+            }
+            for e in resumen["codigos"]
+        ],
+    }
+    ruta_reporte = args.reporte or os.path.join(base_dir, "reportes", f"lote_{inicio.strftime('%Y%m%d_%H%M%S')}.json")
+    _escribir_reporte(ruta_reporte, reporte)
+    print(f"[LOTE] Reporte: {ruta_reporte}")
+    return 0 if not resumen["fallidos"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
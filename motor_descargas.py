@@ -0,0 +1,873 @@
+# motor_descargas.py
+# Motor común de descarga de adjuntos de licitaciones (popups ViewBidAttachment y URLs directas).
+# Lo usan scrape_cuadro (flujo de producción) y flujo_licitacion (flujo de depuración de app.py).
+# Solo depende de requests; la concurrencia, los reintentos y el almacenamiento son políticas
+# intercambiables que se entregan al crear el MotorDescargas.
+# También expone la capa de red compartida por todos los módulos (sesion_resiliente): reintentos
+# con backoff exponencial + jitter y un limitador de tasa (token bucket) por host.
+
+import hashlib
+import os
+import random
+import re
+import shutil
+import threading
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from html import unescape
+from html.parser import HTMLParser
+from urllib.parse import unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Tamaño de bloque al volcar descargas a disco
+CHUNK_DESCARGA = 256 * 1024
+# Trabajos (popups/URLs) procesados a la vez y requests simultáneos por host
+MAX_WORKERS_DESCARGA = 4
+CONCURRENCIA_POR_HOST = {}
+CONCURRENCIA_POR_HOST_DEFAULT = 4
+# Reintentos ante errores de red o respuestas transitorias (backoff exponencial con jitter, en segundos)
+REINTENTOS_DESCARGA = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAXIMO = 30.0
+ESTADOS_REINTENTABLES = (429, 500, 502, 503, 504)
+# Requests por segundo sostenidos por host (token bucket; RAFAGA_POR_HOST permite picos cortos).
+# Hosts sin entrada no se limitan.
+TASA_POR_HOST = {
+    "mercadopublico.cl": 8,
+    "www.mercadopublico.cl": 8,
+    "proveedor.mercadopublico.cl": 4,
+    "servicios-compra-agil.mercadopublico.cl": 10,
+}
+RAFAGA_POR_HOST = {
+    "servicios-compra-agil.mercadopublico.cl": 20,
+}
+
+
+class TrabajoDescarga:
+    """
+    Una URL a descargar y dónde dejar el resultado.
+
+    Args:
+        url (str): Popup ViewBidAttachment.aspx (se descargan todos sus archivos) o URL directa
+        destino (str): Carpeta destino
+        tipo (str): Tipo de adjunto esperado (título del ícono), usado si el popup no lo informa
+        nombre_hint (str): Base para nombrar archivos cuando el servidor no entrega nombre
+        por_tipo (bool): Si True, cada archivo va a una subcarpeta según su tipo (ver carpeta_por_tipo)
+        datos (dict): Información libre del llamador (rut, proveedor, ...) que vuelve en el resultado
+    """
+
+    def __init__(self, url, destino, tipo="", nombre_hint="", por_tipo=False, datos=None):
+        self.url = url
+        self.destino = destino
+        self.tipo = tipo or ""
+        self.nombre_hint = nombre_hint or "adjunto"
+        self.por_tipo = por_tipo
+        self.datos = datos or {}
+
+
+class PoliticaConcurrencia:
+    """Cantidad de trabajos simultáneos y límite de requests simultáneos por host."""
+
+    def __init__(self, max_workers=MAX_WORKERS_DESCARGA, por_host=None, por_host_default=CONCURRENCIA_POR_HOST_DEFAULT):
+        self.max_workers = max(1, int(max_workers or 1))
+        self.por_host = dict(CONCURRENCIA_POR_HOST if por_host is None else por_host)
+        self.por_host_default = por_host_default
+        self._semaforos = {}
+        self._lock = threading.Lock()
+
+    def semaforo(self, url):
+        host = (urlparse(url).hostname or "").lower()
+        with self._lock:
+            sem = self._semaforos.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(max(1, int(self.por_host.get(host, self.por_host_default))))
+                self._semaforos[host] = sem
+        return sem
+
+    def mapear(self, funcion, items):
+        """Aplica funcion a cada item y retorna los resultados en el mismo orden."""
+        items = list(items)
+        workers = min(self.max_workers, len(items))
+        if workers <= 1:
+            return [funcion(item) for item in items]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="descarga") as pool:
+            return list(pool.map(funcion, items))
+
+
+class PoliticaReintentos:
+    """
+    Reintentos con backoff exponencial y jitter ("full jitter": espera aleatoria entre 0 y
+    base * 2^(intento-1), con tope maximo). Si el servidor envía Retry-After (429/503) se respeta.
+    Se reintentan errores de conexión/timeout y los estados HTTP transitorios (estados).
+    """
+
+    def __init__(self, intentos=REINTENTOS_DESCARGA, base=BACKOFF_BASE, maximo=BACKOFF_MAXIMO, estados=ESTADOS_REINTENTABLES):
+        self.intentos = max(1, int(intentos or 1))
+        self.base = base
+        self.maximo = maximo
+        self.estados = tuple(estados)
+
+    def es_reintentable(self, exc):
+        if isinstance(exc, requests.HTTPError):
+            resp = getattr(exc, "response", None)
+            return resp is not None and resp.status_code in self.estados
+        return isinstance(exc, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+    def espera(self, intento, resp=None):
+        retry_after = _segundos_retry_after(resp.headers.get("Retry-After") if resp is not None else None)
+        if retry_after is not None:
+            return min(self.maximo, retry_after)
+        return random.uniform(0, min(self.maximo, self.base * (2 ** (intento - 1))))
+
+    def ejecutar(self, operacion, descripcion="", reintentable=None):
+        """Ejecuta operacion() reintentando mientras reintentable(exc) (por defecto es_reintentable)."""
+        reintentable = reintentable or self.es_reintentable
+        for intento in range(1, self.intentos + 1):
+            try:
+                return operacion()
+            except Exception as exc:
+                if intento >= self.intentos or not reintentable(exc):
+                    raise
+                espera = self.espera(intento, getattr(exc, "response", None))
+                print(f"[RED] Reintento {intento}/{self.intentos - 1} en {espera:.1f}s {descripcion}: {exc}")
+                time.sleep(espera)
+
+
+class LimitadorTasa:
+    """
+    Token bucket: permite ráfagas de hasta `rafaga` requests y luego `tasa` requests por segundo.
+    Cada llamador reserva su turno bajo el lock y duerme fuera de él, así los hilos salen
+    espaciados en vez de despertar todos juntos.
+    """
+
+    def __init__(self, tasa, rafaga=None):
+        self.tasa = float(tasa)
+        self.rafaga = float(rafaga or max(1.0, self.tasa))
+        self._tokens = self.rafaga
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+        with self._lock:
+            ahora = time.monotonic()
+            self._tokens = min(self.rafaga, self._tokens + (ahora - self._ultimo) * self.tasa)
+            self._ultimo = ahora
+            self._tokens -= 1
+            espera = -self._tokens / self.tasa if self._tokens < 0 else 0.0
+        if espera > 0:
+            time.sleep(espera)
+        return espera
+
+
+_limitadores = {}
+_limitadores_lock = threading.Lock()
+
+
+def limitador_host(url):
+    """LimitadorTasa compartido (por proceso) del host de la URL, o None si el host no tiene tasa."""
+    host = (urlparse(url).hostname or "").lower()
+    tasa = TASA_POR_HOST.get(host)
+    if not tasa:
+        return None
+    with _limitadores_lock:
+        limitador = _limitadores.get(host)
+        if limitador is None:
+            limitador = LimitadorTasa(tasa, RAFAGA_POR_HOST.get(host))
+            _limitadores[host] = limitador
+    return limitador
+
+
+def _segundos_retry_after(valor):
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        fecha = parsedate_to_datetime(valor)
+        return max(0.0, fecha.timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class AdaptadorResiliente(HTTPAdapter):
+    """
+    HTTPAdapter que pasa cada request por el limitador de tasa de su host y la reintenta con
+    PoliticaReintentos ante errores de conexión/timeout o estados transitorios (429, 5xx).
+    Montado en una requests.Session cubre todas sus llamadas (GET de la API, POST de popups, PDFs).
+    Con stream=True solo cubre hasta recibir los headers; los cortes a mitad del cuerpo los
+    reintenta MotorDescargas.
+    """
+
+    def __init__(self, reintentos=None, **kwargs):
+        self.reintentos = reintentos or PoliticaReintentos()
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        limitador = limitador_host(request.url)
+        host = urlparse(request.url).hostname or ""
+        for intento in range(1, self.reintentos.intentos + 1):
+            if limitador:
+                limitador.adquirir()
+            ultimo = intento >= self.reintentos.intentos
+            try:
+                resp = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if ultimo:
+                    raise
+                espera = self.reintentos.espera(intento)
+                print(f"[RED] {type(exc).__name__} en {host}; reintento {intento}/{self.reintentos.intentos - 1} en {espera:.1f}s")
+                time.sleep(espera)
+                continue
+            if resp.status_code not in self.reintentos.estados or ultimo:
+                return resp
+            espera = self.reintentos.espera(intento, resp)
+            print(f"[RED] HTTP {resp.status_code} en {host}; reintento {intento}/{self.reintentos.intentos - 1} en {espera:.1f}s")
+            resp.close()
+            time.sleep(espera)
+
+
+def montar_resiliencia(sesion, reintentos=None, **kwargs_adaptador):
+    """Monta AdaptadorResiliente en http/https de la sesión (kwargs: pool_connections, pool_maxsize)."""
+    adaptador = AdaptadorResiliente(reintentos=reintentos, **kwargs_adaptador)
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+def sesion_resiliente(**kwargs_adaptador):
+    """requests.Session con reintentos y limitador de tasa por host."""
+    return montar_resiliencia(requests.Session(), **kwargs_adaptador)
+
+
+def es_resiliente(sesion):
+    try:
+        return isinstance(sesion.get_adapter("https://"), AdaptadorResiliente)
+    except Exception:
+        return False
+
+
+_sesion_compartida = None
+_sesion_compartida_lock = threading.Lock()
+
+
+def sesion_compartida():
+    """Sesión resiliente del proceso para descargas sin cookies (certificados, PDFs públicos)."""
+    global _sesion_compartida
+    with _sesion_compartida_lock:
+        if _sesion_compartida is None:
+            _sesion_compartida = sesion_resiliente(pool_maxsize=max(MAX_WORKERS_DESCARGA, 10))
+        return _sesion_compartida
+
+
+class CorteDescarga(requests.RequestException):
+    """La conexión se cortó mientras se leía el cuerpo de una respuesta ya aceptada."""
+
+
+class AlmacenamientoCarpeta:
+    """
+    Guarda cada descarga en su carpeta pasando por un temporal (.part) + os.replace, de modo que
+    un corte nunca deja un archivo truncado con el nombre final.
+
+    Args:
+        sobrescribir (bool): True reemplaza un archivo con el mismo nombre; False crea "nombre (2).ext"
+        raiz (str): Carpeta respecto de la cual se calculan las rutas relativas (ruta_rel)
+        previos (dict): Ledger {ruta_rel: {bytes, sha256}} de una ejecución anterior; los archivos
+            que siguen en disco con el mismo tamaño y hash no se vuelven a descargar
+        blobs (AlmacenBlobs): Si se entrega, el contenido se guarda una vez en el almacén y el
+            archivo destino queda como enlace a él
+        al_guardar (callable): Se llama con la ruta final de cada archivo recién guardado
+            (ej: empaquetado_zip.ZipEnCurso.agregar)
+    """
+
+    def __init__(self, sobrescribir=True, raiz=None, previos=None, blobs=None, al_guardar=None):
+        self.sobrescribir = sobrescribir
+        self.raiz = raiz
+        self.previos = previos or {}
+        self.blobs = blobs
+        self.al_guardar = al_guardar
+        self._lock = threading.Lock()
+
+    def ruta_relativa(self, ruta):
+        if not self.raiz:
+            return os.path.basename(ruta)
+        return os.path.relpath(ruta, self.raiz).replace(os.sep, "/")
+
+    def existente(self, ruta):
+        """Metadata del ledger si el archivo ya está descargado y verificado; si no, None."""
+        previo = self.previos.get(self.ruta_relativa(ruta))
+        if previo and archivo_coincide(ruta, previo.get("bytes"), previo.get("sha256")):
+            return dict(previo, ruta=ruta, ruta_rel=self.ruta_relativa(ruta), reutilizado=True)
+        return None
+
+    def guardar(self, resp, carpeta, nombre):
+        os.makedirs(carpeta, exist_ok=True)
+        ruta_tmp, total, sha256 = escribir_stream_temporal(resp, carpeta)
+        try:
+            with self._lock:
+                if not self.sobrescribir:
+                    nombre = asegurar_nombre_unico(carpeta, nombre)
+                ruta = os.path.join(carpeta, nombre)
+                if self.blobs:
+                    self.blobs.publicar(ruta_tmp, sha256, ruta)
+                else:
+                    os.replace(ruta_tmp, ruta)
+        except Exception:
+            try:
+                os.remove(ruta_tmp)
+            except Exception:
+                pass
+            raise
+        if self.al_guardar:
+            self.al_guardar(ruta)
+        return {
+            "ruta": ruta,
+            "ruta_rel": self.ruta_relativa(ruta),
+            "nombre": nombre,
+            "bytes": total,
+            "sha256": sha256,
+            "reutilizado": False,
+        }
+
+
+class AlmacenBlobs:
+    """
+    Almacén por contenido: cada archivo distinto se guarda una sola vez en raiz/<sha[:2]>/<sha256>
+    y las carpetas de proveedor lo reciben como hardlink (o reflink/copia si el sistema de archivos
+    no admite hardlinks). La publicación de un blob y el reemplazo del destino son atómicos, por lo
+    que varios hilos o procesos pueden compartir el mismo almacén.
+    """
+
+    def __init__(self, raiz):
+        self.raiz = raiz
+
+    def ruta_blob(self, sha256):
+        return os.path.join(self.raiz, sha256[:2], sha256)
+
+    def publicar(self, ruta_tmp, sha256, ruta_destino):
+        """
+        Mueve ruta_tmp (ya con SHA-256 calculado) al almacén, o la descarta si ese contenido ya
+        estaba, y deja ruta_destino apuntando al blob. Retorna el modo: hardlink, reflink o copia.
+        """
+        blob = self.ruta_blob(sha256)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp_blob = f"{blob}.{uuid.uuid4().hex}.part"
+            try:
+                os.link(ruta_tmp, tmp_blob)
+            except OSError:
+                shutil.copyfile(ruta_tmp, tmp_blob)
+            try:
+                os.link(tmp_blob, blob)
+            except FileExistsError:
+                pass  # otro hilo/proceso publicó el mismo contenido
+            except OSError:
+                os.replace(tmp_blob, blob)  # sin hardlinks: reemplazo atómico, el contenido es el mismo
+            finally:
+                if os.path.exists(tmp_blob):
+                    os.remove(tmp_blob)
+        os.remove(ruta_tmp)
+        return materializar_archivo(blob, ruta_destino)
+
+    def purgar_huerfanos(self):
+        """
+        Elimina blobs a los que ya no apunta ningún archivo (un solo enlace). Retorna cuántos.
+        No debe correr en paralelo con descargas que usen el mismo almacén.
+        """
+        eliminados = 0
+        for carpeta, _, archivos in os.walk(self.raiz):
+            for nombre in archivos:
+                ruta = os.path.join(carpeta, nombre)
+                try:
+                    if nombre.endswith(".part") or os.stat(ruta).st_nlink <= 1:
+                        os.remove(ruta)
+                        eliminados += 1
+                except OSError:
+                    continue
+        return eliminados
+
+
+def materializar_archivo(origen, ruta_destino):
+    """
+    Deja en ruta_destino el contenido de origen como hardlink, reflink o copia (en ese orden de
+    preferencia), reemplazando el destino de forma atómica. Retorna el modo usado.
+    """
+    carpeta = os.path.dirname(ruta_destino) or "."
+    os.makedirs(carpeta, exist_ok=True)
+    tmp_destino = os.path.join(carpeta, f".descarga_{uuid.uuid4().hex}.part")
+    try:
+        try:
+            os.link(origen, tmp_destino)
+            modo = "hardlink"
+        except OSError:
+            modo = "reflink" if _reflink(origen, tmp_destino) else "copia"
+            if modo == "copia":
+                shutil.copyfile(origen, tmp_destino)
+        os.replace(tmp_destino, ruta_destino)
+    except Exception:
+        try:
+            os.remove(tmp_destino)
+        except Exception:
+            pass
+        raise
+    return modo
+
+
+def _reflink(origen, destino):
+    """Copia copy-on-write (FICLONE, Btrfs/XFS en Linux). False si no está disponible."""
+    try:
+        import fcntl
+
+        with open(origen, "rb") as src, open(destino, "xb") as dst:
+            fcntl.ioctl(dst.fileno(), 0x40049409, src.fileno())  # FICLONE
+        return True
+    except Exception:
+        try:
+            os.remove(destino)
+        except Exception:
+            pass
+        return False
+
+
+class MotorDescargas:
+    """
+    Ejecuta trabajos de descarga con las políticas entregadas (por defecto: PoliticaConcurrencia(),
+    PoliticaReintentos() y AlmacenamientoCarpeta()).
+    """
+
+    def __init__(self, concurrencia=None, reintentos=None, almacenamiento=None):
+        self.concurrencia = concurrencia or PoliticaConcurrencia()
+        self.reintentos = reintentos or PoliticaReintentos()
+        self.almacenamiento = almacenamiento or AlmacenamientoCarpeta()
+
+    def descargar(self, trabajos, sesion):
+        """
+        Procesa los trabajos y retorna un resultado por trabajo, en el mismo orden:
+        {"trabajo", "archivos": [metadata por archivo], "errores": [str]}.
+
+        Si los trabajos corren en paralelo, cada uno usa un clon de la sesión (el viewstate
+        ASP.NET de cada popup queda aislado).
+        """
+        trabajos = list(trabajos)
+        clonar = self.concurrencia.max_workers > 1 and len(trabajos) > 1
+
+        def _procesar(trabajo):
+            sesion_trabajo = clonar_sesion(sesion) if clonar else sesion
+            try:
+                return self.descargar_trabajo(trabajo, sesion_trabajo)
+            except Exception as exc:
+                return {"trabajo": trabajo, "archivos": [], "errores": [f"Error procesando {trabajo.url}: {exc}"]}
+            finally:
+                if clonar:
+                    sesion_trabajo.close()
+
+        return self.concurrencia.mapear(_procesar, trabajos)
+
+    def descargar_trabajo(self, trabajo, sesion):
+        if not es_resiliente(sesion) and hasattr(sesion, "mount"):
+            montar_resiliencia(sesion, reintentos=self.reintentos)
+        resultado = {"trabajo": trabajo, "archivos": [], "errores": []}
+        if "viewbidattachment.aspx" in (trabajo.url or "").lower():
+            self._descargar_popup(trabajo, sesion, resultado)
+        elif trabajo.url:
+            self._descargar_directo(trabajo, sesion, resultado)
+        return resultado
+
+    # ---------------- Internos ----------------
+    def _request(self, sesion, metodo, url, descripcion, **kwargs):
+        # Los reintentos de conexión y estados transitorios los hace el AdaptadorResiliente de la sesión
+        with self.concurrencia.semaforo(url):
+            resp = sesion.request(metodo, url, **kwargs)
+        resp.raise_for_status()
+        return resp
+
+    def _guardar(self, sesion, metodo, url, descripcion, carpeta, nombre_fn, **kwargs):
+        """
+        Request + volcado a disco. Si la conexión se corta a mitad del cuerpo, se repite la
+        operación completa con la política de reintentos (el adaptador no cubre esa fase).
+        """
+
+        def _operacion():
+            with self.concurrencia.semaforo(url):
+                resp = sesion.request(metodo, url, stream=True, **kwargs)
+                try:
+                    resp.raise_for_status()
+                    try:
+                        return self.almacenamiento.guardar(resp, carpeta, nombre_fn(resp))
+                    except requests.RequestException as exc:
+                        raise CorteDescarga(f"descarga interrumpida: {exc}") from exc
+                finally:
+                    resp.close()
+
+        return self.reintentos.ejecutar(_operacion, descripcion, reintentable=lambda exc: isinstance(exc, CorteDescarga))
+
+    def _destino_archivo(self, trabajo, nombre, tipo):
+        carpeta = trabajo.destino
+        if trabajo.por_tipo:
+            carpeta = os.path.join(carpeta, carpeta_por_tipo(tipo or nombre))
+        return carpeta
+
+    def _descargar_popup(self, trabajo, sesion, resultado):
+        """POST de cada botón de descarga del popup, recorriendo todas las páginas del grid."""
+        url = trabajo.url
+        pendientes = ["1"]
+        procesadas = set()
+        state = {}
+        while pendientes:
+            page = pendientes.pop(0)
+            if page in procesadas:
+                continue
+            procesadas.add(page)
+
+            try:
+                if page == "1":
+                    resp = self._request(sesion, "GET", url, f"popup {url}", timeout=30)
+                else:
+                    data = dict(state, __EVENTTARGET="DWNL$grdId", __EVENTARGUMENT=f"Page${page}")
+                    resp = self._request(sesion, "POST", url, f"popup {url} página {page}", data=data, timeout=30)
+            except Exception as exc:
+                resultado["errores"].append(f"Error al obtener popup/página {page} {url}: {exc}")
+                continue
+
+            parsed = parsear_popup_viewbid(resp.text)
+            state = parsed["state"]
+            for p in parsed["pages"]:
+                if p not in procesadas and p not in pendientes:
+                    pendientes.append(p)
+            if not parsed["search_names"]:
+                resultado["errores"].append(f"No se encontraron botones de descarga en popup {url} página {page}")
+                continue
+
+            for idx, name in enumerate(parsed["search_names"], start=1):
+                ctl = name.split("$")[-2]  # ctlXX
+                file_name, file_type = parsed["meta"].get(ctl, ("", ""))
+                file_type = file_type or trabajo.tipo
+                if file_name:
+                    nombre = limpiar_nombre_archivo(file_name)
+                    existente = self.almacenamiento.existente(
+                        os.path.join(self._destino_archivo(trabajo, nombre, file_type), nombre)
+                    )
+                    if existente:
+                        existente.update({"url": url, "tipo": file_type})
+                        resultado["archivos"].append(existente)
+                        print(f"[DESCARGA] Sin cambios (ya descargado): {existente['ruta']}")
+                        continue
+
+                data = dict(state)
+                data.update({"__EVENTTARGET": name, "__EVENTARGUMENT": "", f"{name}.x": "10", f"{name}.y": "10"})
+                data.setdefault("DWNL$ctl10", "")
+                hint = f"{trabajo.nombre_hint}_{page}_{idx}"
+
+                def _nombre(resp, file_name=file_name, hint=hint):
+                    return nombre_para_respuesta(resp, file_name, hint)
+
+                nombre_tentativo = limpiar_nombre_archivo(file_name) if file_name else ""
+                carpeta = self._destino_archivo(trabajo, nombre_tentativo, file_type)
+                try:
+                    info = self._guardar(
+                        sesion, "POST", url, f"{name} en {url}", carpeta, _nombre, data=data, timeout=60
+                    )
+                except Exception as exc:
+                    resultado["errores"].append(f"Error al postear {name} (página {page}) en {url}: {exc}")
+                    continue
+                info.update({"url": url, "tipo": file_type})
+                resultado["archivos"].append(info)
+
+    def _descargar_directo(self, trabajo, sesion, resultado):
+        """GET de una URL de archivo; el nombre sale de content-disposition o de nombre_hint."""
+        url = trabajo.url
+
+        def _nombre(resp):
+            return nombre_para_respuesta(resp, "", trabajo.nombre_hint)
+
+        try:
+            info = self._guardar(sesion, "GET", url, url, trabajo.destino, _nombre, timeout=60)
+        except Exception as exc:
+            resultado["errores"].append(f"Error descargando {url}: {exc}")
+            return
+        info.update({"url": url, "tipo": trabajo.tipo})
+        resultado["archivos"].append(info)
+
+
+# ---------------- Popup ViewBidAttachment ----------------
+# Tokens del popup que interesan, reconocidos en una sola pasada: campos de estado ASP.NET,
+# botones de descarga, nombre/tipo de cada fila y links del paginador (estos últimos pueden venir
+# con comillas escapadas como &#39;). Cada alternativa parte con un literal para que el motor de
+# regex descarte rápido las posiciones que no sirven, y el valor del __VIEWSTATE se consume una vez.
+_POPUP_TOKEN_RE = re.compile(
+    r'name="(?:(?P<state>__VIEWSTATE|__VIEWSTATEGENERATOR|__EVENTVALIDATION)"[^>]*?value="(?P<state_val>[^"]*)"'
+    r'|(?P<search>DWNL\$grdId\$ctl\d+\$search)")'
+    r'|id="DWNL_grdId_(?P<ctl>ctl\d+)_(?P<field>File|Type)">(?P<text>[^<]*)<'
+    r"|__doPostBack\((?:'|&#39;)DWNL\$grdId(?:'|&#39;),(?:'|&#39;)Page\$(?P<page>\d+)"
+)
+
+
+def parsear_popup_viewbid(html):
+    """
+    Extrae en una sola pasada sobre el HTML del popup (cuyo __VIEWSTATE puede pesar MB):
+      state: campos ocultos para re-postear la página
+      meta: ctlXX -> (filename, type) del grid DWNL
+      search_names: nombres de los botones de descarga, en orden y sin repetir
+      pages: números de página del paginador
+    """
+    state = {}
+    fields = {}
+    search_names = []
+    pages = []
+    for m in _POPUP_TOKEN_RE.finditer(html or ""):
+        if m.group("state"):
+            if m.group("state_val"):
+                state.setdefault(m.group("state"), m.group("state_val"))
+        elif m.group("search"):
+            if m.group("search") not in search_names:
+                search_names.append(m.group("search"))
+        elif m.group("ctl"):
+            fields.setdefault(m.group("ctl"), {})[m.group("field")] = unescape(m.group("text")).strip()
+        elif m.group("page") and m.group("page") not in pages:
+            pages.append(m.group("page"))
+    meta = {ctl: (f.get("File", ""), f.get("Type", "")) for ctl, f in fields.items() if f.get("File")}
+    return {"state": state, "meta": meta, "search_names": search_names, "pages": pages}
+
+
+# ---------------- Formularios ASP.NET ----------------
+_POSTBACK_RE = re.compile(r"__doPostBack\(\s*['\"]([^'\"]*)['\"]\s*,\s*['\"]([^'\"]*)['\"]")
+
+
+class _ParserFormulario(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.formulario = {"action": "", "campos": {}, "botones": {}, "postbacks": {}, "nombres": {}}
+        self._select = None
+        self._option = None
+        self._textarea = None
+
+    def handle_starttag(self, tag, attrs):
+        a = {k: (v if v is not None else "") for k, v in attrs}
+        nombre = a.get("name")
+        campos = self.formulario["campos"]
+        if tag == "form":
+            self.formulario["action"] = self.formulario["action"] or a.get("action", "")
+        elif tag in ("input", "button") and nombre:
+            tipo = a.get("type", "text" if tag == "input" else "submit").lower()
+            if a.get("id"):
+                self.formulario["nombres"][a["id"]] = nombre
+            if tipo in ("submit", "image", "button", "reset"):
+                self.formulario["botones"][a.get("id") or nombre] = (nombre, a.get("value", ""), tipo)
+            elif tipo in ("checkbox", "radio"):
+                if "checked" in a:
+                    campos[nombre] = a.get("value", "on")
+            elif tipo != "file":
+                campos[nombre] = a.get("value", "")
+        elif tag == "select" and nombre:
+            self._select = nombre
+            if a.get("id"):
+                self.formulario["nombres"][a["id"]] = nombre
+        elif tag == "option" and self._select:
+            seleccionada = "selected" in a or self._select not in campos
+            self._option = [self._select, a.get("value"), seleccionada, ""]
+        elif tag == "textarea" and nombre:
+            self._textarea = nombre
+            campos[nombre] = ""
+        if a.get("id"):
+            m = _POSTBACK_RE.search(a.get("href", "") + " " + a.get("onclick", ""))
+            if m:
+                self.formulario["postbacks"][a["id"]] = (m.group(1), m.group(2))
+
+    def handle_data(self, data):
+        if self._option is not None:
+            self._option[3] += data
+        elif self._textarea:
+            self.formulario["campos"][self._textarea] += data
+
+    def handle_endtag(self, tag):
+        if tag in ("option", "select") and self._option is not None:
+            select, valor, seleccionada, texto = self._option
+            if seleccionada:
+                self.formulario["campos"][select] = valor if valor is not None else texto.strip()
+            self._option = None
+        if tag == "select":
+            self._select = None
+        elif tag == "textarea":
+            self._textarea = None
+
+
+def parsear_formulario_aspnet(html):
+    """
+    Campos de una página ASP.NET para emular un postback con requests:
+      action: action del form
+      campos: name -> valor de los controles que el navegador enviaría (ocultos como __VIEWSTATE,
+              textos, checkboxes/radios marcados, opción seleccionada de cada select)
+      botones: id -> (name, value, type) de los botones submit/image
+      postbacks: id -> (target, argumento) de los links/controles con __doPostBack
+      nombres: id -> name de cada control (el name es el que va en el POST)
+    """
+    parser = _ParserFormulario()
+    parser.feed(html or "")
+    parser.close()
+    return parser.formulario
+
+
+def datos_postback(formulario, control, argumento=""):
+    """
+    Datos del POST que genera el navegador al activar `control` (id de un botón submit o de un
+    link con __doPostBack) sobre un formulario de parsear_formulario_aspnet.
+    """
+    datos = dict(formulario["campos"])
+    datos.setdefault("__EVENTARGUMENT", "")
+    if control in formulario["botones"]:
+        nombre, valor, tipo = formulario["botones"][control]
+        if tipo == "image":
+            datos.update({f"{nombre}.x": "10", f"{nombre}.y": "10"})
+        else:
+            datos[nombre] = valor
+        datos["__EVENTTARGET"] = ""
+    else:
+        target, argumento_link = formulario["postbacks"].get(control, (control.replace("_", "$"), argumento))
+        datos["__EVENTTARGET"] = target
+        datos["__EVENTARGUMENT"] = argumento or argumento_link
+    return datos
+
+
+def carpeta_por_tipo(tipo):
+    """Subcarpeta para un tipo de adjunto (o nombre de archivo) del cuadro de ofertas."""
+    ft = unicodedata.normalize("NFKD", tipo or "").encode("ascii", "ignore").decode().lower()
+    if "administrativ" in ft or "documento para contratar" in ft:
+        return "Anexos_Administrativos"
+    if "tecnic" in ft:
+        return "Anexos_Tecnicos"
+    if "econ" in ft:
+        return "Anexos_Economicos"
+    if "garant" in ft:
+        return "Garantias"
+    return "Otros"
+
+
+# ---------------- Nombres de archivo ----------------
+def nombre_desde_disposition(dispo):
+    """Nombre de archivo de un header content-disposition (filename* o filename); '' si no trae."""
+    dispo = dispo or ""
+    m = re.search(r"filename\*\s*=\s*(?:[\w-]+'[^']*')?([^;]+)", dispo, flags=re.IGNORECASE)
+    if m:
+        nombre = unquote(m.group(1).strip().strip('"').strip("'"))
+        if nombre:
+            return nombre
+    m = re.search(r'filename\s*=\s*"?([^";]+)"?', dispo, flags=re.IGNORECASE)
+    return m.group(1).strip() if m else ""
+
+
+def extension_por_content_type(content_type):
+    """Extensión simple a partir del content-type."""
+    ct = (content_type or "").lower()
+    if "pdf" in ct:
+        return ".pdf"
+    if "zip" in ct:
+        return ".zip"
+    if "msword" in ct or "officedocument" in ct or "doc" in ct:
+        return ".doc"
+    if "excel" in ct or "spreadsheet" in ct or "xls" in ct:
+        return ".xls"
+    if "xml" in ct:
+        return ".xml"
+    if "jpeg" in ct:
+        return ".jpg"
+    if "png" in ct:
+        return ".png"
+    return ".bin"
+
+
+def nombre_para_respuesta(resp, file_name="", hint="adjunto"):
+    """
+    Nombre final: el del grid, el de content-disposition o el hint; la extensión por
+    content-type se agrega solo si el hint no trae una (ej: "Anexo Tecnico.pdf" queda igual).
+    """
+    nombre = file_name or nombre_desde_disposition(resp.headers.get("content-disposition", ""))
+    if not nombre:
+        nombre = hint
+        if not os.path.splitext(hint)[1]:
+            nombre += extension_por_content_type(resp.headers.get("content-type", ""))
+    return limpiar_nombre_archivo(nombre)
+
+
+def limpiar_nombre_archivo(nombre, max_len=160):
+    """Reemplaza caracteres inválidos en Windows, colapsa espacios y trunca preservando la extensión."""
+    nombre = re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", nombre or "")
+    nombre = " ".join(nombre.split()).strip(" .")
+    if not nombre:
+        return "archivo"
+    base, ext = os.path.splitext(nombre)
+    ext = ext[:20]
+    if len(nombre) > max_len:
+        base = base[: max(1, max_len - len(ext))].rstrip()
+        nombre = f"{base}{ext}"
+    return nombre
+
+
+def asegurar_nombre_unico(carpeta, nombre):
+    base, ext = os.path.splitext(nombre)
+    candidato = nombre
+    contador = 2
+    while os.path.exists(os.path.join(carpeta, candidato)):
+        candidato = f"{base} ({contador}){ext}"
+        contador += 1
+    return candidato
+
+
+# ---------------- Archivos y sesiones ----------------
+def escribir_stream_temporal(resp, carpeta_destino):
+    """
+    Vuelca el cuerpo de la respuesta a un archivo temporal (.part) en carpeta_destino,
+    calculando tamaño y SHA-256 al vuelo. Retorna (ruta_tmp, bytes, sha256_hex).
+    """
+    ruta_tmp = os.path.join(carpeta_destino, f".descarga_{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    total = 0
+    try:
+        with open(ruta_tmp, "xb") as f:
+            for chunk in resp.iter_content(chunk_size=CHUNK_DESCARGA):
+                if not chunk:
+                    continue
+                f.write(chunk)
+                hasher.update(chunk)
+                total += len(chunk)
+    except Exception:
+        try:
+            os.remove(ruta_tmp)
+        except Exception:
+            pass
+        raise
+    return ruta_tmp, total, hasher.hexdigest()
+
+
+def sha256_archivo(ruta):
+    hasher = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_DESCARGA), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def archivo_coincide(ruta, bytes_esperados, sha256_esperado=None):
+    """
+    True si el archivo existe con el tamaño esperado y, si se conoce, el mismo SHA-256.
+    El tamaño se compara primero para no leer archivos que ya sabemos distintos.
+    """
+    try:
+        if bytes_esperados is None or os.path.getsize(ruta) != int(bytes_esperados):
+            return False
+        return not sha256_esperado or sha256_archivo(ruta) == sha256_esperado
+    except (OSError, ValueError):
+        return False
+
+
+def clonar_sesion(base):
+    """Sesión resiliente nueva con los headers y cookies de base."""
+    sesion = sesion_resiliente()
+    sesion.headers.update(base.headers)
+    sesion.cookies.update(base.cookies)
+    return sesion
@@ -0,0 +1,270 @@
+"""
+Pool de Chrome headless para imprimir páginas a PDF (Page.printToPDF).
+
+Cada trabajo toma un navegador libre del pool, navega a la URL, espera a que la página
+esté lista (sin pausas fijas) e imprime. Así los certificados se generan en paralelo y
+sin ocupar el navegador interactivo del usuario. Los navegadores se crean a demanda, hasta
+`tamano`, y reciben las cookies de la sesión interactiva al crearse.
+"""
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+import esperas
+
+TAMANO_POOL_IMPRESION = 2
+TIMEOUT_PAGINA_LISTA = 20
+# Campos de Network.getAllCookies que acepta Network.setCookies
+_CAMPOS_COOKIE = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+
+_SCRIPT_FIRMA_PAGINA = """
+var d = document;
+if (d.readyState !== 'complete' || !d.body) return null;
+if (d.fonts && d.fonts.status !== 'loaded') return null;
+for (var i = 0; i < d.images.length; i++) { if (!d.images[i].complete) return null; }
+return d.body.getElementsByTagName('*').length + ':' + (d.body.innerText || '').length;
+"""
+
+
+def esperar_pagina_lista(driver, timeout=TIMEOUT_PAGINA_LISTA, sondeos_estables=2, intervalo=0.15):
+    """
+    Espera a que la página esté lista para imprimir: readyState complete, fuentes e imágenes
+    cargadas y el DOM sin cambios (cantidad de nodos y largo del texto) durante
+    `sondeos_estables` sondeos seguidos. Retorna True si se cumplió antes del timeout.
+    """
+    with esperas.medir("pagina_lista_pdf") as estado:
+        limite = time.monotonic() + timeout
+        anterior = None
+        estables = 0
+        while time.monotonic() < limite:
+            try:
+                firma = driver.execute_script(_SCRIPT_FIRMA_PAGINA)
+            except Exception:
+                firma = None
+            if firma is not None and firma == anterior:
+                estables += 1
+                if estables >= sondeos_estables:
+                    return True
+            else:
+                estables = 0
+            anterior = firma
+            time.sleep(intervalo)
+        estado["expirada"] = True
+        return False
+
+
+def imprimir_a_pdf(driver, destino_pdf, params=None):
+    """Imprime la página actual del driver a destino_pdf vía Chrome DevTools."""
+    resultado_pdf = driver.execute_cdp_cmd("Page.printToPDF", params or {"printBackground": True})
+    data_base64 = resultado_pdf.get("data") if isinstance(resultado_pdf, dict) else None
+    if not data_base64:
+        raise RuntimeError("Chrome no entregó datos para el PDF")
+    carpeta = os.path.dirname(destino_pdf)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    with open(destino_pdf, "wb") as f:
+        f.write(base64.b64decode(data_base64))
+
+
+def crear_driver_headless():
+    opciones = Options()
+    opciones.add_argument("--headless=new")
+    opciones.add_argument("--disable-gpu")
+    opciones.add_argument("--no-first-run")
+    opciones.add_argument("--window-size=1280,1800")
+    return webdriver.Chrome(options=opciones)
+
+
+def cookies_de_driver(driver):
+    """Cookies de todos los dominios del navegador, en el formato de Network.setCookies."""
+    try:
+        cookies = (driver.execute_cdp_cmd("Network.getAllCookies", {}) or {}).get("cookies") or []
+    except Exception:
+        return []
+    resultado = []
+    for cookie in cookies:
+        limpia = {k: cookie[k] for k in _CAMPOS_COOKIE if k in cookie}
+        if cookie.get("session") or limpia.get("expires", 0) <= 0:
+            limpia.pop("expires", None)
+        resultado.append(limpia)
+    return resultado
+
+
+def cookies_desde_archivo(ruta):
+    """
+    Cookies guardadas por la app (sesion/cookies.json, formato de driver.get_cookies()) en el
+    formato de Network.setCookies. Lista vacía si el archivo no existe o no se puede leer.
+    """
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return []
+    cookies = data.get("cookies") if isinstance(data, dict) else data
+    resultado = []
+    for cookie in cookies or []:
+        if not isinstance(cookie, dict) or not cookie.get("name"):
+            continue
+        limpia = {k: cookie[k] for k in _CAMPOS_COOKIE if k in cookie}
+        if "expiry" in cookie:
+            try:
+                limpia["expires"] = float(cookie["expiry"])
+            except (TypeError, ValueError):
+                pass
+        limpia.setdefault("path", "/")
+        resultado.append(limpia)
+    return resultado
+
+
+class PoolImpresion:
+    """
+    Pool acotado de navegadores headless para imprimir URLs a PDF desde varios hilos.
+
+    Args:
+        tamano (int): Máximo de navegadores (e impresiones simultáneas)
+        driver_origen: Navegador interactivo del que se copian las cookies de sesión
+        fabrica (callable): Crea un navegador nuevo (por defecto crear_driver_headless)
+        cookies (list): Cookies ya en formato Network.setCookies (ej: cookies_desde_archivo),
+            para usar el pool sin navegador interactivo
+    """
+
+    def __init__(self, tamano=TAMANO_POOL_IMPRESION, driver_origen=None, fabrica=None, cookies=None):
+        self.tamano = max(1, int(tamano))
+        self._fabrica = fabrica or crear_driver_headless
+        if cookies is not None:
+            self._cookies = list(cookies)
+        else:
+            self._cookies = cookies_de_driver(driver_origen) if driver_origen else []
+        self._libres = queue.Queue()
+        self._todos = []
+        self._lock = threading.Lock()
+        # Cada actualizar_cookies sube la versión; un navegador con una versión anterior recibe
+        # las cookies nuevas la próxima vez que se entrega (libres o prestados en ese momento).
+        self._version_cookies = 0
+        self._cookies_aplicadas = {}  # driver -> versión de cookies que tiene cargada
+
+    def actualizar_cookies(self, driver_origen):
+        """
+        Toma de nuevo las cookies del navegador interactivo (ej: tras iniciar sesión); los
+        navegadores ya creados las reciben antes de su próximo uso.
+        """
+        cookies = cookies_de_driver(driver_origen)
+        with self._lock:
+            self._cookies = cookies
+            self._version_cookies += 1
+
+    def _tomar(self):
+        driver = self._obtener()
+        self._sincronizar_cookies(driver)
+        return driver
+
+    def _sincronizar_cookies(self, driver):
+        with self._lock:
+            version, cookies = self._version_cookies, self._cookies
+            anterior = self._cookies_aplicadas.get(driver)
+        if anterior == version:
+            return
+        try:
+            if anterior is not None:
+                # Reemplazar, no mezclar: una sesión cerrada no debe seguir activa en el pool
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            if cookies:
+                driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+        except Exception as e:
+            print(f"[PRINT] No se pudieron copiar cookies al navegador headless: {e}")
+        with self._lock:
+            self._cookies_aplicadas[driver] = version
+
+    def _obtener(self):
+        while True:
+            try:
+                return self._libres.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                crear = len(self._todos) < self.tamano
+                if crear:
+                    self._todos.append(None)  # reserva el cupo mientras se crea fuera del lock
+            if crear:
+                break
+            # Se vuelve a revisar periódicamente: un navegador descartado libera su cupo
+            try:
+                return self._libres.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        try:
+            driver = self._fabrica()
+        except Exception:
+            with self._lock:
+                self._todos.remove(None)
+            raise
+        with self._lock:
+            self._todos[self._todos.index(None)] = driver
+        return driver
+
+    def _descartar(self, driver):
+        with self._lock:
+            if driver in self._todos:
+                self._todos.remove(driver)
+            self._cookies_aplicadas.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def prestar(self):
+        """
+        Entrega un navegador del pool para uso exclusivo mientras dure el bloque with (ej: todo
+        el proceso de una licitación). Si el bloque termina con excepción el navegador se descarta.
+        """
+        driver = self._tomar()
+        try:
+            yield driver
+        except BaseException:
+            self._descartar(driver)
+            raise
+        self._libres.put(driver)
+
+    def imprimir(self, url, destino_pdf, tag="[PDF]"):
+        """Navega a url en un navegador del pool e imprime a destino_pdf. Retorna True/False."""
+        try:
+            driver = self._tomar()
+        except Exception as e:
+            print(f"{tag} No se pudo iniciar navegador headless: {e}")
+            return False
+        sano = True
+        try:
+            driver.get(url)
+            if not esperar_pagina_lista(driver):
+                print(f"{tag} La página no se estabilizó en {TIMEOUT_PAGINA_LISTA}s, se imprime igual: {url}")
+            imprimir_a_pdf(driver, destino_pdf)
+            print(f"{tag} PDF generado (headless) -> {destino_pdf}")
+            return True
+        except Exception as e:
+            print(f"{tag} Error imprimiendo con navegador headless: {e}")
+            sano = False
+            return False
+        finally:
+            if sano:
+                self._libres.put(driver)
+            else:
+                self._descartar(driver)
+
+    def cerrar(self):
+        with self._lock:
+            drivers = [d for d in self._todos if d is not None]
+            self._todos = []
+            self._cookies_aplicadas = {}
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
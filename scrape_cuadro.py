@@ -14,9 +14,10 @@ from __future__ import annotations
 
 import os
 import re
-import time
-import unicodedata
-from typing import Iterable, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
+from html.parser import HTMLParser
+from typing import List, Tuple
 from urllib.parse import urljoin
 
 import requests
@@ -28,10 +29,16 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
 import descarga_ca
+import esperas
+import motor_descargas
 
 URL = "https://mercadopublico.cl/Procurement/Modules/RFB/DetailsAcquisition.aspx?qs=5vvQo+7VGfY18eev2hYLBQ=="
 BASE = "https://mercadopublico.cl"
 DOWNLOAD_DIR = "adjuntos"
+# Popups ViewBidAttachment procesados a la vez (cada uno con su propia sesión/viewstate)
+MAX_WORKERS_POPUPS = 4
+# Campos de cada archivo que se guardan en el ledger (resumen["archivos"] / manifest_licitacion.json)
+CAMPOS_LEDGER = ("ruta_rel", "url", "nombre", "tipo", "bytes", "sha256")
 USER_AGENT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
     "(KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36"
@@ -61,12 +68,11 @@ def open_frame_directly(driver: webdriver.Chrome, wait: WebDriverWait, base_url:
     """
     base_url = base_url or URL
     driver.switch_to.default_content()
-    # Pequeño respiro para que aparezca el overlay como usuario real
-    time.sleep(1.0)
     try:
-        popup_iframe = wait.until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "#RadWindowWrapper_PopupFicha iframe"))
-        )
+        with esperas.medir("iframe_popup"):
+            popup_iframe = wait.until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "#RadWindowWrapper_PopupFicha iframe"))
+            )
     except TimeoutException:
         print("No se encontró el iframe del popup dentro del overlay.")
         return False
@@ -111,7 +117,7 @@ def switch_to_cuerpo_frame(driver: webdriver.Chrome, wait: WebDriverWait) -> boo
     print(f"Frame 'Cuerpo' encontrado, src='{src}'")
     try:
         driver.switch_to.frame(frame_el)
-        time.sleep(1.0)
+        esperas.esperar_dom_estable(driver, timeout=10, nombre="frame_cuerpo")
         return True
     except Exception as exc:
         print(f"No se pudo cambiar al frame Cuerpo: {exc}")
@@ -140,97 +146,74 @@ def _normalize_provider_dir(provider_name: str, idx: int | None = None) -> str:
     return nombre or (f"Proveedor_{idx}" if idx else "Proveedor")
 
 
-def _count_elements_with_providers(driver: webdriver.Chrome) -> Tuple[int, List[dict]]:
+def _count_elements_with_providers(
+    driver: webdriver.Chrome,
+    previos: dict | None = None,
+    registro: List[dict] | None = None,
+    max_workers: int | None = None,
+    almacen_blobs: motor_descargas.AlmacenBlobs | None = None,
+    al_guardar=None,
+    download_dir: str | None = None,
+) -> Tuple[int, List[dict]]:
     """
-    Cuenta, lista y descarga adjuntos; retorna (total_descargados, proveedores_meta).
+    Cuenta, lista y descarga adjuntos del cuadro abierto en el driver (leído de su page_source con
+    parsear_cuadro_ofertas); retorna (total_descargados, proveedores_meta).
 
     proveedores_meta: lista de dicts {rut, nombre, carpeta_rel}
     donde carpeta_rel es el nombre de carpeta del proveedor bajo DOWNLOAD_DIR.
+    previos: ledger {ruta_rel: {bytes, sha256}} de una ejecución anterior; los archivos que
+    siguen en disco con el mismo tamaño y hash se omiten sin hacer el POST.
+    registro: lista donde se agrega la metadata (CAMPOS_LEDGER) de cada archivo descargado u omitido.
+    almacen_blobs: almacén por contenido opcional; los adjuntos quedan como hardlinks a él.
+    al_guardar: callable que recibe la ruta de cada archivo recién descargado.
+    download_dir: carpeta de destino (por defecto DOWNLOAD_DIR); se pasa explícita para que
+    varias licitaciones puedan descargarse a la vez en hilos distintos.
+
+    La descarga la hace motor_descargas con max_workers popups en paralelo (por defecto
+    MAX_WORKERS_POPUPS), cada uno con un clon de la sesión del navegador; el log y los
+    contadores se escriben en el hilo principal, en el orden original de los popups.
     """
-    print(f"URL actual: {driver.current_url}")
-    rows = driver.find_elements(
-        By.CSS_SELECTOR,
-        "#grdSupplies tr.cssFwkItemStyle, #grdSupplies tr.cssFwkAlternatingItemStyle",
-    )
-    if not rows:
+    url_actual = driver.current_url
+    print(f"URL actual: {url_actual}")
+    # Un solo page_source del frame actual en vez de find_elements/.text/get_attribute por fila y
+    # por celda: cada llamada es un round-trip a chromedriver y con muchas ofertas son cientos.
+    cuadro = parsear_cuadro_ofertas(driver.page_source, base_url=url_actual or BASE)
+    if not cuadro["filas"]:
         print("No se encontraron filas de proveedores en grdSupplies.")
         return 0, []
+    proveedores_meta, all_attachment_urls = _proveedores_y_adjuntos(cuadro)
 
-    # Imprime solo RUT en bloque para fácil lectura
-    rut_links = driver.find_elements(By.CSS_SELECTOR, "#grdSupplies a[id$='_GvLblRutProvider']")
-    ruts = [el.text.strip() for el in rut_links if el.text.strip()]
-    print(f"RUT proveedores ({len(ruts)}): {', '.join(ruts)}")
-    print(f"Total filas: {len(rows)}")
-
-    admin_attach = driver.find_elements(By.CSS_SELECTOR, "input[id$='_GvImgbAdministrativeAttachment']")
-    print(f"Botones 'Anexos Administrativos' detectados: {len(admin_attach)}")
-    # Log de primeros botones admin
-    for idx, btn in enumerate(admin_attach[:5]):
-        print(f" Admin btn {idx} id={btn.get_attribute('id')} title={btn.get_attribute('title')} onclick={btn.get_attribute('onclick')}")
-
-    # Detalle por fila
-    print("Detalle por fila:")
-    all_attachment_urls: List[Tuple[str, str, str, str]] = []  # (url, rut, prov, title_hint)
-    proveedores_meta: List[dict] = []
-    for row in rows:
-        rut = _safe_text(row.find_elements(By.CSS_SELECTOR, "a[id$='_GvLblRutProvider']"))
-        prov = _safe_text(row.find_elements(By.CSS_SELECTOR, "a[id$='_GvLblProvider']"))
-        nombre = _safe_text(row.find_elements(By.CSS_SELECTOR, "span[id$='_GvLblSuppliesName']"))
-        total = _safe_text(row.find_elements(By.CSS_SELECTOR, "span[id$='TotalOferta']"))
-        estado = _safe_text(row.find_elements(By.CSS_SELECTOR, "span[id$='EstadoOferta']"))
-        print(f"- {rut} | {prov} | {nombre} | {total} | {estado}")
-        carpeta_rel = _normalize_provider_dir(prov, len(proveedores_meta) + 1)
-        voucher_url = ""
-        try:
-            voucher_btns = row.find_elements(
-                By.CSS_SELECTOR,
-                "input[type='image'][id$='_imgView'], input[type='image'][title*='Comprobante'], input[type='image'][onclick*='voucherview.aspx']",
-            )
-            for btn in voucher_btns:
-                onclick = btn.get_attribute("onclick") or ""
-                rel = _extract_url_from_openpopup(onclick)
-                if rel and "voucherview.aspx" in rel.lower():
-                    voucher_url = rel
-                    break
-        except Exception:
-            voucher_url = ""
-
-        if voucher_url and not voucher_url.startswith("http"):
-            try:
-                voucher_url = urljoin(driver.current_url or BASE, voucher_url)
-            except Exception:
-                voucher_url = urljoin(BASE, voucher_url)
-
-        proveedores_meta.append(
-            {
-                "rut": (rut or "").strip(),
-                "nombre": (prov or "").strip(),
-                "carpeta_rel": carpeta_rel,
-                "voucher_url": voucher_url,
-            }
-        )
-        attachments = _extract_attachments(row)
-        print(f"  Adjuntos en fila: {len(attachments)} -> {[t for t, _ in attachments]}")
-        for title, url in attachments:
-            if url:
-                all_attachment_urls.append((url, rut, prov, title))
-
-    # Fallback: busca cualquier botón admin por título/src aunque no haya sido capturado por fila
-    fallback_admin_btns = driver.find_elements(
-        By.CSS_SELECTOR,
-        "input[id*='ImgbAdministrativeAttachment'], input[title*='Anexos Administrativos'], input[src*='adj-administrativos']",
+    # Descarga de todos los adjuntos (incluidos administrativos)
+    downloaded_total = _descargar_adjuntos_cuadro(
+        _requests_session_from_driver(driver),
+        all_attachment_urls,
+        previos=previos,
+        registro=registro,
+        max_workers=max_workers,
+        almacen_blobs=almacen_blobs,
+        al_guardar=al_guardar,
+        download_dir=download_dir,
     )
-    print(f"Fallback botones admin encontrados: {len(fallback_admin_btns)}")
-    for btn in fallback_admin_btns:
-        onclick = btn.get_attribute("onclick") or ""
-        url = _extract_url_from_onclick(onclick)
-        if url:
-            all_attachment_urls.append((url, "", "", btn.get_attribute("title") or ""))
+    return downloaded_total, proveedores_meta
 
-    # Descarga de todos los adjuntos (incluidos administrativos)
-    sess = _requests_session_from_driver(driver)
-    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-    log_path = os.path.join(DOWNLOAD_DIR, "adjuntos.log")
+
+def _descargar_adjuntos_cuadro(
+    sess: requests.Session,
+    all_attachment_urls: List[Tuple[str, str, str, str]],
+    previos: dict | None = None,
+    registro: List[dict] | None = None,
+    max_workers: int | None = None,
+    almacen_blobs: motor_descargas.AlmacenBlobs | None = None,
+    al_guardar=None,
+    download_dir: str | None = None,
+) -> int:
+    """
+    Descarga los adjuntos del cuadro (url, rut, proveedor, titulo) con motor_descargas, cada uno
+    en la carpeta de su proveedor; retorna cuántos archivos quedaron descargados.
+    """
+    download_dir = download_dir or DOWNLOAD_DIR
+    os.makedirs(download_dir, exist_ok=True)
+    log_path = os.path.join(download_dir, "adjuntos.log")
     downloaded_total = 0
     seen: dict[str, Tuple[str, str, str]] = {}
     for url, rut, prov, title_hint in all_attachment_urls:
@@ -242,48 +225,246 @@ def _count_elements_with_providers(driver: webdriver.Chrome) -> Tuple[int, List[
             title_hint = title_hint or prev_title
         seen[url] = (rut, prov, title_hint)
 
+    trabajos = [
+        motor_descargas.TrabajoDescarga(
+            url,
+            os.path.join(download_dir, _normalize_provider_dir(prov)),
+            tipo=title_hint,
+            nombre_hint=f"adjunto_{idx}",
+            por_tipo=True,
+        )
+        for idx, (url, (rut, prov, title_hint)) in enumerate(seen.items(), start=1)
+    ]
+    motor = motor_descargas.MotorDescargas(
+        concurrencia=motor_descargas.PoliticaConcurrencia(max_workers=max_workers or MAX_WORKERS_POPUPS),
+        almacenamiento=motor_descargas.AlmacenamientoCarpeta(
+            raiz=download_dir, previos=previos, blobs=almacen_blobs, al_guardar=al_guardar
+        ),
+    )
     with open(log_path, "a", encoding="utf-8") as log:
-        for idx, (url, (rut, prov, title_hint)) in enumerate(seen.items(), start=1):
-            fname_hint = f"adjunto_{idx}"
-            saved_list = _download_attachment_popup(
-                sess, url, fname_hint, current_rut=rut, current_prov=prov, icon_title=title_hint
-            )
-            if not saved_list:
+        for resultado in motor.descargar(trabajos, sess):
+            url = resultado["trabajo"].url
+            for error in resultado["errores"]:
+                print(error)
+            if registro is not None:
+                registro.extend({k: a.get(k) for k in CAMPOS_LEDGER} for a in resultado["archivos"])
+            if not resultado["archivos"]:
                 log.write(f"{url}|\n")
                 print(f"No se pudo descargar {url}")
                 continue
-            for saved in saved_list:
-                log.write(f"{url}|{saved}\n")
+            for archivo in resultado["archivos"]:
+                log.write(f"{url}|{archivo['ruta']}\n")
                 downloaded_total += 1
-                print(f"Descargado: {saved}")
+                print(f"Descargado: {archivo['ruta']}")
     print(f"Total adjuntos descargados: {downloaded_total}. Log: {log_path}")
-    return downloaded_total, proveedores_meta
+    return downloaded_total
+
+
+# ---------------- Cuadro de ofertas desde el HTML ----------------
+_CLASES_FILA_CUADRO = {"cssFwkItemStyle", "cssFwkAlternatingItemStyle"}
+# (sufijo del id, tag, campo): los mismos elementos que buscan los selectores [id$=...] por fila
+_CAMPOS_FILA_CUADRO = (
+    ("_GvLblRutProvider", "a", "rut"),
+    ("_GvLblProvider", "a", "proveedor"),
+    ("_GvLblSuppliesName", "span", "nombre"),
+    ("TotalOferta", "span", "total"),
+    ("EstadoOferta", "span", "estado"),
+)
+
+
+class _ParserCuadro(HTMLParser):
+    """Filas de grdSupplies (con sus botones) y botones de anexos administrativos de toda la página."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.filas: List[dict] = []
+        self.adjuntos_admin: List[Tuple[str, str]] = []
+        self._tablas = 0  # profundidad dentro de la tabla grdSupplies (0 = fuera)
+        self._fila = None
+        self._campo = None  # [campo, tag, profundidad, texto] del elemento que se está leyendo
+
+    def handle_starttag(self, tag, attrs):
+        a = {k: (v or "") for k, v in attrs}
+        if self._campo is not None and tag == self._campo[1]:
+            self._campo[2] += 1
+        if tag == "table":
+            if self._tablas:
+                self._tablas += 1
+            elif a.get("id") == "grdSupplies":
+                self._tablas = 1
+        elif tag == "input":
+            self._input(a)
+        elif self._tablas and tag == "tr" and _CLASES_FILA_CUADRO & set(a.get("class", "").split()):
+            self._fila = {
+                "rut": "",
+                "proveedor": "",
+                "nombre": "",
+                "total": "",
+                "estado": "",
+                "voucher_url": "",
+                "adjuntos": [],
+                "_vistos": set(),
+            }
+            self.filas.append(self._fila)
+        elif self._fila is not None and self._campo is None:
+            id_elemento = a.get("id", "")
+            for sufijo, tag_campo, campo in _CAMPOS_FILA_CUADRO:
+                if tag == tag_campo and id_elemento.endswith(sufijo) and campo not in self._fila["_vistos"]:
+                    self._fila["_vistos"].add(campo)
+                    self._campo = [campo, tag, 1, ""]
+                    break
 
+    def handle_endtag(self, tag):
+        if self._campo is not None and tag == self._campo[1]:
+            self._campo[2] -= 1
+            if not self._campo[2]:
+                self._fila[self._campo[0]] = " ".join(self._campo[3].split())
+                self._campo = None
+        if tag == "table" and self._tablas:
+            self._tablas -= 1
+            if not self._tablas:
+                self._fila = None
+
+    def handle_data(self, data):
+        if self._campo is not None:
+            self._campo[3] += data
+
+    def _input(self, a):
+        onclick = a.get("onclick", "")
+        id_elemento = a.get("id", "")
+        titulo = a.get("title", "")
+        if (
+            "ImgbAdministrativeAttachment" in id_elemento
+            or "Anexos Administrativos" in titulo
+            or "adj-administrativos" in a.get("src", "")
+        ):
+            url = _extract_url_from_onclick(onclick)
+            if url:
+                self.adjuntos_admin.append((titulo, url))
+        if self._fila is None or a.get("type", "").lower() != "image":
+            return
+        if "ViewBidAttachment.aspx" in onclick:
+            url = _extract_url_from_onclick(onclick)
+            if url:
+                self._fila["adjuntos"].append((titulo or "Adjunto", url))
+        if not self._fila["voucher_url"] and (
+            id_elemento.endswith("_imgView") or "Comprobante" in titulo or "voucherview.aspx" in onclick
+        ):
+            rel = _extract_url_from_openpopup(onclick)
+            if rel and "voucherview.aspx" in rel.lower():
+                self._fila["voucher_url"] = rel
 
-def _safe_iter(elements: Iterable) -> Iterable:
-    """Itera elementos permitiendo None si no existen."""
-    return elements or []
 
+def parsear_cuadro_ofertas(html: str, base_url: str | None = None) -> dict:
+    """
+    Lee el cuadro de ofertas (SupplySummary.aspx) en una sola pasada sobre su HTML:
+      filas: [{rut, proveedor, nombre, total, estado, voucher_url, adjuntos: [(titulo, url)]}]
+      adjuntos_admin: [(titulo, url)] botones de anexos administrativos de toda la página
+    Las URLs del comprobante quedan absolutas respecto de base_url.
+    """
+    parser = _ParserCuadro()
+    parser.feed(html or "")
+    parser.close()
+    for fila in parser.filas:
+        fila.pop("_vistos", None)
+        if fila["voucher_url"] and not fila["voucher_url"].startswith("http"):
+            fila["voucher_url"] = urljoin(base_url or BASE, fila["voucher_url"])
+    return {"filas": parser.filas, "adjuntos_admin": parser.adjuntos_admin}
+
+
+def _proveedores_y_adjuntos(cuadro: dict) -> Tuple[List[dict], List[Tuple[str, str, str, str]]]:
+    """proveedores_meta y adjuntos (url, rut, proveedor, titulo) desde parsear_cuadro_ofertas, con el mismo log."""
+    filas = cuadro["filas"]
+    ruts = [f["rut"] for f in filas if f["rut"]]
+    print(f"RUT proveedores ({len(ruts)}): {', '.join(ruts)}")
+    print(f"Total filas: {len(filas)}")
+    print(f"Botones 'Anexos Administrativos' detectados: {len(cuadro['adjuntos_admin'])}")
+    print("Detalle por fila:")
+    proveedores_meta: List[dict] = []
+    adjuntos: List[Tuple[str, str, str, str]] = []
+    for fila in filas:
+        print(f"- {fila['rut']} | {fila['proveedor']} | {fila['nombre']} | {fila['total']} | {fila['estado']}")
+        proveedores_meta.append(
+            {
+                "rut": fila["rut"],
+                "nombre": fila["proveedor"],
+                "carpeta_rel": _normalize_provider_dir(fila["proveedor"], len(proveedores_meta) + 1),
+                "voucher_url": fila["voucher_url"],
+            }
+        )
+        print(f"  Adjuntos en fila: {len(fila['adjuntos'])} -> {[t for t, _ in fila['adjuntos']]}")
+        adjuntos.extend((url, fila["rut"], fila["proveedor"], titulo) for titulo, url in fila["adjuntos"])
+    print(f"Fallback botones admin encontrados: {len(cuadro['adjuntos_admin'])}")
+    adjuntos.extend((url, "", "", titulo) for titulo, url in cuadro["adjuntos_admin"])
+    return proveedores_meta, adjuntos
 
-def _safe_text(elements: Iterable) -> str:
-    """Devuelve el texto del primer elemento o cadena vacía."""
-    for el in elements or []:
-        return el.text.strip()
-    return ""
 
+# ---------------- Cuadro de ofertas sin navegador ----------------
+_LINK_CUADRO_RE = re.compile(r'<a\b[^>]*\bid="imgCuadroOferta"[^>]*>', re.IGNORECASE)
+_HREF_RE = re.compile(r'\bhref="([^"]+)"', re.IGNORECASE)
+_SUPPLY_SUMMARY_RE = re.compile(r"[\w./-]*SupplySummary\.aspx\?enc=[^\"'\s<>]+", re.IGNORECASE)
+_FRAME_SRC_RE = re.compile(r"<i?frame\b[^>]*\bsrc=[\"']([^\"']+)[\"']", re.IGNORECASE)
+# OpeningFrame -> frames (OpeningHeader, ...) -> SupplySummary: páginas a recorrer como máximo
+MAX_PAGINAS_CUADRO_HTTP = 5
 
-def _extract_attachments(row) -> List[Tuple[str, str]]:
-    """Obtiene títulos y URLs absolutas de adjuntos en la fila."""
-    atts = []
-    inputs = row.find_elements(By.CSS_SELECTOR, "input[type='image'][onclick*='ViewBidAttachment.aspx']")
-    for inp in inputs:
-        onclick = inp.get_attribute("onclick") or ""
-        url = _extract_url_from_onclick(onclick)
-        if not url:
-            continue
-        title = inp.get_attribute("title") or "Adjunto"
-        atts.append((title, url))
-    return atts
+
+def sesion_http(driver: webdriver.Chrome | None = None, cookies: List[dict] | None = None) -> requests.Session:
+    """
+    Sesión para el flujo sin navegador: headers de Chrome y las cookies del driver o, si no hay
+    driver, las de `cookies` (formato de driver.get_cookies(), ej: las guardadas en sesion/cookies.json).
+    """
+    if driver is not None:
+        try:
+            return _requests_session_from_driver(driver)
+        except Exception:
+            pass
+    sess = motor_descargas.sesion_resiliente()
+    sess.headers.update({"User-Agent": USER_AGENT, "Accept-Language": "es-CL,es;q=0.9,en;q=0.8"})
+    for c in cookies or []:
+        sess.cookies.set(c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"))
+    return sess
+
+
+def resolver_cuadro_http(url_ficha: str, sess: requests.Session, html_ficha: str | None = None):
+    """
+    Llega al cuadro de ofertas con requests, sin ejecutar JavaScript: link imgCuadroOferta de la
+    ficha -> OpeningFrame.aspx -> frames -> SupplySummary.aspx con la tabla grdSupplies.
+
+    Returns:
+        tuple: (html, url) del SupplySummary, o None si no se pudo (el llamador usa el navegador)
+    """
+    try:
+        if html_ficha is None:
+            resp = sess.get(url_ficha, timeout=30)
+            resp.raise_for_status()
+            html_ficha, url_ficha = resp.text, resp.url
+        link = _LINK_CUADRO_RE.search(html_ficha or "")
+        href = _HREF_RE.search(link.group(0)) if link else None
+        if not href:
+            print("[HTTP] La ficha no tiene link al cuadro de ofertas (imgCuadroOferta).")
+            return None
+        pendientes = [urljoin(url_ficha, unescape(href.group(1)))]
+        vistas = set()
+        while pendientes and len(vistas) < MAX_PAGINAS_CUADRO_HTTP:
+            url = pendientes.pop(0)
+            if url in vistas:
+                continue
+            vistas.add(url)
+            resp = sess.get(url, timeout=30, headers={"Referer": url_ficha})
+            resp.raise_for_status()
+            html = resp.text
+            if 'id="grdSupplies"' in html:
+                return html, resp.url
+            supply = _SUPPLY_SUMMARY_RE.search(html)
+            if supply:
+                pendientes.insert(0, urljoin(resp.url, unescape(supply.group(0))))
+            else:
+                pendientes.extend(urljoin(resp.url, unescape(src)) for src in _FRAME_SRC_RE.findall(html))
+    except Exception as exc:
+        print(f"[HTTP] Error abriendo el cuadro de ofertas: {exc}")
+        return None
+    print("[HTTP] No se encontró la tabla grdSupplies sin navegador.")
+    return None
 
 
 def _extract_url_from_onclick(onclick: str) -> str:
@@ -309,220 +490,13 @@ def _extract_url_from_openpopup(onclick: str) -> str:
 
 def _requests_session_from_driver(driver: webdriver.Chrome) -> requests.Session:
     """Crea sesión requests con cookies del driver."""
-    sess = requests.Session()
+    sess = motor_descargas.sesion_resiliente()
     sess.headers.update({"User-Agent": USER_AGENT, "Referer": driver.current_url})
     for c in driver.get_cookies():
         sess.cookies.set(c["name"], c["value"])
     return sess
 
 
-def _download_file(session: requests.Session, url: str, name_hint: str) -> str:
-    """Descarga un adjunto a DOWNLOAD_DIR; devuelve ruta o ''."""
-    if not url:
-        return ""
-    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-    try:
-        resp = session.get(url, stream=True, timeout=60)
-        resp.raise_for_status()
-    except Exception as exc:
-        print(f"Error descargando {url}: {exc}")
-        return ""
-
-    dispo = resp.headers.get("content-disposition", "")
-    fname = _filename_from_disposition(dispo)
-    if not fname:
-        ext = _guess_ext(resp.headers.get("content-type", ""))
-        fname = f"{name_hint}{ext}"
-
-    safe_name = fname.replace("/", "-")
-    path = os.path.join(DOWNLOAD_DIR, safe_name)
-    try:
-        with open(path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-    except Exception as exc:
-        print(f"Error guardando {path}: {exc}")
-        return ""
-    return path
-
-
-def _filename_from_disposition(dispo: str) -> str:
-    m = re.search(r'filename="?([^";]+)"?', dispo)
-    return m.group(1) if m else ""
-
-
-def _guess_ext(content_type: str) -> str:
-    """Devuelve extensión simple según content-type."""
-    ct = content_type.lower()
-    if "pdf" in ct:
-        return ".pdf"
-    if "zip" in ct:
-        return ".zip"
-    if "msword" in ct or "officedocument" in ct or "doc" in ct:
-        return ".doc"
-    if "excel" in ct or "spreadsheet" in ct or "xls" in ct:
-        return ".xls"
-    if "xml" in ct:
-        return ".xml"
-    return ".bin"
-
-
-def _normalize_type_dir(file_type: str) -> str:
-    ft_raw = file_type or ""
-    ft = unicodedata.normalize("NFKD", ft_raw).encode("ascii", "ignore").decode().lower()
-    if "administrativ" in ft or "documento para contratar" in ft:
-        return "Anexos_Administrativos"
-    if "tecnic" in ft:
-        return "Anexos_Tecnicos"
-    if "econ" in ft:
-        return "Anexos_Economicos"
-    if "garant" in ft:
-        return "Garantias"
-    return "Otros"
-
-
-def _parse_popup_metadata(html: str) -> dict:
-    """
-    Retorna dict ctlXX -> (filename, type) del grid DWNL.
-    """
-    meta = {}
-    rows = re.findall(
-        r'id="DWNL_grdId_(ctl\d+)_File">([^<]+)</span>.*?id="DWNL_grdId_\1_Type">([^<]+)</span>',
-        html,
-        flags=re.DOTALL,
-    )
-    for ctl, fname, ftype in rows:
-        meta[ctl] = (fname.strip(), ftype.strip())
-    return meta
-
-
-def _download_attachment_popup(
-    session: requests.Session,
-    url: str,
-    name_hint: str,
-    current_rut: str = "",
-    current_prov: str = "",
-    icon_title: str = "",
-) -> List[str]:
-    """
-    Descarga un adjunto de la página ViewBidAttachment.aspx realizando el POST
-    que dispara cada botón de búsqueda.
-    """
-    downloaded_paths: List[str] = []
-    pending_pages = ["1"]
-    processed_pages = set()
-
-    while pending_pages:
-        page = pending_pages.pop(0)
-        if page in processed_pages:
-            continue
-        processed_pages.add(page)
-
-        # Obtiene HTML de la página/página específica
-        try:
-            if page == "1":
-                resp = session.get(url, timeout=30)
-            else:
-                # Post para cambiar de página
-                state = _parse_state(html) if "html" in locals() else {}
-                data = state.copy()
-                data["__EVENTTARGET"] = "DWNL$grdId"
-                data["__EVENTARGUMENT"] = f"Page${page}"
-                resp = session.post(url, data=data, timeout=30)
-            resp.raise_for_status()
-        except Exception as exc:
-            print(f"Error al obtener popup/página {page} {url}: {exc}")
-            continue
-
-        html = resp.text
-        state = _parse_state(html)
-        search_names = re.findall(r'name="(DWNL\$grdId\$ctl\d+\$search)"', html)
-        page_links = re.findall(r"__doPostBack\('DWNL\$grdId','Page\$(\d+)'", html)
-        for p in page_links:
-            if p not in processed_pages and p not in pending_pages:
-                pending_pages.append(p)
-
-        if not search_names:
-            print(f"No se encontraron botones de descarga en popup {url} página {page}")
-            continue
-
-        meta = _parse_popup_metadata(html)
-
-        for idx, name in enumerate(search_names, start=1):
-            data = state.copy()
-            data["__EVENTTARGET"] = name
-            data["__EVENTARGUMENT"] = ""
-            data[name + ".x"] = "10"
-            data[name + ".y"] = "10"
-            data.setdefault("DWNL$ctl10", "")
-            try:
-                r = session.post(url, data=data, stream=True, timeout=60)
-                r.raise_for_status()
-            except Exception as exc:
-                print(f"Error al postear {name} en {url}: {exc}")
-                continue
-            ctl = name.split("$")[-2]  # ctlXX
-            file_name, file_type = meta.get(ctl, ("", icon_title))
-            saved = _save_stream_to_file(
-                r,
-                f"{name_hint}_{page}_{idx}",
-                current_rut=current_rut,
-                current_prov=current_prov,
-                file_name=file_name,
-                file_type=file_type,
-            )
-            if saved:
-                downloaded_paths.append(saved)
-                print(f"Descargado desde popup {url}: {saved}")
-    return downloaded_paths
-
-
-def _save_stream_to_file(
-    resp: requests.Response,
-    name_hint: str,
-    current_rut: str = "",
-    current_prov: str = "",
-    file_name: str = "",
-    file_type: str = "",
-) -> str:
-    dispo = resp.headers.get("content-disposition", "")
-    fname = file_name or _filename_from_disposition(dispo)
-    if not fname:
-        ext = _guess_ext(resp.headers.get("content-type", ""))
-        fname = f"{name_hint}{ext}"
-    safe_name = fname.replace("/", "-")
-
-    prov_dir = _normalize_provider_dir(current_prov)
-    tipo_dir = _normalize_type_dir(file_type or fname)
-    base_path = os.path.join(DOWNLOAD_DIR, prov_dir, tipo_dir)
-    os.makedirs(base_path, exist_ok=True)
-    path = os.path.join(base_path, safe_name)
-    try:
-        with open(path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        return path
-    except Exception as exc:
-        print(f"Error guardando {path}: {exc}")
-        return ""
-
-
-def _extract_hidden(html: str, field: str) -> str:
-    m = re.search(rf'name="{re.escape(field)}"[^>]*value="([^"]*)"', html)
-    return m.group(1) if m else ""
-
-
-def _parse_state(html: str) -> dict:
-    state = {}
-    for field in ("__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION"):
-        val = _extract_hidden(html, field)
-        if val:
-            state[field] = val
-    return state
-
-
 def _configure_stealth(driver: webdriver.Chrome) -> None:
     """Ajustes básicos para parecer usuario real."""
     try:
@@ -559,9 +533,8 @@ def main() -> None:
         if not open_frame_directly(driver, wait, base_url=URL):
             print("No se pudo abrir directamente el OpeningFrame.")
             return
-        # Esperar carga completa del documento
-        wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
-        time.sleep(2.0)
+        # Esperar carga completa del documento (sin requests ni cambios de DOM pendientes)
+        esperas.esperar_dom_estable(driver, timeout=20, nombre="opening_frame")
         os.makedirs("capturas", exist_ok=True)
         debug_html_path = os.path.join("capturas", "opening_debug.html")
         with open(debug_html_path, "w", encoding="utf-8") as f:
@@ -573,10 +546,8 @@ def main() -> None:
         print(f"Cantidad de iframes en la página: {len(frames)} -> {[f.get_attribute('src') for f in frames[:5]]}")
         # Log rápido de elementos clave
         print(f"Filas encontradas sin espera: {len(driver.find_elements(By.CSS_SELECTOR, '#grdSupplies tr'))}")
-        print(
-            f"Botones admin sin espera: "
-            f"{len(driver.find_elements(By.CSS_SELECTOR, 'input[id$=\"_GvImgbAdministrativeAttachment\"]'))}"
-        )
+        admin_sin_espera = driver.find_elements(By.CSS_SELECTOR, "input[id$='_GvImgbAdministrativeAttachment']")
+        print(f"Botones admin sin espera: {len(admin_sin_espera)}")
 
         # Si es frameset, entra al frame Cuerpo
         switched_cuerpo = switch_to_cuerpo_frame(driver, wait)
@@ -625,26 +596,83 @@ def main() -> None:
     finally:
         # Cierra el navegador al terminar para evitar procesos colgados.
         driver.quit()
+        esperas.resumen_esperas()
 
 
 if __name__ == "__main__":
     main()
 
 
-def descargar_adjuntos_desde_url(url: str, driver: webdriver.Chrome, codigo: str | None = None, download_dir: str | None = None) -> dict:
+def _descargar_certificados_proveedor(codigo: str, destino: str, prov: dict, driver: webdriver.Chrome) -> None:
+    """Declaración jurada, certificado de habilidad y comprobante de oferta de un proveedor."""
+    rut = (prov.get("rut") or "").strip()
+    carpeta_rel = (prov.get("carpeta_rel") or "").strip()
+    if not rut or not carpeta_rel:
+        return
+
+    carpeta_prov = os.path.join(destino, carpeta_rel)
+    carpeta_certificados = os.path.join(carpeta_prov, "Certificados")
+    try:
+        os.makedirs(carpeta_certificados, exist_ok=True)
+    except Exception:
+        pass
+
+    try:
+        descarga_ca.descargar_declaracion_jurada_licitacion_a_carpeta(
+            codigo,
+            rut,
+            carpeta_certificados,
+            driver=driver,
+            nombre_archivo="DeclaracionJurada.pdf",
+        )
+    except Exception:
+        pass
+
+    try:
+        descarga_ca.descargar_certificado_habilidad_a_carpeta(
+            rut,
+            carpeta_certificados,
+            driver=driver,
+            nombre_archivo="CertificadoHabilidad.pdf",
+        )
+    except Exception:
+        pass
+
+    # Comprobante de oferta (voucherview.aspx) -> PDF
+    voucher_url = (prov.get("voucher_url") or "").strip()
+    if voucher_url:
+        try:
+            descarga_ca.descargar_pdf_a_archivo(
+                voucher_url,
+                os.path.join(carpeta_certificados, "ComprobanteOferta.pdf"),
+                driver=driver,
+                tag="[VOUCHER]",
+            )
+        except Exception:
+            pass
+
+
+def descargar_adjuntos_desde_url(
+    url: str,
+    driver: webdriver.Chrome,
+    codigo: str | None = None,
+    download_dir: str | None = None,
+    almacen_blobs: motor_descargas.AlmacenBlobs | None = None,
+    zip_en_curso=None,
+) -> dict:
     """
     Abre la licitación indicada, ingresa al Cuadro de Ofertas y descarga adjuntos
     usando la misma lógica de scrape_cuadro, devolviendo un resumen.
+
+    El resumen incluye "archivos" (ruta_rel, bytes, sha256 por archivo); al guardarse como
+    manifest_licitacion.json sirve de ledger para que una re-ejecución solo baje lo que falta.
+    Con almacen_blobs, los adjuntos repetidos entre licitaciones se guardan una sola vez en disco.
+    Con zip_en_curso (empaquetado_zip.ZipEnCurso) cada adjunto se agrega al ZIP de la licitación
+    apenas termina de descargarse.
     """
     wait = WebDriverWait(driver, 60)
-    global DOWNLOAD_DIR
-    previo_dir = DOWNLOAD_DIR
-    destino = download_dir
-    if not destino:
-        destino = os.path.join("Descargas", "Licitaciones", codigo or "sin_codigo")
-    DOWNLOAD_DIR = destino
-
-    resultado = {"ok": False, "descargados": 0, "download_dir": destino, "errores": [], "proveedores": []}
+    destino = download_dir or os.path.join("Descargas", "Licitaciones", codigo or "sin_codigo")
+    resultado, previos = _iniciar_resultado(destino)
 
     try:
         print(f"[SCRAPE_CUADRO] Abriendo URL directa: {url}")
@@ -664,8 +692,7 @@ def descargar_adjuntos_desde_url(url: str, driver: webdriver.Chrome, codigo: str
         if not open_frame_directly(driver, wait, base_url=url):
             resultado["errores"].append("No se pudo abrir OpeningFrame del cuadro.")
             return resultado
-        wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
-        time.sleep(1.5)
+        esperas.esperar_dom_estable(driver, timeout=20, nombre="opening_frame")
     except Exception as exc:
         resultado["errores"].append(f"Error abriendo OpeningFrame: {exc}")
         return resultado
@@ -697,9 +724,101 @@ def descargar_adjuntos_desde_url(url: str, driver: webdriver.Chrome, codigo: str
         resultado["errores"].append(f"Error esperando la tabla de ofertas: {exc}")
         return resultado
 
+    def _descargar(registro, al_guardar):
+        return _count_elements_with_providers(
+            driver,
+            previos=previos,
+            registro=registro,
+            almacen_blobs=almacen_blobs,
+            al_guardar=al_guardar,
+            download_dir=destino,
+        )
+
+    return _descargar_y_resumir(resultado, previos, destino, codigo, _descargar, driver, zip_en_curso)
+
+
+def descargar_adjuntos_http(
+    url: str,
+    sess: requests.Session,
+    codigo: str | None = None,
+    download_dir: str | None = None,
+    almacen_blobs: motor_descargas.AlmacenBlobs | None = None,
+    zip_en_curso=None,
+    driver: webdriver.Chrome | None = None,
+    html_ficha: str | None = None,
+) -> dict | None:
+    """
+    Lo mismo que descargar_adjuntos_desde_url pero sin navegador: el cuadro de ofertas se pide
+    con requests (resolver_cuadro_http) y se lee con parsear_cuadro_ofertas.
+
+    Retorna None si no se llegó a la tabla grdSupplies o no tiene filas (antes de tocar la
+    carpeta destino), para que el llamador repita la licitación con Selenium. driver es
+    opcional y solo se usa para imprimir certificados si no hay pool de impresión.
+    """
+    cuadro_http = resolver_cuadro_http(url, sess, html_ficha=html_ficha)
+    if cuadro_http is None:
+        return None
+    html, url_cuadro = cuadro_http
+    cuadro = parsear_cuadro_ofertas(html, base_url=url_cuadro)
+    if not cuadro["filas"]:
+        print("[HTTP] El cuadro de ofertas no trae filas de proveedores sin navegador.")
+        return None
+
+    destino = download_dir or os.path.join("Descargas", "Licitaciones", codigo or "sin_codigo")
+    resultado, previos = _iniciar_resultado(destino)
+    sess.headers["Referer"] = url_cuadro
+
+    def _descargar(registro, al_guardar):
+        proveedores_meta, adjuntos = _proveedores_y_adjuntos(cuadro)
+        descargados = _descargar_adjuntos_cuadro(
+            sess,
+            adjuntos,
+            previos=previos,
+            registro=registro,
+            almacen_blobs=almacen_blobs,
+            al_guardar=al_guardar,
+            download_dir=destino,
+        )
+        return descargados, proveedores_meta
+
+    return _descargar_y_resumir(resultado, previos, destino, codigo, _descargar, driver, zip_en_curso)
+
+
+def _iniciar_resultado(destino: str):
+    """Resultado vacío de la descarga y archivos ya registrados en el manifest previo (ruta_rel -> entrada)."""
+    manifest_previo = descarga_ca._cargar_manifest(os.path.join(destino, descarga_ca.MANIFEST_LICITACION_FILENAME))
+    previos = {
+        a["ruta_rel"]: a
+        for a in manifest_previo.get("archivos") or []
+        if isinstance(a, dict) and a.get("ruta_rel")
+    }
+    resultado = {
+        "ok": False,
+        "descargados": 0,
+        "download_dir": destino,
+        "errores": [],
+        "proveedores": [],
+        "archivos": list(previos.values()),
+    }
+    return resultado, previos
+
+
+def _descargar_y_resumir(resultado, previos, destino, codigo, descargar, driver, zip_en_curso) -> dict:
+    """
+    Parte común de la descarga con o sin navegador: descargar(registro, al_guardar) baja los
+    adjuntos y retorna (descargados, proveedores_meta); luego se crean las carpetas de
+    proveedores, se imprimen sus certificados y se arma el resumen.
+    """
+    registro: List[dict] = []
+    al_guardar = None
+    if zip_en_curso is not None:
+        zip_en_curso.abrir(destino, descarga_ca.ruta_zip_proceso(destino))
+        al_guardar = zip_en_curso.agregar
+
     try:
-        descargados, proveedores_meta = _count_elements_with_providers(driver)
+        descargados, proveedores_meta = descargar(registro, al_guardar)
         proveedores_meta = proveedores_meta or []
+        resultado["archivos"] = list({**previos, **{a["ruta_rel"]: a for a in registro}}.values())
 
         # Asegurar carpetas de proveedores aunque no tengan adjuntos
         for prov in proveedores_meta:
@@ -711,54 +830,18 @@ def descargar_adjuntos_desde_url(url: str, driver: webdriver.Chrome, codigo: str
             except Exception:
                 pass
 
-        # Descargar certificados por proveedor (si hay código y RUT)
+        # Descargar certificados por proveedor (si hay código y RUT); en paralelo si hay pool
+        # de impresión headless, secuencial si la impresión usa el navegador compartido.
         if codigo and proveedores_meta:
-            for prov in proveedores_meta:
-                rut = (prov.get("rut") or "").strip()
-                carpeta_rel = (prov.get("carpeta_rel") or "").strip()
-                if not rut or not carpeta_rel:
-                    continue
-
-                carpeta_prov = os.path.join(destino, carpeta_rel)
-                carpeta_certificados = os.path.join(carpeta_prov, "Certificados")
-                try:
-                    os.makedirs(carpeta_certificados, exist_ok=True)
-                except Exception:
-                    pass
-
-                try:
-                    descarga_ca.descargar_declaracion_jurada_licitacion_a_carpeta(
-                        codigo,
-                        rut,
-                        carpeta_certificados,
-                        driver=driver,
-                        nombre_archivo="DeclaracionJurada.pdf",
-                    )
-                except Exception:
-                    pass
-
-                try:
-                    descarga_ca.descargar_certificado_habilidad_a_carpeta(
-                        rut,
-                        carpeta_certificados,
-                        driver=driver,
-                        nombre_archivo="CertificadoHabilidad.pdf",
+            with ThreadPoolExecutor(
+                max_workers=descarga_ca.hilos_impresion(), thread_name_prefix="cert"
+            ) as pool_cert:
+                list(
+                    pool_cert.map(
+                        lambda prov: _descargar_certificados_proveedor(codigo, destino, prov, driver),
+                        proveedores_meta,
                     )
-                except Exception:
-                    pass
-
-                # Comprobante de oferta (voucherview.aspx) -> PDF
-                voucher_url = (prov.get("voucher_url") or "").strip()
-                if voucher_url:
-                    try:
-                        descarga_ca.descargar_pdf_a_archivo(
-                            voucher_url,
-                            os.path.join(carpeta_certificados, "ComprobanteOferta.pdf"),
-                            driver=driver,
-                            tag="[VOUCHER]",
-                        )
-                    except Exception:
-                        pass
+                )
 
         resultado["descargados"] = descargados
         resultado["ok"] = descargados > 0
@@ -767,13 +850,11 @@ def descargar_adjuntos_desde_url(url: str, driver: webdriver.Chrome, codigo: str
     except Exception as exc:
         resultado["errores"].append(f"Error descargando adjuntos: {exc}")
         return resultado
-    finally:
-        DOWNLOAD_DIR = previo_dir
 
 
 def _build_proveedores_resumen(destino: str, proveedores_meta: List[dict] | None = None) -> List[dict]:
     """
-    Construye una lista de proveedores basada en la estructura de carpetas creada por _save_stream_to_file:
+    Construye una lista de proveedores basada en la estructura de carpetas creada por la descarga:
       destino/{Proveedor}/{Tipo}/archivo
 
     Esto permite reutilizar el flujo de zips + Excel en producción aunque el scraping no entregue